@@ -20,6 +20,105 @@ import cassandra.auth as ca
 import cassandra as cs
 
 
+class SessionCache:
+    """
+    Sessions on ScyllaDB clusters by contact points, with
+    the credentials they were made with.
+
+    Evicted sessions' clusters are only shut down once
+    `grace_period` seconds have passed, as event threads
+    that got the session just before may still be using it.
+    """
+
+    def __init__(self, grace_period=300):
+        # contact points -> (username, password, cluster, session)
+        self.sessions = {}
+        # (monotonic time evicted, cluster) of each evicted cluster
+        self.retired = []
+        self.grace_period = grace_period
+        self.lock = threading.RLock()
+
+    def get(self, key, credentials):
+        """
+        Gets the session for `key` if it was made with
+        `credentials` and is still usable, evicting it
+        otherwise.
+        """
+        with self.lock:
+            cached = self.sessions.get(key)
+            if cached is None:
+                return None
+
+            username, password, cluster, session = cached
+            if (
+                (username, password) == credentials
+                and not session.is_shutdown
+                and any(host.is_up for host in cluster.metadata.all_hosts())
+            ):
+                return session
+
+            logging.info("Reconnecting to ScyllaDB cluster at %s.", str(key))
+            self.evict(key, session)
+            return None
+
+    def put(self, key, credentials, cluster, session):
+        """
+        Caches the session for `key`.
+        """
+        with self.lock:
+            self.sessions[key] = (*credentials, cluster, session)
+
+    def items(self) -> list:
+        """
+        Gets the cached (key, session) pairs.
+        """
+        with self.lock:
+            return [
+                (key, session)
+                for key, (_, _, _, session) in self.sessions.items()
+            ]
+
+    def evict(self, key, session):
+        """
+        Removes `session` from the cache if it's still
+        cached for `key`, so it's reconnected on next use,
+        retiring its cluster.
+        """
+        with self.lock:
+            cached = self.sessions.get(key)
+            if cached is not None and cached[3] is session:
+                del self.sessions[key]
+                self.retired.append((time.monotonic(), cached[2]))
+
+    def shutdown_retired(self):
+        """
+        Shuts down the clusters evicted more than
+        `grace_period` seconds ago.
+        """
+        cutoff = time.monotonic() - self.grace_period
+        with self.lock:
+            expired = [cluster for at, cluster in self.retired if at <= cutoff]
+            self.retired = [
+                (at, cluster) for at, cluster in self.retired if at > cutoff
+            ]
+
+        for cluster in expired:
+            cluster.shutdown()
+
+    def close(self):
+        """
+        Shuts down every cached and retired cluster.
+        """
+        with self.lock:
+            cached, self.sessions = self.sessions, {}
+            retired, self.retired = self.retired, []
+
+        for _, _, cluster, _ in cached.values():
+            cluster.shutdown()
+        for _, cluster in retired:
+            cluster.shutdown()
+
+
 class ScyllaDBCredsOperator:
     """
     ScyllaDB credentials operator for creating
@@ -43,6 +142,9 @@ class ScyllaDBCredsOperator:
         self.db_username = "cassandra"
         self.db_password = "cassandra"
 
+        # reused across events while the credentials are unchanged
+        self.sessions = SessionCache()
+
         threading.excepthook = self.exit_on_exception
 
     def exit_on_exception(self, args):
@@ -53,10 +155,27 @@ class ScyllaDBCredsOperator:
         threading.__excepthook__(args)
 
     def cluster_connect(self, contact_points):
+        """
+        Gets a session on the cluster with given contact
+        points, reusing the previous one unless the
+        credentials have changed or it has no hosts up.
+        """
+        key = tuple(contact_points)
+        credentials = (self.db_username, self.db_password)
+        with self.sessions.lock:
+            session = self.sessions.get(key, credentials)
+            if session is not None:
+                return session
+
+            cluster, session = self._connect(contact_points)
+            self.sessions.put(key, credentials, cluster, session)
+            return session
+
+    def _connect(self, contact_points):
         """
         Connects to a cluster with given
-        contact points, returing
-        a session.
+        contact points, returing the cluster
+        and a session.
         """
         cluster = cc.Cluster(
             contact_points=contact_points,
@@ -70,11 +189,40 @@ class ScyllaDBCredsOperator:
             protocol_version=4,
         )
 
+        session = cluster.connect()
+
         logging.info(
             "Connected to ScyllaDB cluster at %s.", str(contact_points)
         )
 
-        return cluster.connect()
+        return cluster, session
+
+    def check_sessions(self, interval=60):
+        """
+        Every `interval` seconds, queries each cached
+        session, evicting any that fail so they are
+        reconnected on next use, and shuts down the
+        clusters evicted long enough ago to be unused.
+        """
+        while True:
+            time.sleep(interval)
+
+            for key, session in self.sessions.items():
+                try:
+                    session.execute("SELECT release_version FROM system.local;")
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    logging.warning(
+                        "ScyllaDB cluster at %s unhealthy: %s", str(key), e
+                    )
+                    self.sessions.evict(key, session)
+
+            self.sessions.shutdown_retired()
+
+    def close(self):
+        """
+        Shuts down every cached cluster connection.
+        """
+        self.sessions.close()
 
     def setup_login(self):
         """
@@ -490,12 +638,21 @@ class ScyllaDBCredsOperator:
             daemon=True,
         )
 
+        health_thread = threading.Thread(
+            target=self.check_sessions,
+            daemon=True,
+        )
+
         user_thread.start()
         keyspace_thread.start()
         permission_thread.start()
+        health_thread.start()
 
-        while not self.failed:
-            time.sleep(3)
+        try:
+            while not self.failed:
+                time.sleep(3)
+        finally:
+            self.close()
 
         sys.exit(1)
 
@@ -32,6 +32,10 @@ class ValkeyCredsOperator:
 
         self.failed = False
 
+        # (namespace, cluster name) -> (superuser password, client),
+        # reused across events while the password is unchanged
+        self.clients = {}
+
         threading.excepthook = self.exit_on_exception
 
     def exit_on_exception(self, args):
@@ -56,6 +60,29 @@ class ValkeyCredsOperator:
                 "Failed to read superuser secret %s: %s", cluster_name, e)
             raise e
 
+    def _get_client(self, namespace, data, su_password):
+        """
+        Gets a superuser client for the cluster, reusing
+        the previous one unless the password has changed.
+        """
+        cluster_name = data["valkeyClusterReference"]
+        cached = self.clients.get((namespace, cluster_name))
+        if cached is not None:
+            password, r = cached
+            if password == su_password:
+                return r
+            r.close()
+
+        r = valkey.Valkey(
+            host=f"{cluster_name}.{namespace}.svc.cluster.local",
+            port=6379,
+            username="default",
+            password=su_password,
+            health_check_interval=30,
+        )
+        self.clients[(namespace, cluster_name)] = (su_password, r)
+        return r
+
     def _create_or_update_user_secret(self, namespace, name, data, password):
         """
         Creates or updates a secret with the user's credentials.
@@ -125,13 +152,7 @@ class ValkeyCredsOperator:
                 raise e
 
         # configure user
-        cluster_name = data["valkeyClusterReference"]
-        r = valkey.Valkey(
-            host=f"{cluster_name}.{namespace}.svc.cluster.local",
-            port=6379,
-            username="default",
-            password=su_password,
-        )
+        r = self._get_client(namespace, data, su_password)
 
         # check if the user exists
         try:
@@ -182,7 +203,6 @@ class ValkeyCredsOperator:
                 raise e
 
         logging.info("User %s configured successfully.", name)
-        r.close()
 
     def delete_user(self, namespace, name, data):
         """
@@ -196,13 +216,7 @@ class ValkeyCredsOperator:
         # retrieve superuser password
         su_password = self._get_su_password(namespace, data)
 
-        cluster_name = data["valkeyClusterReference"]
-        r = valkey.Valkey(
-            host=f"{cluster_name}.{namespace}.svc.cluster.local",
-            port=6379,
-            username="default",
-            password=su_password,
-        )
+        r = self._get_client(namespace, data, su_password)
 
         # delete user
         try:
@@ -221,8 +235,6 @@ class ValkeyCredsOperator:
             if e.status != 404:
                 raise e
 
-        r.close()
-
     def process_users(self):
         """
         Processes user event stream for create/update/delete events.
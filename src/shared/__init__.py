@@ -4,22 +4,59 @@ Used to abstract away boilerplate.
 
 Provides:
     setup_rabbitmq -- setup a RabbitMQ channel with given args.
+    RabbitMQPool -- a pool of RabbitMQ connections handing out channels.
+    get_rabbitmq_pool -- get the process-wide pool for given args.
+    connection_lock -- get the lock shared by users of a connection.
+    ConnectionPump -- let one thread process a connection's events for all.
+    connection_pump -- get the pump shared by users of a connection.
+    setup_rabbitmq_async -- setup an asyncio RabbitMQ channel with given args.
     setup_scylla -- setup a ScyllaDB session with given args.
+    scylla_profiles -- the named execution profiles for setup_scylla.
+    setup_valkey -- get a Valkey client on a process-wide connection pool.
+    valkey_pipeline -- run many Valkey commands in one round-trip.
 """
 
+import logging
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+
 import cassandra.cqlengine.connection as cec
 import cassandra.query as cq
 import cassandra.cluster as cc
 import cassandra.auth as ca
 import cassandra as cs
+import aio_pika
 import pika
+import valkey
+
+
+RABBITMQ_HOST = "rabbitmq.rabbitmq.svc.cluster.local"
+
+# connection -> lock held while using it, shared by all its users
+_connection_locks = weakref.WeakKeyDictionary()
+
+# connection -> pump processing its data events, shared by all its users
+_connection_pumps = weakref.WeakKeyDictionary()
+_connection_locks_lock = threading.Lock()
+
+# (user, password, host) -> process-wide pool, so rotated
+# credentials get a new pool
+_rabbitmq_pools: dict[tuple[str, str, str], "RabbitMQPool"] = {}
+_rabbitmq_pools_lock = threading.Lock()
+
+# (user, password, host, port, db, client cache) -> process-wide pool
+_valkey_pools: dict[tuple, valkey.ConnectionPool] = {}
+_valkey_pools_lock = threading.Lock()
 
 
 def setup_rabbitmq(
     user: str,
     password: str,
     *,
-    host="rabbitmq.rabbitmq.svc.cluster.local"
+    host=RABBITMQ_HOST,
+    pooled=False,
 ) -> tuple[pika.BlockingConnection, pika.channel.Channel]:
     """
     Sets up a connection to RabbitMQ, returning
@@ -29,11 +66,17 @@ def setup_rabbitmq(
         user: str -- username for RabbitMQ connection.
         password: str -- password for RabbitMQ connection.
         host: str -- host of RabbitMQ service (default "rabbitmq")
+        pooled: bool -- open the channel on a connection from the
+                        process-wide pool for the credentials and host,
+                        rather than a new connection (default False).
 
     Returns:
         pika.channel.Channel -- the channel created from the connection
                                 with the host
     """
+    if pooled:
+        return get_rabbitmq_pool(user, password, host=host).channel()
+
     credentials = pika.PlainCredentials(
         user,
         password,
@@ -49,22 +92,440 @@ def setup_rabbitmq(
     return (connection, connection.channel())
 
 
-def setup_scylla(
+def connection_lock(connection) -> threading.RLock:
+    """
+    Gets the lock that must be held while publishing
+    on, or processing data events of, a connection.
+    pika connections aren't thread safe, so every user
+    of a shared connection must hold the same lock.
+
+    Args:
+        connection: pika.BlockingConnection -- the connection.
+
+    Returns:
+        threading.RLock -- the connection's lock.
+    """
+    with _connection_locks_lock:
+        lock = _connection_locks.get(connection)
+        if lock is None:
+            lock = _connection_locks[connection] = threading.RLock()
+        return lock
+
+
+class ConnectionPump:
+    """
+    Lets one thread at a time process a connection's data
+    events on behalf of every thread waiting on it, so the
+    others wait for their results without holding (or
+    waiting for) the `connection_lock`, which the pumping
+    thread holds while processing events.
+
+    Threads publishing while another is pumping hand the
+    publish to the pumping thread with `call`, rather than
+    waiting for it to release the lock.
+    """
+
+    def __init__(self, lock: threading.RLock):
+        """
+        Args:
+            lock: threading.RLock -- the connection's lock.
+        """
+        self.lock = lock
+        # the thread pumping, if any
+        self.pumper: threading.Thread | None = None
+        self._cond = threading.Condition()
+
+    def run_until(self, done, pump, timeout=None) -> bool:
+        """
+        Calls `pump` (which should process the connection's
+        data events for a bounded time, holding its lock) until
+        `done()` if no other thread is pumping, otherwise waits
+        for `done()` while another thread pumps, taking over
+        pumping if it stops first.
+
+        Args:
+            done: Callable[[], bool] -- whether the wait is over.
+            pump: Callable[[], None] -- processes data events once.
+            timeout: float | None -- the most seconds to wait,
+                                     None to wait until done
+                                     (default None).
+
+        Returns:
+            bool -- whether `done()`, False if timed out.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def remaining():
+            return None if deadline is None else deadline - time.monotonic()
+
+        while True:
+            with self._cond:
+                while not done() and self.pumper is not None:
+                    left = remaining()
+                    if left is not None and left <= 0:
+                        return False
+                    self._cond.wait(left)
+
+                if done():
+                    return True
+                self.pumper = threading.current_thread()
+
+            try:
+                while not done():
+                    left = remaining()
+                    if left is not None and left <= 0:
+                        return False
+
+                    pump()
+
+                    # wake waiters whose results may have arrived
+                    with self._cond:
+                        self._cond.notify_all()
+                return True
+            finally:
+                with self._cond:
+                    self.pumper = None
+                    self._cond.notify_all()
+
+    def call(self, connection, callback, pump):
+        """
+        Calls `callback` holding the connection's lock, on
+        the pumping thread if another thread is pumping,
+        returning its result or raising its error.
+
+        Args:
+            connection: pika.BlockingConnection -- the connection.
+            callback: Callable -- the function to call, e.g. a publish.
+            pump: Callable[[], None] -- processes data events once,
+                                        as for `run_until`.
+        """
+        if self.pumper in (None, threading.current_thread()):
+            with self.lock:
+                return callback()
+
+        result = Future()
+
+        def run():
+            try:
+                result.set_result(callback())
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                result.set_exception(e)
+
+        # also wakes the pumping thread from its data events, and
+        # is run by this thread if the other has stopped pumping
+        connection.add_callback_threadsafe(run)
+        self.run_until(result.done, pump)
+        return result.result()
+
+
+def connection_pump(connection) -> ConnectionPump:
+    """
+    Gets the pump processing a connection's data events,
+    shared by every user of the connection.
+
+    Args:
+        connection: pika.BlockingConnection -- the connection.
+
+    Returns:
+        ConnectionPump -- the connection's pump.
+    """
+    lock = connection_lock(connection)
+    with _connection_locks_lock:
+        pump = _connection_pumps.get(connection)
+        if pump is None:
+            pump = _connection_pumps[connection] = ConnectionPump(lock)
+        return pump
+
+
+class RabbitMQPool:
+    """
+    Pool of up to `max_connections` RabbitMQ connections,
+    handing out channels on them round-robin.
+
+    Closed connections are reopened when a channel is next
+    handed out, so users of a channel on a closed connection
+    should get a new one (as `shared.rpcs` clients do). As
+    pika only services heartbeats while data events are
+    processed, `check` should be called at least every
+    `heartbeat` seconds on connections that may go idle,
+    e.g. with `start_health_checks`.
+
+    Connections are shared, so users must hold the
+    `connection_lock` of their connection while using it,
+    and shouldn't block consuming on it (i.e. RPC servers
+    should keep their own connection).
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        user: str,
+        password: str,
+        *,
+        host=RABBITMQ_HOST,
+        max_connections=2,
+        heartbeat=60,
+    ):
+        """
+        Args:
+            user: str -- username for RabbitMQ connections.
+            password: str -- password for RabbitMQ connections.
+            host: str -- host of RabbitMQ service (default "rabbitmq")
+            max_connections: int -- the most connections to open
+                                    (default 2).
+            heartbeat: int -- the heartbeat timeout in seconds to
+                              negotiate with the broker (default 60).
+        """
+        self.parameters = pika.ConnectionParameters(
+            host,
+            credentials=pika.PlainCredentials(user, password),
+            heartbeat=heartbeat,
+        )
+        self.max_connections = max_connections
+
+        self.connections: list[pika.BlockingConnection | None] = []
+        self._next = 0
+        self._lock = threading.Lock()
+        self._health_checks = None
+
+    def channel(self) -> tuple[pika.BlockingConnection, pika.channel.Channel]:
+        """
+        Opens a channel on the next connection in the pool,
+        opening or reopening the connection if needed.
+
+        Returns:
+            tuple[pika.BlockingConnection, pika.channel.Channel] --
+                the connection and the channel opened on it.
+        """
+        with self._lock:
+            if len(self.connections) < self.max_connections:
+                self.connections.append(None)
+                index = len(self.connections) - 1
+            else:
+                index = self._next
+                self._next = (self._next + 1) % self.max_connections
+
+            connection = self.connections[index]
+            if connection is None or not connection.is_open:
+                connection = self.connections[index] = (
+                    pika.BlockingConnection(self.parameters)
+                )
+
+        with connection_lock(connection):
+            return (connection, connection.channel())
+
+    def check(self):
+        """
+        Services heartbeats and pending events on every
+        connection, dropping any that are dead so they're
+        reopened when a channel is next handed out.
+        """
+        with self._lock:
+            connections = list(enumerate(self.connections))
+
+        for index, connection in connections:
+            if connection is None:
+                continue
+
+            try:
+                with connection_lock(connection):
+                    connection.process_data_events(time_limit=0)
+            except pika.exceptions.AMQPError as e:
+                logging.warning("RabbitMQ connection %d unhealthy: %s",
+                                index, e)
+
+            if not connection.is_open:
+                with self._lock:
+                    if self.connections[index] is connection:
+                        self.connections[index] = None
+
+    def start_health_checks(self, interval=None):
+        """
+        Starts a daemon thread calling `check` every
+        `interval` seconds (default half the heartbeat).
+        """
+        if self._health_checks is not None:
+            return
+
+        if interval is None:
+            interval = max(1, (self.parameters.heartbeat or 60) / 2)
+
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                self.check()
+
+        self._health_checks = stop
+        threading.Thread(target=run, daemon=True).start()
+
+    def close(self):
+        """
+        Stops health checks and closes every connection.
+        """
+        if self._health_checks is not None:
+            self._health_checks.set()
+            self._health_checks = None
+
+        with self._lock:
+            connections, self.connections = self.connections, []
+
+        for connection in connections:
+            if connection is not None and connection.is_open:
+                with connection_lock(connection):
+                    connection.close()
+
+
+def get_rabbitmq_pool(
+    user: str,
+    password: str,
+    *,
+    host=RABBITMQ_HOST,
+    **kwargs,
+) -> RabbitMQPool:
+    """
+    Gets the process-wide pool for a user, password and
+    host, creating it (and starting its health checks)
+    with any extra `kwargs` for `RabbitMQPool` if needed.
+
+    Args:
+        user: str -- username for RabbitMQ connections.
+        password: str -- password for RabbitMQ connections.
+        host: str -- host of RabbitMQ service (default "rabbitmq")
+
+    Returns:
+        RabbitMQPool -- the pool.
+    """
+    with _rabbitmq_pools_lock:
+        key = (user, password, host)
+        pool = _rabbitmq_pools.get(key)
+        if pool is None:
+            pool = _rabbitmq_pools[key] = RabbitMQPool(
+                user,
+                password,
+                host=host,
+                **kwargs,
+            )
+            pool.start_health_checks()
+
+        return pool
+
+
+async def setup_rabbitmq_async(
+    user: str,
+    password: str,
+    *,
+    host=RABBITMQ_HOST,
+) -> tuple[aio_pika.abc.AbstractRobustConnection, aio_pika.abc.AbstractChannel]:
+    """
+    Sets up an asyncio connection to RabbitMQ,
+    returning a channel. The connection reconnects
+    automatically if it is dropped.
+
+    Args:
+        user: str -- username for RabbitMQ connection.
+        password: str -- password for RabbitMQ connection.
+        host: str -- host of RabbitMQ service (default "rabbitmq")
+
+    Returns:
+        aio_pika.abc.AbstractChannel -- the channel created from the
+                                        connection with the host
+    """
+    connection = await aio_pika.connect_robust(
+        host=host,
+        login=user,
+        password=password,
+    )
+
+    return (connection, await connection.channel())
+
+
+LOW_LATENCY_READS = "low-latency-reads"
+BULK_WRITES = "bulk-writes"
+
+
+def _load_balancing_policy():
+    return cs.policies.TokenAwarePolicy(
+        cs.policies.DCAwareRoundRobinPolicy(),
+    )
+
+
+def scylla_profiles(
+    *,
+    row_factory=cq.dict_factory,
+    request_timeout=10.0,
+) -> dict[str, cc.ExecutionProfile]:
+    """
+    Creates the named execution profiles for `setup_scylla`,
+    picked per query with e.g.
+    `session.execute(query, execution_profile=LOW_LATENCY_READS)`:
+        LOW_LATENCY_READS -- short timeout, retrying speculatively on
+                             another replica if the first is slow
+                             (only for statements marked idempotent).
+        BULK_WRITES -- long timeout for large batches and bulk writes.
+
+    Args:
+        row_factory: Callable -- row factory of the profiles, e.g.
+                                 cassandra.query.named_tuple_factory
+                                 to avoid building a dict per row
+                                 (default cassandra.query.dict_factory).
+        request_timeout: float -- timeout of the default profile,
+                                  the others are relative to it
+                                  (default 10.0).
+
+    Returns:
+        dict[str, cassandra.cluster.ExecutionProfile] -- the profiles
+                                                          by name.
+    """
+    return {
+        LOW_LATENCY_READS: cc.ExecutionProfile(
+            load_balancing_policy=_load_balancing_policy(),
+            speculative_execution_policy=(
+                cs.policies.ConstantSpeculativeExecutionPolicy(
+                    delay=0.05,
+                    max_attempts=2,
+                )
+            ),
+            request_timeout=request_timeout / 5,
+            row_factory=row_factory,
+        ),
+        BULK_WRITES: cc.ExecutionProfile(
+            load_balancing_policy=_load_balancing_policy(),
+            request_timeout=request_timeout * 6,
+            row_factory=row_factory,
+        ),
+    }
+
+
+def setup_scylla(  # pylint: disable=too-many-arguments
     keyspace: str,
     *,
     contact_points=None,
     user="cassandra",
     password="cassandra",
+    profiles: dict[str, cc.ExecutionProfile] | None = None,
+    request_timeout=10.0,
+    protocol_version=4,
+    compression=True,
 ) -> cc.Session:
     """
     Creates a cassandra.cluster.Session with
     given information, setting it's keyspace.
 
+    The default execution profile always uses dict rows,
+    as cqlengine requires them.
+
     Args:
         keyspace: str -- the keyspace to set the session to use.
         contact_points: list[str] -- hostnames of Scylla clients to connect to.
         user: str -- username to use when connecting to database.
         password: str -- password to use when connecting to database.
+        profiles: dict[str, ExecutionProfile] -- named execution profiles
+                                                 (default scylla_profiles()).
+        request_timeout: float -- timeout in seconds of queries using
+                                  the default profile (default 10.0).
+        protocol_version: int -- native protocol version (default 4).
+        compression: bool | str -- compress traffic, as for
+                                   cassandra.cluster.Cluster (default True).
 
     Returns:
         cassandra.cluster.Session -- the session created from the
@@ -73,23 +534,122 @@ def setup_scylla(
     if contact_points is None:
         contact_points = ["dev-db-client.scylla.svc"]
 
+    if profiles is None:
+        profiles = scylla_profiles(request_timeout=request_timeout)
+
     cluster = cc.Cluster(
         contact_points=contact_points,
         auth_provider=ca.PlainTextAuthProvider(
             username=user,
             password=password,
         ),
-        load_balancing_policy=cs.policies.TokenAwarePolicy(
-            cs.policies.DCAwareRoundRobinPolicy(),
-        ),
-        protocol_version=4,
+        execution_profiles={
+            **profiles,
+            cc.EXEC_PROFILE_DEFAULT: cc.ExecutionProfile(
+                load_balancing_policy=_load_balancing_policy(),
+                request_timeout=request_timeout,
+                row_factory=cq.dict_factory,
+            ),
+        },
+        protocol_version=protocol_version,
+        compression=compression,
     )
 
     session = cluster.connect()
     session.set_keyspace(keyspace)
-    session.row_factory = cq.dict_factory
 
     # set cqlengine session
     cec.set_session(session)
 
     return session
+
+
+def setup_valkey(  # pylint: disable=too-many-arguments
+    user: str,
+    password: str,
+    *,
+    host="valkey-example",
+    port=6379,
+    db=0,
+    max_connections=32,
+    health_check_interval=30,
+    client_cache=False,
+) -> valkey.Valkey:
+    """
+    Creates a Valkey client on the process-wide connection
+    pool for the user, password, host, port and database,
+    creating the pool with the given options if needed.
+    Clients are cheap, so can be created wherever they're
+    needed.
+
+    Args:
+        user: str -- username for Valkey connections.
+        password: str -- password for Valkey connections.
+        host: str -- host of the Valkey service (default "valkey-example").
+        port: int -- port of the Valkey service (default 6379).
+        db: int -- the database to use (default 0).
+        max_connections: int -- the most connections in the pool,
+                                more raise a ConnectionError (default 32).
+        health_check_interval: int -- seconds a connection may be idle
+                                      before it's checked when next
+                                      used (default 30).
+        client_cache: bool -- use RESP3 client-side caching, so repeated
+                              reads of unchanged keys are answered
+                              locally (default False).
+
+    Returns:
+        valkey.Valkey -- the client.
+    """
+    key = (user, password, host, port, db, client_cache)
+
+    with _valkey_pools_lock:
+        pool = _valkey_pools.get(key)
+        if pool is None:
+            options = {}
+            if client_cache:
+                options = {"protocol": 3, "cache_enabled": True}
+
+            pool = _valkey_pools[key] = valkey.ConnectionPool(
+                host=host,
+                port=port,
+                db=db,
+                username=user,
+                password=password,
+                max_connections=max_connections,
+                health_check_interval=health_check_interval,
+                socket_keepalive=True,
+                retry_on_timeout=True,
+                **options,
+            )
+
+    return valkey.Valkey(connection_pool=pool)
+
+
+def valkey_pipeline(
+    client: valkey.Valkey,
+    commands,
+    *,
+    transaction=False,
+) -> list:
+    """
+    Runs many Valkey commands in one round-trip.
+
+    For example:
+        user, count = valkey_pipeline(r, [
+            ("get", "user:1"),
+            ("incr", "count"),
+        ])
+
+    Args:
+        client: valkey.Valkey -- the client to run the commands with.
+        commands: Iterable[tuple] -- the name and arguments of each command.
+        transaction: bool -- run the commands atomically (default False).
+
+    Returns:
+        list -- the result of each command, in order.
+    """
+    pipe = client.pipeline(transaction=transaction)
+    for name, *args in commands:
+        getattr(pipe, name)(*args)
+
+    return pipe.execute()
@@ -0,0 +1,312 @@
+"""
+Valkey read-through and write-through cache of
+cqlengine models, by primary key.
+
+Provides:
+    ModelCache -- a cache of one model's rows.
+"""
+
+import base64
+import datetime
+import decimal
+import json
+import logging
+import operator
+import uuid
+
+from cassandra.cqlengine import columns
+from cassandra.cqlengine.models import Model
+import valkey
+
+
+class ModelCache:
+    """
+    Caches rows of a cqlengine model in Valkey, keyed by
+    their primary key, for `ttl` seconds. Rows are read
+    from Scylla on a miss, and rows that don't exist are
+    cached as missing for `negative_ttl` seconds.
+
+    Writes through the cache update or invalidate the
+    cached row, writes made directly to the model are
+    only seen once the cached row expires.
+
+    If Valkey is unavailable, reads and writes go straight
+    to Scylla.
+
+    For example:
+        pings = ModelCache(valkey_client, models.Pings, ttl=300)
+
+        ping = pings.create(message="Ping!")
+        ping = pings.get(id=ping.id)
+        found = pings.get_many([{"id": ping.id}, {"id": uuid.uuid4()}])
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        client: valkey.Valkey,
+        model: type[Model],
+        *,
+        ttl=60,
+        negative_ttl=5,
+        prefix=None,
+    ):
+        """
+        Args:
+            client: valkey.Valkey -- the client to cache through.
+            model: type[Model] -- the model to cache.
+            ttl: int -- seconds a row is cached for (default 60).
+            negative_ttl: int -- seconds a missing row is cached as
+                                 missing for, 0 to not cache missing
+                                 rows (default 5).
+            prefix: str | None -- prefix of every key (default the
+                                  model's table name).
+        """
+        self.client = client
+        self.model = model
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.prefix = prefix or (
+            f"model-cache:{model.column_family_name(include_keyspace=False)}"
+        )
+
+        # pylint: disable-next=protected-access
+        self.primary_keys = list(model._primary_keys)
+
+    def key(self, **primary_key) -> str:
+        """
+        Gets the cache key of a row.
+
+        Args:
+            primary_key -- every primary key column of the row.
+
+        Returns:
+            str -- the row's cache key.
+
+        Raises:
+            KeyError -- if a primary key column is missing.
+        """
+        return self.prefix + ":" + json.dumps(
+            [_dump_value(primary_key[name]) for name in self.primary_keys]
+        )
+
+    def get(self, **primary_key) -> Model | None:
+        """
+        Gets a row by its primary key, from the cache if
+        it's cached, otherwise from Scylla, caching it.
+
+        Args:
+            primary_key -- every primary key column of the row.
+
+        Returns:
+            Model | None -- the row, None if it doesn't exist.
+        """
+        return self.get_many([primary_key])[0]
+
+    def get_many(self, primary_keys: list[dict]) -> list:
+        """
+        Gets many rows by their primary keys, getting every
+        cached row in one round-trip and reading the rest
+        from Scylla.
+
+        Args:
+            primary_keys: list[dict] -- the primary key of each row.
+
+        Returns:
+            list[Model | None] -- the rows, in the same order as the
+                                  keys, None for rows that don't exist.
+        """
+        if not primary_keys:
+            return []
+
+        keys = [self.key(**primary_key) for primary_key in primary_keys]
+
+        try:
+            cached = self.client.mget(keys)
+        except valkey.exceptions.ValkeyError as e:
+            logging.warning("Model cache unavailable: %s", e)
+            cached = [None] * len(keys)
+
+        rows = [None] * len(keys)
+        misses = []
+        for i, data in enumerate(cached):
+            if data is None:
+                misses.append(i)
+            elif data not in (b"null", "null"):
+                rows[i] = self._load(data)
+
+        if not misses:
+            return rows
+
+        for i in misses:
+            rows[i] = self.model.objects.filter(**primary_keys[i]).first()
+
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for i in misses:
+                if rows[i] is not None:
+                    pipe.set(keys[i], self._dump(rows[i]), ex=self.ttl)
+                elif self.negative_ttl:
+                    pipe.set(keys[i], "null", ex=self.negative_ttl)
+            pipe.execute()
+        except valkey.exceptions.ValkeyError as e:
+            logging.warning("Model cache unavailable: %s", e)
+
+        return rows
+
+    def create(self, **values) -> Model:
+        """
+        Creates a row, caching it.
+
+        Args:
+            values -- the column values of the row.
+
+        Returns:
+            Model -- the created row.
+        """
+        row = self.model.create(**values)
+        self._store(row)
+        return row
+
+    def save(self, row: Model) -> Model:
+        """
+        Saves a changed row, caching it.
+
+        Args:
+            row: Model -- the row to save.
+
+        Returns:
+            Model -- the saved row.
+        """
+        row.save()
+        self._store(row)
+        return row
+
+    def delete(self, row: Model):
+        """
+        Deletes a row, removing it from the cache.
+
+        Args:
+            row: Model -- the row to delete.
+        """
+        row.delete()
+        self.invalidate(**self._primary_key(row))
+
+    def invalidate(self, **primary_key):
+        """
+        Removes a row from the cache, so it is next
+        read from Scylla.
+
+        Args:
+            primary_key -- every primary key column of the row.
+        """
+        try:
+            self.client.delete(self.key(**primary_key))
+        except valkey.exceptions.ValkeyError as e:
+            logging.warning("Model cache unavailable: %s", e)
+
+    def _store(self, row):
+        """
+        Caches a row.
+        """
+        try:
+            self.client.set(
+                self.key(**self._primary_key(row)),
+                self._dump(row),
+                ex=self.ttl,
+            )
+        except valkey.exceptions.ValkeyError as e:
+            logging.warning("Model cache unavailable: %s", e)
+
+    def _primary_key(self, row) -> dict:
+        """
+        Gets the primary key of a row.
+        """
+        return {name: getattr(row, name) for name in self.primary_keys}
+
+    def _dump(self, row) -> str:
+        """
+        Encodes a row as JSON.
+        """
+        return json.dumps(
+            {
+                name: _dump_value(getattr(row, name))
+                for name in row.keys()
+            },
+            default=str,
+        )
+
+    def _load(self, data) -> Model:
+        """
+        Decodes a row encoded by `_dump`.
+        """
+        values = json.loads(data)
+
+        # pylint: disable-next=protected-access
+        model_columns = self.model._columns
+        return self.model._construct_instance(  # pylint: disable=protected-access
+            {
+                model_columns[name].db_field_name: _load_value(
+                    model_columns[name],
+                    value,
+                )
+                for name, value in values.items()
+                if name in model_columns
+            }
+        )
+
+
+def _dump_value(value):
+    """
+    Converts a column value to a JSON value.
+    """
+    dump = _converter(_DUMPERS, type(value))
+    return value if dump is None else dump(value)
+
+
+def _load_value(column, value):
+    """
+    Converts a JSON value back to a column value.
+    """
+    if value is None:
+        return None
+
+    load = _converter(_LOADERS, type(column))
+    return column.to_python(value) if load is None else load(value)
+
+
+def _converter(converters, cls):
+    """
+    Gets the converter of a class, or of its nearest
+    base class with one, None if it has none.
+    """
+    return next(
+        (converters[base] for base in cls.__mro__ if base in converters),
+        None,
+    )
+
+
+# value type -> converter to a JSON value, also used for subclasses
+# (e.g. datetime.date for datetime.datetime)
+_DUMPERS = {
+    uuid.UUID: str,
+    decimal.Decimal: str,
+    datetime.date: operator.methodcaller("isoformat"),
+    datetime.time: operator.methodcaller("isoformat"),
+    bytes: lambda value: base64.b64encode(value).decode(),
+    set: lambda value: [_dump_value(item) for item in value],
+    frozenset: lambda value: [_dump_value(item) for item in value],
+    tuple: lambda value: [_dump_value(item) for item in value],
+    list: lambda value: [_dump_value(item) for item in value],
+    dict: lambda value: {str(k): _dump_value(v) for k, v in value.items()},
+}
+
+# column type -> converter from a JSON value, also used for subclasses
+# (e.g. columns.UUID for columns.TimeUUID), others use `to_python`
+_LOADERS = {
+    columns.UUID: uuid.UUID,
+    columns.DateTime: datetime.datetime.fromisoformat,
+    columns.Date: datetime.date.fromisoformat,
+    columns.Time: datetime.time.fromisoformat,
+    columns.Decimal: decimal.Decimal,
+    columns.Blob: base64.b64decode,
+}
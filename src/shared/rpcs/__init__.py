@@ -12,9 +12,61 @@ RPC naming convention:
                             by an RPC server.
     - {rpc_prefix}-call-exc - name of the exchange to send a call to, declared
                               by k8s yaml in {sub-system}/queues.
+    - {rpc_prefix}-stream-q-{UUID} - name of the queue a streaming RPC server
+                                     is granted credit on, declared by the
+                                     RPC server.
 
 rpc_prefix should be consistent across an RPC server and client.
 
+Clients may instead use RabbitMQ's direct reply-to, consuming from the
+amq.rabbitmq.reply-to pseudo-queue rather than declaring a response queue,
+in which case servers respond through the default exchange, so need
+permission to write to amq.default.
+
+Messages are encoded with the codec given by their AMQP content type,
+see `shared.rpcs.codec`, defaulting to JSON.
+
+Bodies over a size threshold may be compressed by a client or server
+that opts in, given by their AMQP content encoding, see
+`shared.rpcs.compression`.
+
+Servers given a response cache, see `shared.rpcs.cache`, answer
+repeated requests from it without calling `process`.
+
+Calls may have a deadline, sent as the AMQP expiration (so the broker
+drops them if they wait in the queue too long) and as the Unix time
+in the "x-deadline" header. Servers drop calls past their deadline
+without processing or responding to them.
+
+Streaming calls are sent with the AMQP message type "stream" and an
+"x-credit" header giving how many chunks the server may send before
+waiting. The server responds with "stream-chunk" messages numbered by
+their "x-seq" header, then a "stream-end" message, with the server's
+stream queue as their reply-to. The client grants more credit as it
+consumes chunks with "stream-credit" messages sent to that queue through
+the default exchange, so they reach the replica sending the stream (or
+to the call queue, before the first chunk), and cancels a stream by
+granting zero credit. Servers end streams left idle by their client
+with an error chunk, and clients time out waiting too long for a chunk.
+
+Calls carry the Unix time they were published in the "x-published"
+header, so servers can measure how long they waited in the queue.
+Clients and servers record metrics of their calls, see
+`shared.rpcs.metrics`.
+
+Calls carry their trace context in the "traceparent" header, and
+clients and servers record spans of their calls, see
+`shared.rpcs.tracing`.
+
+Batch calls are sent with the AMQP message type "batch", with a body
+formed by `batch` from a list of requests, and are responded to with
+an index-aligned list of responses formed the same way. Batches are
+always JSON.
+
+Clients and servers connect to RabbitMQ by default, or through
+another transport such as an in-process broker, see
+`shared.rpcs.transport`.
+
 Client definitions should go in the same directory as this file,
 as they may be used by multiple different services.
 
@@ -23,280 +75,26 @@ one service should run an RPC (though k8s replicas of the same service
 are fine).
 """
 
-import logging
-import uuid
-import json
-from abc import ABC, abstractmethod
-
-import pika
-
-import shared
-
-
-class RPCClient(ABC):
-    """
-    Abstract base class for an RPC client.
-    Connects to RabbitMQ, declares a queue to listen
-    back on, and creates a consumer for it.
-
-    A sub-class must implement the abstract method
-    `call` which specifies what the body of the
-    calling message should be.
-    """
-
-    def __init__(self, rabbitmq_user, rabbitmq_pass, rpc_prefix):
-        """
-        Connects to RabbitMQ with provided credentials,
-        creates a new queue using the `rpc_prefix` and
-        the RPC queue and exchange convention defined in
-        the module docstring.
-        """
-        self.rpc_prefix = rpc_prefix
-        self.connection, self.channel = shared.setup_rabbitmq(
-            rabbitmq_user,
-            rabbitmq_pass,
-        )
-
-        result = self.channel.queue_declare(
-            queue=f"{rpc_prefix}-resp-q-{uuid.uuid4()}", exclusive=True
-        )
-        self.channel.queue_bind(result.method.queue, f"{rpc_prefix}-resp-exc")
-        self.callback_queue = result.method.queue
-
-        self.channel.basic_consume(
-            queue=self.callback_queue,
-            on_message_callback=self.on_response,
-            auto_ack=True,
-        )
-
-        self.response = None
-        self.corr_id = None
-
-    def on_response(self, _ch, _method, props, body):
-        """
-        Checks if the correlation ID is correct, if it is,
-        then populate self.response with the body of the
-        message which `_call` waits and blocks on.
-        """
-        if self.corr_id == props.correlation_id:
-            self.response = body
-
-    def _call(self, body):
-        """
-        Generic implementation of an RPC call, should be
-        called by the sub-class' `call` method with the
-        correct body for a call.
-        """
-        self.response = None
-        self.corr_id = str(uuid.uuid4())
-        self.channel.basic_publish(
-            exchange=f"{self.rpc_prefix}-call-exc",
-            routing_key=f"{self.rpc_prefix}-call-q",
-            properties=pika.BasicProperties(
-                reply_to=self.callback_queue,
-                correlation_id=self.corr_id,
-            ),
-            body=body,
-        )
-
-        logging.info("[to %s-call-q, id %s] %s",
-                     self.rpc_prefix, self.corr_id, body)
-
-        while self.response is None:
-            self.connection.process_data_events(time_limit=1)
-
-        return self.response
-
-    @abstractmethod
-    def call(self, *args, **kwargs):
-        """
-        Should be implemented in sub-classes which
-        should call `_call` with the correct body
-        for a call.
-        """
-        raise NotImplementedError
-
-
-class RPCServer(ABC):
-    """
-    Abstract base class for an RPC serer.
-    Connects to RabbitMQ and creates a consumer on
-    it's RPC call queue.
-
-    A sub-class must implement the abstract
-    method `process` which should process a request
-    and return the response.
-
-    To start an RPC server, you can do (for example):
-        rpc_server = PingRPCServer(
-            os.environ["RABBITMQ_USERNAME"],
-            os.environ["RABBITMQ_PASSWORD"],
-            "ping-rpc",
-        )
-
-        rpc_server.channel.start_consuming()
-    """
-
-    def __init__(self, rabbitmq_user, rabbitmq_pass, rpc_prefix):
-        """
-        Connects to RabbitMQ with provided credentialsa and
-        creates a consumer determined by `rpc_prefix` using
-        the convention described in the module docstring.
-        """
-        self.rpc_prefix = rpc_prefix
-        self.connection, self.channel = shared.setup_rabbitmq(
-            rabbitmq_user,
-            rabbitmq_pass,
-        )
-
-        self.channel.basic_consume(
-            queue=f"{rpc_prefix}-call-q",
-            on_message_callback=self.on_call,
-            auto_ack=True,
-        )
-
-    def on_call(self, ch, _method, props, body):
-        """
-        Generic implementation of an RPC call receiver,
-        called whenever a message is received in the
-        call queue.
-        """
-        try:
-            resp = self.process(body)
-        except Exception as e:  # pylint: disable=broad-exception-caught
-            print(e)
-            resp = response(
-                500,
-                {"reason": "Internal Server Error"}
-            )
-
-        ch.basic_publish(
-            exchange=f"{self.rpc_prefix}-resp-exc",
-            routing_key=props.reply_to,
-            properties=pika.BasicProperties(
-                correlation_id=props.correlation_id),
-            body=resp,
-        )
-        logging.info("[to %s, id %s] %s", props.reply_to,
-                     props.correlation_id, resp)
-
-    @abstractmethod
-    def process(self, body):
-        """
-        Should be implemented in sub-classes which
-        should take the body, process the request,
-        and then return the response.
-        """
-        raise NotImplementedError
-
-
-def response(status: int, data: dict) -> str:
-    """
-    Forms a JSON string response.
-
-    Args:
-        status: int - the status code.
-        data: dict - the JSON object for the
-                     data field of the response
-                     as a dict.
-
-    Returns:
-        str - formatted JSON response.
-    """
-    return json.dumps(
-        {
-            "status": status,
-            "data": data,
-        }
-    )
-
-
-def request(
-    auth_user: str,
-    version: str,
-    from_svc: str,
-    data: dict,
-) -> str:
-    """
-    Forms a JSON string request.
-
-    Args:
-        auth_user: str - the authenticated user making
-                         the request.
-        version: str - the API version number (e.g. 1.0.0).
-        from_svc: str - the name of the service the request
-                    is coming from.
-        data: dict - the JSON object for the data field of
-                     the request as a dict.
-
-    Returns:
-        str - formatted JSON request.
-    """
-    return json.dumps(
-        {
-            "authUser": auth_user,
-            "version": version,
-            "from": from_svc,
-            "data": data,
-        }
-    )
-
-
-def request_unauth(
-    sid: str,
-    version: str,
-    from_svc: str,
-    data: dict,
-) -> str:
-    """
-    Forms a JSON string request (unauthenticated).
-
-    Args:
-        sid: str - the session ID making the request.
-        version: str - the API version number (e.g. 1.0.0).
-        from_svc: str - the name of the service the request
-                    is coming from.
-        data: dict - the JSON object for the data field of
-                     the request as a dict.
-
-    Returns:
-        str - formatted JSON request.
-    """
-    return json.dumps(
-        {
-            "sid": sid,
-            "version": version,
-            "from": from_svc,
-            "data": data,
-        }
-    )
-
-
-def request_moderation(
-    auth_mod: str,
-    version: str,
-    from_svc: str,
-    data: dict,
-) -> str:
-    """
-    Forms a JSON string request (authenticated moderator).
-
-    Args:
-        auth_mod: str - the authenticated moderator making the request.
-        version: str - the API version number (e.g. 1.0.0).
-        from_svc: str - the name of the service the request
-                    is coming from.
-        data: dict - the JSON object for the data field of
-                     the request as a dict.
-
-    Returns:
-        str - formatted JSON request.
-    """
-    return json.dumps(
-        {
-            "authMod": auth_mod,
-            "version": version,
-            "from": from_svc,
-            "data": data,
-        }
-    )
+from shared.rpcs.aio import AsyncRPCClient, AsyncRPCServer
+from shared.rpcs.client import RPCClient
+from shared.rpcs.messages import (
+    BATCH,
+    DEADLINE_HEADER,
+    DIRECT_REPLY_TO,
+    PUBLISHED_HEADER,
+    batch,
+    request,
+    request_moderation,
+    request_unauth,
+    response,
+    unbatch,
+)
+from shared.rpcs.server import RPCServer
+from shared.rpcs.stream import (
+    CREDIT_HEADER,
+    SEQ_HEADER,
+    STREAM,
+    STREAM_CHUNK,
+    STREAM_CREDIT,
+    STREAM_END,
+)
@@ -0,0 +1,279 @@
+"""
+Base classes for asyncio RPC clients and servers, see
+the `shared.rpcs` module docstring.
+
+Provides:
+    AsyncRPCClient -- base class of asyncio RPC clients.
+    AsyncRPCServer -- base class of asyncio RPC servers.
+"""
+
+import asyncio
+import logging
+import uuid
+from abc import ABC, abstractmethod
+
+import aio_pika
+
+import shared
+from shared.rpcs.messages import _is_direct_reply, response
+
+
+class AsyncRPCClient(ABC):
+    """
+    Abstract base class for an asyncio RPC client.
+    Equivalent to `RPCClient`, but calls are coroutines
+    so many calls can be in flight on one event loop.
+
+    A sub-class must implement the abstract coroutine
+    `call` which specifies what the body of the
+    calling message should be.
+
+    To use an async RPC client, you can do (for example):
+        ping_rpc = await AsyncPingRPCClient(
+            os.environ["RABBITMQ_USERNAME"],
+            os.environ["RABBITMQ_PASSWORD"],
+            "ping-rpc",
+        ).connect()
+
+        responses = await asyncio.gather(
+            *(ping_rpc.call("example-service-2") for _ in range(100))
+        )
+    """
+
+    def __init__(self, rabbitmq_user, rabbitmq_pass, rpc_prefix):
+        """
+        Stores the credentials and `rpc_prefix`, `connect`
+        must be awaited before making any calls.
+        """
+        self.rpc_prefix = rpc_prefix
+        self._credentials = (rabbitmq_user, rabbitmq_pass)
+
+        self.connection = None
+        self.channel = None
+        self.call_exchange = None
+        self.callback_queue = None
+
+        # correlation ID -> future for every call awaiting a response
+        self.pending: dict[str, asyncio.Future] = {}
+
+    async def connect(self):
+        """
+        Connects to RabbitMQ with provided credentials,
+        creates a new queue using the `rpc_prefix` and
+        the RPC queue and exchange convention defined in
+        the module docstring.
+
+        Returns self, so it can be chained onto construction.
+        """
+        self.connection, self.channel = await shared.setup_rabbitmq_async(
+            *self._credentials,
+        )
+
+        self.call_exchange = await self.channel.get_exchange(
+            f"{self.rpc_prefix}-call-exc"
+        )
+        resp_exchange = await self.channel.get_exchange(
+            f"{self.rpc_prefix}-resp-exc"
+        )
+
+        self.callback_queue = await self.channel.declare_queue(
+            f"{self.rpc_prefix}-resp-q-{uuid.uuid4()}", exclusive=True
+        )
+        await self.callback_queue.bind(resp_exchange)
+        await self.callback_queue.consume(self.on_response, no_ack=True)
+
+        return self
+
+    async def close(self):
+        """
+        Closes the connection, cancelling any
+        calls still awaiting a response.
+        """
+        for future in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+
+        if self.connection is not None:
+            await self.connection.close()
+
+    async def on_response(self, message):
+        """
+        Resolves the future of the call with a matching
+        correlation ID with the body of the message.
+        """
+        future = self.pending.pop(message.correlation_id, None)
+        if future is None:
+            logging.warning("[from %s, id %s] no pending call",
+                            self.callback_queue.name, message.correlation_id)
+            return
+
+        if not future.done():
+            future.set_result(message.body)
+
+    async def _call(self, body):
+        """
+        Generic implementation of an RPC call, should be
+        awaited by the sub-class' `call` method with the
+        correct body for a call.
+        """
+        if isinstance(body, str):
+            body = body.encode()
+
+        corr_id = str(uuid.uuid4())
+        future = asyncio.get_running_loop().create_future()
+        self.pending[corr_id] = future
+
+        try:
+            await self.call_exchange.publish(
+                aio_pika.Message(
+                    body=body,
+                    correlation_id=corr_id,
+                    reply_to=self.callback_queue.name,
+                ),
+                routing_key=f"{self.rpc_prefix}-call-q",
+            )
+
+            logging.info("[to %s-call-q, id %s] %s",
+                         self.rpc_prefix, corr_id, body)
+
+            return await future
+        finally:
+            self.pending.pop(corr_id, None)
+
+    @abstractmethod
+    async def call(self, *args, **kwargs):
+        """
+        Should be implemented in sub-classes which
+        should await `_call` with the correct body
+        for a call.
+        """
+        raise NotImplementedError
+
+
+class AsyncRPCServer(ABC):
+    """
+    Abstract base class for an asyncio RPC server.
+    Equivalent to `RPCServer`, but each call is handled
+    in its own task so handlers waiting on I/O don't
+    block other calls.
+
+    A sub-class must implement the abstract
+    coroutine `process` which should process a request
+    and return the response.
+
+    To start an async RPC server, you can do (for example):
+        rpc_server = await AsyncPingRPCServer(
+            os.environ["RABBITMQ_USERNAME"],
+            os.environ["RABBITMQ_PASSWORD"],
+            "ping-rpc",
+        ).connect()
+
+        await rpc_server.serve()
+
+    At most `prefetch_count` unacknowledged calls are delivered
+    at once, bounding how many are handled concurrently. Calls
+    are only acknowledged once their response has been published,
+    so calls in progress when the server dies are redelivered.
+    """
+
+    prefetch_count = 64
+
+    def __init__(self, rabbitmq_user, rabbitmq_pass, rpc_prefix):
+        """
+        Stores the credentials and `rpc_prefix`, `connect`
+        must be awaited before any calls are consumed.
+        """
+        self.rpc_prefix = rpc_prefix
+        self._credentials = (rabbitmq_user, rabbitmq_pass)
+
+        self.connection = None
+        self.channel = None
+        self.resp_exchange = None
+
+        # keep references to running handlers so they aren't
+        # garbage collected mid-call
+        self._tasks: set[asyncio.Task] = set()
+
+    async def connect(self):
+        """
+        Connects to RabbitMQ with provided credentials and
+        creates a consumer determined by `rpc_prefix` using
+        the convention described in the module docstring.
+
+        Returns self, so it can be chained onto construction.
+        """
+        self.connection, self.channel = await shared.setup_rabbitmq_async(
+            *self._credentials,
+        )
+
+        self.resp_exchange = await self.channel.get_exchange(
+            f"{self.rpc_prefix}-resp-exc"
+        )
+        await self.channel.set_qos(prefetch_count=self.prefetch_count)
+        call_queue = await self.channel.get_queue(f"{self.rpc_prefix}-call-q")
+        await call_queue.consume(self._on_message)
+
+        return self
+
+    async def serve(self):
+        """
+        Serves calls until cancelled, then closes
+        the connection.
+        """
+        try:
+            await asyncio.Future()
+        finally:
+            await self.connection.close()
+
+    async def _on_message(self, message):
+        """
+        Spawns a task handling the message, so the
+        consumer can keep delivering further calls.
+        """
+        task = asyncio.create_task(self.on_call(message))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def on_call(self, message):
+        """
+        Generic implementation of an RPC call receiver,
+        called whenever a message is received in the
+        call queue. Acknowledges the call once its
+        response has been published.
+        """
+        try:
+            resp = await self.process(message.body)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            print(e)
+            resp = response(
+                500,
+                {"reason": "Internal Server Error"}
+            )
+
+        if isinstance(resp, str):
+            resp = resp.encode()
+
+        exchange = self.resp_exchange
+        if _is_direct_reply(message.reply_to):
+            exchange = self.channel.default_exchange
+
+        await exchange.publish(
+            aio_pika.Message(
+                body=resp,
+                correlation_id=message.correlation_id,
+            ),
+            routing_key=message.reply_to,
+        )
+        await message.ack()
+
+        logging.info("[to %s, id %s] %s", message.reply_to,
+                     message.correlation_id, resp)
+
+    @abstractmethod
+    async def process(self, body):
+        """
+        Should be implemented in sub-classes which
+        should take the body, process the request,
+        and then return the response.
+        """
+        raise NotImplementedError
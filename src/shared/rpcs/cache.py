@@ -0,0 +1,219 @@
+"""
+Response caches for idempotent RPCs.
+
+An `RPCServer` given a cache looks up each request's key
+before calling `process`, and stores the response of any
+request processed without raising.
+
+Provides:
+    ResponseCache -- base class of response caches.
+    MemoryCache -- an in-process LRU cache.
+    ValkeyCache -- a cache shared through Valkey.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import valkey
+
+
+class ResponseCache:
+    """
+    Caches RPC responses by key, counting hits and misses.
+
+    Sub-classes must implement `_get` and `_set`. `_get`
+    should return None if there is no live entry for a key.
+    """
+
+    def __init__(self, ttl=60):
+        """
+        Args:
+            ttl: float - default seconds an entry lives for (default 60).
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def __getstate__(self):
+        """
+        Drops the lock when pickled into a worker
+        process, counters start again from zero.
+        """
+        state = self.__dict__.copy()
+        state["hits"] = state["misses"] = 0
+        del state["_stats_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._stats_lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Gets the response cached for a key.
+
+        Args:
+            key: str - the request's cache key.
+
+        Returns:
+            str | bytes | None - the cached response, None on a miss.
+        """
+        resp = self._get(key)
+
+        with self._stats_lock:
+            if resp is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return resp
+
+    def set(self, key, resp, ttl=None):
+        """
+        Caches a response for a key.
+
+        Args:
+            key: str - the request's cache key.
+            resp: str | bytes - the response.
+            ttl: float | None - seconds the entry lives for,
+                                None for the cache's default.
+        """
+        self._set(key, resp, self.ttl if ttl is None else ttl)
+
+    def stats(self) -> dict:
+        """
+        Gets the hit and miss counts of this cache.
+
+        Returns:
+            dict - {"hits": int, "misses": int}.
+        """
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, resp, ttl):
+        raise NotImplementedError
+
+
+class MemoryCache(ResponseCache):
+    """
+    In-process cache, evicting the least recently
+    used entry once it holds `maxsize` entries.
+
+    Each worker process of a server using processes
+    has its own copy, empty when the worker starts and
+    kept for the worker's lifetime.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        """
+        Args:
+            maxsize: int - the most entries to hold (default 1024).
+            ttl: float - default seconds an entry lives for (default 60).
+        """
+        super().__init__(ttl)
+        self.maxsize = maxsize
+
+        # key -> (expiry time, response), least recently used first
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state["_entries"] = OrderedDict()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expiry, resp = entry
+            if expiry <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return resp
+
+    def _set(self, key, resp, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, resp)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+class ValkeyCache(ResponseCache):
+    """
+    Cache shared by every replica of a server through
+    Valkey. Entries expire with Valkey's own TTLs, and
+    size is bounded by the instance's `maxmemory` and
+    eviction policy (e.g. allkeys-lru).
+
+    Only needs GET and SET permissions for the user.
+    Hit and miss counts are per process, and each worker
+    process of a server using processes connects through
+    its own pool, made when the worker starts.
+    """
+
+    def __init__(self, client, *, prefix="rpc-cache", ttl=60):
+        """
+        Args:
+            client: valkey.Valkey - the client to cache through.
+            prefix: str - prefix of every key (default "rpc-cache").
+            ttl: float - default seconds an entry lives for (default 60).
+        """
+        super().__init__(ttl)
+        self.client = client
+        self.prefix = prefix
+
+    def __getstate__(self):
+        """
+        Replaces the client with its connection arguments
+        when pickled into a worker process, as its
+        connections can't be shared.
+        """
+        state = super().__getstate__()
+        pool = state.pop("client").connection_pool
+        state["_connection"] = (pool.connection_class, pool.connection_kwargs)
+        return state
+
+    def __setstate__(self, state):
+        connection_class, connection_kwargs = state.pop("_connection")
+        super().__setstate__(state)
+        self.client = valkey.Valkey(
+            connection_pool=valkey.ConnectionPool(
+                connection_class=connection_class,
+                **connection_kwargs,
+            )
+        )
+
+    def _get(self, key):
+        try:
+            return self.client.get(f"{self.prefix}:{key}")
+        except valkey.exceptions.ValkeyError as e:
+            # an unavailable cache shouldn't fail the call
+            print(e)
+            return None
+
+    def _set(self, key, resp, ttl):
+        try:
+            self.client.set(
+                f"{self.prefix}:{key}",
+                resp,
+                px=max(1, int(ttl * 1000)),
+            )
+        except valkey.exceptions.ValkeyError as e:
+            print(e)
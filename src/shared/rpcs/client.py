@@ -0,0 +1,884 @@
+"""
+Base class for RPC clients, see the `shared.rpcs`
+module docstring.
+
+Provides:
+    RPCClient -- base class of RPC clients.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+import weakref
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future
+from functools import partial
+from itertools import count
+
+import pika
+from pika.adapters.blocking_connection import ReturnedMessage
+
+import shared
+from shared.rpcs import metrics, tracing
+from shared.rpcs.cache import ResponseCache
+from shared.rpcs.codec import JSON, get_codec
+from shared.rpcs.compression import compress, decompress
+from shared.rpcs.messages import (
+    BATCH,
+    DEADLINE_HEADER,
+    DIRECT_REPLY_TO,
+    PUBLISHED_HEADER,
+    batch,
+    unbatch,
+)
+from shared.rpcs.stream import (
+    CREDIT_HEADER,
+    SEQ_HEADER,
+    STREAM,
+    STREAM_CHUNK,
+    STREAM_CREDIT,
+    STREAM_END,
+)
+from shared.rpcs.transport import RabbitMQTransport, Transport
+
+# errors from a connection or channel that has closed
+_CONNECTION_ERRORS = (
+    pika.exceptions.AMQPConnectionError,
+    pika.exceptions.AMQPChannelError,
+)
+
+
+# the connection (and what reopens it) and configuration, plus one
+# table per kind of outstanding call (pending, in flight, deadlines
+# and streams), which callers and tests inspect directly
+class RPCClient(ABC):  # pylint: disable=too-many-instance-attributes
+    """
+    Abstract base class for an RPC client.
+    Connects to RabbitMQ, declares a queue to listen
+    back on, and creates a consumer for it.
+
+    A sub-class must implement the abstract method
+    `call` which specifies what the body of the
+    calling message should be.
+
+    Calls are multiplexed over the one connection and
+    response queue: each outstanding call is tracked by
+    its correlation ID, so many threads can call through
+    the same client, or one thread can send many calls
+    with `_call_nowait` and collect them later with `_wait`.
+
+    Requests passed as a dict (e.g. from `request(..., codec=None)`)
+    are encoded with the client's `codec`. If `decode_responses`
+    is set, responses are returned decoded rather than as bytes.
+
+    If `compression` is set to a content encoding, requests of
+    at least `compression_threshold` bytes are compressed with it.
+    Compressed responses are always decompressed.
+
+    If `single_flight` is set, a call identical to one already
+    in flight shares its future rather than being sent again,
+    so every caller gets the one response. Passing a `cache`
+    (see `shared.rpcs.cache`) additionally answers identical
+    calls from it for `cache_ttl` seconds after a response.
+    Responses are cached undecoded, and decoded on each hit.
+    Callers sharing an in-flight call share the same object,
+    so shouldn't modify decoded responses.
+
+    Calls time out after `timeout` seconds (or the `timeout`
+    given to the call), raising a TimeoutError, and the server
+    won't process them once timed out. By default calls
+    never time out.
+
+    With `pooled`, the client opens its channel on a connection
+    shared through the process-wide pool (see
+    `shared.RabbitMQPool`) rather than its own connection.
+
+    If the client's channel or connection closes (e.g. the broker
+    drops an idle connection), it's reopened by the next call,
+    through the pool if pooled, and calls awaiting a response
+    on the old one fail with a ConnectionError.
+
+    If `confirm_calls` is set, calls are published as mandatory,
+    so a call the broker can't route to the call queue is returned
+    and fails with a `pika.exceptions.UnroutableError` rather than
+    waiting for its timeout. Returned calls are received with the
+    responses, so publishing doesn't wait on a broker round-trip
+    per message while holding the (possibly pooled) connection.
+
+    If `direct_reply` is set, responses are received through
+    RabbitMQ's direct reply-to rather than a declared queue.
+    """
+
+    decode_responses = False
+    compression = None
+    compression_threshold = 4096
+    single_flight = False
+    cache_ttl = None
+    timeout = None
+    confirm_calls = False
+    direct_reply = False
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        rabbitmq_user,
+        rabbitmq_pass,
+        rpc_prefix,
+        *,
+        codec=JSON,
+        cache: ResponseCache | None = None,
+        pooled=False,
+        transport: Transport | None = None,
+    ):
+        """
+        Connects to RabbitMQ with provided credentials,
+        creates a new queue using the `rpc_prefix` and
+        the RPC queue and exchange convention defined in
+        the module docstring.
+
+        Passing a `transport` (see `shared.rpcs.transport`)
+        connects through it instead, ignoring the credentials.
+        """
+        self.rpc_prefix = rpc_prefix
+        self.codec = codec
+        self.cache = cache
+        if transport is None:
+            transport = RabbitMQTransport(
+                rabbitmq_user,
+                rabbitmq_pass,
+                pooled=pooled,
+            )
+        self._transport = transport
+        self._reopen_lock = threading.Lock()
+        self.connection, self.channel = transport.connect()
+        self._open()
+
+        # correlation ID -> future for every call awaiting a response
+        self.pending: dict[str, Future] = {}
+
+        # call key -> future of the identical call in flight,
+        # when single flight
+        self.in_flight: dict[str, Future] = {}
+        self._flight_lock = threading.Lock()
+
+        # correlation ID -> deadline for every pending call with one
+        self.deadlines: dict[str, float] = {}
+
+        # future -> call key for every pending call to cache
+        # the response of, when caching
+        self.cache_keys = weakref.WeakKeyDictionary()
+
+        # correlation ID -> received, unconsumed messages
+        # of every open stream
+        self.streams: dict[str, deque] = {}
+
+    def _open(self):
+        """
+        Sets up the client's channel: consuming its response
+        queue, declaring it unless using direct reply-to.
+        """
+        # pika connections aren't thread safe, so only one thread
+        # may publish or process data events at a time, across
+        # every client sharing the connection
+        self._lock = shared.connection_lock(self.connection)
+        self._pump = shared.connection_pump(self.connection)
+
+        with self._lock:
+            if self.confirm_calls:
+                self.channel.add_on_return_callback(self.on_return)
+
+            if self.direct_reply:
+                self.callback_queue = DIRECT_REPLY_TO
+            else:
+                result = self.channel.queue_declare(
+                    queue=f"{self.rpc_prefix}-resp-q-{uuid.uuid4()}",
+                    exclusive=True,
+                )
+                self.channel.queue_bind(
+                    result.method.queue,
+                    f"{self.rpc_prefix}-resp-exc",
+                )
+                self.callback_queue = result.method.queue
+
+            self.channel.basic_consume(
+                queue=self.callback_queue,
+                on_message_callback=self.on_response,
+                auto_ack=True,
+            )
+
+    def _ensure_open(self):
+        """
+        Reopens the client's channel if it, or its
+        connection, has closed since it was last used.
+        """
+        connection = self.connection
+        if connection.is_closed or self.channel.is_closed:
+            self._reopen(connection, "closed")
+
+    def _reopen(self, connection, reason):
+        """
+        Opens a new channel, on the same connection if it's
+        still open, otherwise on a new one from the transport
+        (e.g. one the pool has reopened), unless another thread
+        already has. Calls awaiting a response on the old
+        channel fail with a ConnectionError, as their
+        responses can't be received.
+        """
+        with self._reopen_lock:
+            if self.connection is not connection:
+                return
+
+            logging.warning("[from %s] reopening channel: %s",
+                            self.callback_queue, reason)
+
+            lost = list(self.pending.items())
+            streams = list(self.streams.values())
+
+            if connection.is_open:
+                with self._lock:
+                    self.channel = connection.channel()
+            else:
+                self.connection, self.channel = self._transport.connect()
+            self._open()
+
+        error = ConnectionError(f"RabbitMQ channel lost: {reason}")
+        for corr_id, future in lost:
+            self.pending.pop(corr_id, None)
+            self.deadlines.pop(corr_id, None)
+            if not future.done():
+                future.set_exception(error)
+        for chunks in streams:
+            chunks.append((None, error))
+
+    def on_response(self, _ch, _method, props, body):
+        """
+        Resolves the future of the call with a matching
+        correlation ID with the body of the message,
+        which `_wait` blocks on.
+
+        Stream messages are queued for their stream's
+        iterator instead.
+        """
+        if props.type in (STREAM_CHUNK, STREAM_END):
+            chunks = self.streams.get(props.correlation_id)
+            if chunks is None:
+                logging.warning("[from %s, id %s] no open stream",
+                                self.callback_queue, props.correlation_id)
+                return
+
+            chunks.append((props, body))
+            return
+
+        future = self.pending.pop(props.correlation_id, None)
+        self.deadlines.pop(props.correlation_id, None)
+        if future is None:
+            logging.warning("[from %s, id %s] no pending call",
+                            self.callback_queue, props.correlation_id)
+            return
+
+        key = self.cache_keys.pop(future, None)
+
+        try:
+            body = decompress(body, props.content_encoding)
+            raw = body
+
+            if self.decode_responses and props.type != BATCH:
+                body = get_codec(props.content_type).decode(body)
+        except ValueError as e:
+            future.set_exception(e)
+            return
+
+        if key is not None:
+            self._cache_response(key, raw)
+
+        future.set_result(body)
+
+    def on_return(self, _ch, method, props, body):
+        """
+        Fails the call of a message the broker couldn't
+        route, with a `pika.exceptions.UnroutableError`.
+
+        Returned streaming calls fail their stream's
+        iterator instead, and returned stream credit
+        (e.g. for a server that stopped) is ignored.
+        """
+        logging.warning("[to %s, id %s] returned: %s",
+                        method.routing_key, props.correlation_id,
+                        method.reply_text)
+
+        error = pika.exceptions.UnroutableError(
+            [ReturnedMessage(method, props, body)]
+        )
+
+        if props.type == STREAM:
+            chunks = self.streams.get(props.correlation_id)
+            if chunks is not None:
+                chunks.append((None, error))
+            return
+
+        future = self.pending.pop(props.correlation_id, None)
+        self.deadlines.pop(props.correlation_id, None)
+        if future is not None and not future.done():
+            future.set_exception(error)
+
+    def _call_nowait(self, body, *, timeout=None, **properties) -> Future:
+        """
+        Publishes an RPC call without waiting for the
+        response, returning a future which is resolved
+        with the response once it is received by `_wait`,
+        or with a TimeoutError after `timeout` seconds
+        (default the client's `timeout`).
+
+        Any extra `properties` are set on the message's
+        `pika.BasicProperties`.
+        """
+        self._ensure_open()
+
+        if isinstance(body, dict):
+            body = self.codec.encode(body)
+        properties.setdefault("content_type", self.codec.content_type)
+
+        body, properties["content_encoding"] = compress(
+            body,
+            self.compression,
+            self.compression_threshold,
+        )
+
+        future = Future()
+
+        key = None
+        if self.single_flight or self.cache is not None:
+            key = self._call_key(body, properties)
+
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                # cached undecoded, as caches may only store bytes
+                if self.decode_responses and properties.get("type") != BATCH:
+                    cached = self.codec.decode(cached)
+                future.set_result(cached)
+                return future
+
+            self.cache_keys[future] = key
+
+        if self.single_flight:
+            with self._flight_lock:
+                in_flight = self.in_flight.get(key)
+                if in_flight is not None:
+                    return in_flight
+                self.in_flight[key] = future
+
+            future.add_done_callback(partial(self._land, key))
+
+        corr_id = str(uuid.uuid4())
+        self.pending[corr_id] = future
+
+        if timeout is None:
+            timeout = self.timeout
+
+        if timeout is not None:
+            deadline = time.time() + timeout
+            properties["expiration"] = str(max(1, int(timeout * 1000)))
+            properties["headers"] = {
+                **(properties.get("headers") or {}),
+                DEADLINE_HEADER: deadline,
+            }
+            self.deadlines[corr_id] = deadline
+
+        metrics.CALLS.inc(prefix=self.rpc_prefix, side="client")
+        metrics.IN_FLIGHT.inc(prefix=self.rpc_prefix, side="client")
+        future.add_done_callback(
+            partial(self._record_call, time.perf_counter())
+        )
+
+        call_span = tracing.start_span(
+            f"{self.rpc_prefix} call",
+            parent=tracing.current(),
+            side="client",
+            correlation_id=corr_id,
+        )
+        future.add_done_callback(lambda _: call_span.end())
+        properties["headers"] = tracing.inject(
+            dict(properties.get("headers") or {}),
+            call_span.context,
+        )
+
+        try:
+            with tracing.span("publish", parent=call_span.context):
+                self._publish(corr_id, body, **properties)
+        except Exception as e:
+            # fail any callers sharing the call too
+            self.pending.pop(corr_id, None)
+            self.deadlines.pop(corr_id, None)
+            future.set_exception(e)
+            raise
+
+        return future
+
+    def _record_call(self, start, future):
+        """
+        Records the metrics of a resolved call.
+        """
+        metrics.IN_FLIGHT.dec(prefix=self.rpc_prefix, side="client")
+        metrics.CALL_SECONDS.observe(
+            time.perf_counter() - start,
+            prefix=self.rpc_prefix,
+        )
+
+        if future.cancelled():
+            return
+
+        e = future.exception()
+        if e is not None:
+            metrics.ERRORS.inc(
+                prefix=self.rpc_prefix,
+                side="client",
+                kind="timeout" if isinstance(e, TimeoutError) else "error",
+            )
+
+    def _publish(self, corr_id, body, *, queue=None, **properties):
+        """
+        Publishes a message to the call queue (or to
+        `queue`, through the default exchange) with
+        the given correlation ID and `properties`.
+        """
+        properties["headers"] = {
+            **(properties.get("headers") or {}),
+            PUBLISHED_HEADER: time.time(),
+        }
+
+        exchange = f"{self.rpc_prefix}-call-exc"
+        if queue is None:
+            queue = f"{self.rpc_prefix}-call-q"
+        else:
+            exchange = ""
+
+        # published by the thread processing data events, if another
+        # is, rather than waiting for it to release the lock
+        self._pump.call(
+            self.connection,
+            partial(
+                self.channel.basic_publish,
+                exchange=exchange,
+                routing_key=queue,
+                properties=pika.BasicProperties(
+                    reply_to=self.callback_queue,
+                    correlation_id=corr_id,
+                    **properties,
+                ),
+                body=body,
+                mandatory=self.confirm_calls,
+            ),
+            self._pump_events,
+        )
+
+        logging.info("[to %s, id %s] %s", queue, corr_id, body)
+
+    def _call_key(self, body, properties):
+        """
+        Gets the key identifying identical calls,
+        from the body and the properties it's
+        sent with.
+        """
+        if isinstance(body, str):
+            body = body.encode()
+
+        digest = hashlib.sha256(body)
+        for name, value in sorted(properties.items()):
+            digest.update(f"\0{name}={value}".encode())
+
+        return f"{self.rpc_prefix}:{digest.hexdigest()}"
+
+    def _expire(self):
+        """
+        Times out every pending call past its deadline,
+        as the server won't respond to them.
+        """
+        now = time.time()
+        for corr_id, deadline in list(self.deadlines.items()):
+            if deadline > now:
+                continue
+
+            del self.deadlines[corr_id]
+            future = self.pending.pop(corr_id, None)
+            if future is not None and not future.done():
+                future.set_exception(
+                    TimeoutError(f"RPC call {corr_id} timed out.")
+                )
+
+    def _land(self, key, future):
+        """
+        Stops sharing a resolved call's future
+        with new identical calls.
+        """
+        with self._flight_lock:
+            if self.in_flight.get(key) is future:
+                del self.in_flight[key]
+
+    def _cache_response(self, key, body):
+        """
+        Caches the undecoded response of a call.
+        """
+        self.cache.set(key, body, self.cache_ttl)
+
+    def _wait(self, future: Future):
+        """
+        Processes data events on the connection (or waits
+        while another thread sharing it does, see
+        `shared.ConnectionPump`) until the given future
+        is resolved, returning its result.
+
+        Responses for other pending calls received in
+        the meantime resolve their own futures, and
+        calls past their deadline time out.
+
+        Raises:
+            TimeoutError - if the call timed out.
+        """
+        while not future.done():
+            self._pump.run_until(
+                future.done,
+                self._pump_events,
+                timeout=self._until_deadline(),
+            )
+            self._expire()
+
+        return future.result()
+
+    def _until_deadline(self) -> float | None:
+        """
+        Gets the seconds until the next pending call's
+        deadline, None if none have one.
+        """
+        if not self.deadlines:
+            return None
+        return max(0, min(self.deadlines.values()) - time.time())
+
+    def _pump_events(self):
+        """
+        Processes data events on the connection for up to
+        a second (or until the next deadline), timing out
+        calls past their deadline, and reopening the channel
+        if it has closed.
+        """
+        with self._lock:
+            time_limit = self._until_deadline()
+            time_limit = 1 if time_limit is None else min(1, time_limit)
+
+            connection = self.connection
+            error = self._process_events(connection, time_limit)
+
+        self._expire()
+        if error is not None:
+            # fails every pending call and open stream
+            self._reopen(connection, error)
+
+    @staticmethod
+    def _process_events(connection, time_limit) -> Exception | None:
+        """
+        Processes data events on a connection for up to
+        `time_limit` seconds, returning the error if the
+        connection or channel has closed (e.g. a pooled
+        connection the broker dropped), so the caller can
+        reopen it once it has released the connection lock.
+        """
+        try:
+            connection.process_data_events(time_limit=time_limit)
+        except _CONNECTION_ERRORS as e:
+            return e
+        return None
+
+    def _call(self, body, timeout=None):
+        """
+        Generic implementation of an RPC call, should be
+        called by the sub-class' `call` method with the
+        correct body for a call.
+
+        Raises:
+            TimeoutError - if the call times out, after
+                           `timeout` seconds (default the
+                           client's `timeout`).
+            pika.exceptions.UnroutableError - if `confirm_calls` and
+                                              the call couldn't be
+                                              routed.
+            ConnectionError - if the channel closed before the
+                              response was received.
+        """
+        return self._wait(self._call_nowait(body, timeout=timeout))
+
+    def call_many(self, bodies: list, timeout=None) -> list:
+        """
+        Sends many requests to the RPC in a single
+        batch message.
+
+        Args:
+            bodies: list - the request bodies to send,
+                           as formed by e.g. `request`.
+            timeout: float | None - seconds before the batch times out
+                                    (default the client's `timeout`).
+
+        Returns:
+            list - the responses, in the same order as
+                   the requests.
+
+        Raises:
+            TimeoutError - if the batch times out.
+            ValueError - if the server rejects the batch as a whole,
+                         with its status and reason.
+        """
+        if not bodies:
+            return []
+
+        bodies = [
+            JSON.encode(body) if isinstance(body, dict) else body
+            for body in bodies
+        ]
+        body = self._wait(
+            self._call_nowait(
+                batch(bodies),
+                timeout=timeout,
+                type=BATCH,
+                content_type=JSON.content_type,
+            )
+        )
+
+        try:
+            resps = unbatch(body)
+        except ValueError:
+            # the server rejected the batch as a whole (e.g. a bad
+            # content encoding) with one non-batch error response
+            raise ValueError(f"Batch failed: {_batch_error(body)}") from None
+
+        if self.decode_responses:
+            return [JSON.decode(resp) for resp in resps]
+
+        return resps
+
+    def call_stream(self, body, credit=16, timeout=None):
+        """
+        Sends a streaming call to the RPC, returning
+        an iterator over the chunks of its response.
+
+        At most `credit` chunks are sent by the server
+        before they're consumed, bounding how many are
+        held in memory. Closing the iterator (or dropping
+        it, even unconsumed) before the end of the stream
+        cancels it.
+
+        Args:
+            body: str | bytes | dict - the request body.
+            credit: int - the most chunks to have in flight
+                          (default 16).
+            timeout: float | None - the most seconds to wait for
+                                    each chunk (default the
+                                    client's `timeout`).
+
+        Returns:
+            Iterator - the chunks, decoded if `decode_responses`.
+
+        Raises:
+            ValueError - if a chunk is missing or can't be decoded.
+            TimeoutError - if waiting for a chunk times out,
+                           which cancels the stream.
+            pika.exceptions.UnroutableError - if `confirm_calls` and
+                                              the call couldn't be
+                                              routed.
+            ConnectionError - if the channel closed before the
+                              response was received.
+        """
+        if isinstance(body, dict):
+            body = self.codec.encode(body)
+
+        body, content_encoding = compress(
+            body,
+            self.compression,
+            self.compression_threshold,
+        )
+
+        self._ensure_open()
+
+        corr_id = str(uuid.uuid4())
+        self.streams[corr_id] = deque()
+
+        try:
+            self._publish(
+                corr_id,
+                body,
+                type=STREAM,
+                content_type=self.codec.content_type,
+                content_encoding=content_encoding,
+                headers={CREDIT_HEADER: credit},
+            )
+        except Exception:
+            self.streams.pop(corr_id, None)
+            raise
+
+        if timeout is None:
+            timeout = self.timeout
+
+        return _StreamIterator(
+            self._iter_stream(corr_id, credit, timeout),
+            partial(self._drop_stream, corr_id),
+        )
+
+    def _iter_stream(self, corr_id, credit, timeout):
+        """
+        Yields the chunks of a stream as they are
+        received, granting the server more credit
+        once half of it has been consumed, and
+        raising a TimeoutError if a chunk takes
+        longer than `timeout` seconds to arrive.
+        """
+        chunks = self.streams[corr_id]
+        grant = max(1, credit // 2)
+        consumed = 0
+        ended = False
+
+        # the queue of the server sending the stream,
+        # known once its first chunk arrives
+        stream_queue = None
+
+        try:
+            for seq in count():
+                self._wait_chunk(corr_id, chunks, timeout)
+
+                props, body = chunks.popleft()
+                if props is None:
+                    # the stream failed, see `on_return` and `_reopen`
+                    ended = True
+                    raise body
+
+                stream_queue = stream_queue or props.reply_to
+                if props.type == STREAM_END:
+                    ended = True
+                    return
+
+                if (props.headers or {}).get(SEQ_HEADER) != seq:
+                    raise ValueError(f"Stream {corr_id} missing chunk {seq}.")
+
+                body = decompress(body, props.content_encoding)
+                if self.decode_responses:
+                    body = get_codec(props.content_type).decode(body)
+
+                yield body
+
+                consumed += 1
+                if consumed == grant:
+                    self._grant(corr_id, consumed, stream_queue)
+                    consumed = 0
+        finally:
+            self.streams.pop(corr_id, None)
+            if not ended:
+                self._cancel_stream(corr_id, stream_queue)
+
+    def _wait_chunk(self, corr_id, chunks, timeout):
+        """
+        Processes data events on the connection (or waits
+        while another thread sharing it does) until a
+        stream has a chunk to consume.
+
+        Raises:
+            TimeoutError - if none arrives within `timeout`
+                           seconds (if not None).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while not chunks:
+            left = None
+            if deadline is not None:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise TimeoutError(f"RPC stream {corr_id} timed out.")
+
+            self._pump.run_until(
+                lambda: bool(chunks),
+                self._pump_events,
+                timeout=left,
+            )
+
+    def _grant(self, corr_id, credit, stream_queue=None):
+        """
+        Grants the server credit to send more chunks
+        of a stream, through the server's stream queue
+        if known, so it reaches the replica sending
+        the stream.
+        """
+        self._publish(
+            corr_id,
+            b"",
+            queue=stream_queue,
+            type=STREAM_CREDIT,
+            headers={CREDIT_HEADER: credit},
+        )
+
+    def _drop_stream(self, corr_id):
+        """
+        Stops receiving a stream closed before its
+        iteration started, cancelling it.
+        """
+        if self.streams.pop(corr_id, None) is not None:
+            self._cancel_stream(corr_id)
+
+    def _cancel_stream(self, corr_id, stream_queue=None):
+        """
+        Cancels a stream by granting no credit.
+        """
+        try:
+            self._grant(corr_id, 0, stream_queue)
+        except pika.exceptions.AMQPError as e:
+            logging.warning("[id %s] couldn't cancel stream: %s", corr_id, e)
+
+    @abstractmethod
+    def call(self, *args, **kwargs):
+        """
+        Should be implemented in sub-classes which
+        should call `_call` with the correct body
+        for a call.
+        """
+        raise NotImplementedError
+
+
+class _StreamIterator:
+    """
+    Iterator over the chunks of a stream, as returned
+    by `RPCClient.call_stream`. Closing it, or dropping
+    it, cancels the stream if it hasn't ended, even if
+    its iteration never started.
+    """
+
+    def __init__(self, chunks, on_close):
+        self._chunks = chunks
+        self._on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._chunks)
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        """
+        Stops iterating over the chunks, cancelling
+        the stream if it hasn't ended.
+        """
+        # only runs the generator's cleanup if it started
+        self._chunks.close()
+        self._on_close()
+
+
+def _batch_error(body) -> str:
+    """
+    Gets the status and reason of an error response
+    to a whole batch, or the body if it isn't one.
+    """
+    try:
+        resp = json.loads(body)
+        return f"{resp['status']} {resp['data']['reason']}"
+    except (ValueError, TypeError, KeyError):
+        return repr(body)
@@ -0,0 +1,117 @@
+"""
+Codecs for encoding and decoding RPC envelopes.
+
+The codec of a message is given by its AMQP `content_type`
+property, messages without one are assumed to be JSON.
+
+Provides:
+    JSON -- the default JSON codec.
+    MSGPACK -- a compact binary MessagePack codec, only usable
+               if the optional `msgpack` dependency is installed.
+    get_codec -- get the codec for a content type.
+"""
+
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class Codec:
+    """
+    Encodes and decodes RPC envelopes for a content type.
+
+    Sub-classes must set `name` and `content_type`, and
+    implement `encode` and `decode`. `decode` should raise
+    a ValueError if the body can't be decoded.
+    """
+
+    name = ""
+    content_type = ""
+
+    def encode(self, obj):
+        """
+        Encodes an object for the body of a message.
+        """
+        raise NotImplementedError
+
+    def decode(self, body):
+        """
+        Decodes the body of a message to an object.
+        """
+        raise NotImplementedError
+
+
+class JSONCodec(Codec):
+    """
+    JSON codec, encoding to a str so it is
+    interchangeable with the envelope helpers'
+    original output.
+    """
+
+    name = "JSON"
+    content_type = "application/json"
+
+    def encode(self, obj) -> str:
+        return json.dumps(obj)
+
+    def decode(self, body):
+        return json.loads(body)
+
+
+class MessagePackCodec(Codec):
+    """
+    MessagePack codec, encoding to bytes.
+    """
+
+    name = "MessagePack"
+    content_type = "application/msgpack"
+
+    def encode(self, obj) -> bytes:
+        if msgpack is None:
+            raise RuntimeError("msgpack isn't installed.")
+        return msgpack.packb(obj)
+
+    def decode(self, body):
+        if msgpack is None:
+            raise RuntimeError("msgpack isn't installed.")
+        try:
+            return msgpack.unpackb(body)
+        except (msgpack.UnpackException, TypeError) as e:
+            raise ValueError(str(e)) from e
+
+
+JSON = JSONCodec()
+MSGPACK = MessagePackCodec()
+
+CODECS = {
+    JSON.content_type: JSON,
+}
+
+if msgpack is not None:
+    CODECS[MSGPACK.content_type] = MSGPACK
+
+
+def get_codec(content_type) -> Codec:
+    """
+    Gets the codec for a content type.
+
+    Args:
+        content_type: str | None - the AMQP content type of a message.
+
+    Returns:
+        Codec - the codec for the content type, JSON if the
+                content type is None.
+
+    Raises:
+        ValueError - if there is no codec for the content type.
+    """
+    if content_type is None:
+        return JSON
+
+    try:
+        return CODECS[content_type]
+    except KeyError as e:
+        raise ValueError(f"Unsupported content type {content_type}.") from e
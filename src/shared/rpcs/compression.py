@@ -0,0 +1,95 @@
+"""
+Compression of large RPC bodies.
+
+The compression of a message is given by its AMQP
+`content_encoding` property, messages without one
+are uncompressed.
+
+Provides:
+    DEFLATE -- zlib compression.
+    LZ4 -- faster LZ4 frame compression, only usable if the
+           optional `lz4` dependency is installed.
+    compress -- compress a body if it is over a size threshold.
+    decompress -- decompress a body given its content encoding.
+"""
+
+import zlib
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None  # pylint: disable=invalid-name
+
+
+DEFLATE = "deflate"
+LZ4 = "lz4"
+
+# content encoding -> (compress, decompress)
+COMPRESSORS = {
+    DEFLATE: (zlib.compress, zlib.decompress),
+}
+
+if lz4 is not None:
+    COMPRESSORS[LZ4] = (lz4.frame.compress, lz4.frame.decompress)
+
+
+def compress(body, encoding, threshold=0) -> tuple:
+    """
+    Compresses a body with the given encoding, if it
+    is at least `threshold` bytes.
+
+    Args:
+        body: str | bytes - the body to compress.
+        encoding: str | None - the content encoding to compress with,
+                               None to not compress.
+        threshold: int - the minimum size in bytes of a body to
+                         compress (default 0).
+
+    Returns:
+        tuple[str | bytes, str | None] - the (possibly) compressed body
+                                         and its content encoding.
+
+    Raises:
+        ValueError - if there is no compressor for the encoding.
+    """
+    if encoding is None:
+        return body, None
+
+    if encoding not in COMPRESSORS:
+        raise ValueError(f"Unsupported content encoding {encoding}.")
+
+    if isinstance(body, str):
+        body = body.encode()
+
+    if len(body) < threshold:
+        return body, None
+
+    return COMPRESSORS[encoding][0](body), encoding
+
+
+def decompress(body, encoding):
+    """
+    Decompresses a body compressed with the given encoding.
+
+    Args:
+        body: bytes - the body to decompress.
+        encoding: str | None - the content encoding of the body,
+                               None if uncompressed.
+
+    Returns:
+        bytes - the decompressed body.
+
+    Raises:
+        ValueError - if there is no compressor for the encoding,
+                     or the body can't be decompressed.
+    """
+    if encoding is None:
+        return body
+
+    if encoding not in COMPRESSORS:
+        raise ValueError(f"Unsupported content encoding {encoding}.")
+
+    try:
+        return COMPRESSORS[encoding][1](body)
+    except (zlib.error, RuntimeError) as e:
+        raise ValueError(str(e)) from e
@@ -0,0 +1,682 @@
+"""
+In-process stand-in for a RabbitMQ broker, for running RPC
+clients and servers in one process without a cluster, e.g.
+in tests and benchmarks, through
+`shared.rpcs.transport.MemoryTransport`.
+
+Connections and channels implement the subset of pika's
+`BlockingConnection` and `BlockingChannel` used by
+`shared.rpcs`: callbacks are only run from the connection's
+`process_data_events` (or its channel's `start_consuming`),
+on the thread calling it, as with pika.
+
+Exchanges are direct, routing on bindings by routing key,
+and the default exchange routes to the queue named by the
+routing key. Prefetch limits, acknowledgements, message
+expiration, transactions, mandatory publishes with publisher
+confirms or return callbacks, and direct reply-to are
+supported. Messages aren't persisted.
+
+Provides:
+    MemoryBroker -- an in-process broker.
+    MemoryConnection -- a connection to a MemoryBroker.
+    MemoryChannel -- a channel of a MemoryConnection.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+from functools import partial
+from queue import Empty, SimpleQueue
+
+import pika
+
+from shared.rpcs.messages import DIRECT_REPLY_TO
+
+
+class _Queue:  # pylint: disable=too-few-public-methods
+    """
+    A queue's messages and consumers.
+    """
+
+    def __init__(self, name, exclusive_to=None):
+        self.name = name
+        self.exclusive_to = exclusive_to
+
+        # (exchange, routing key, properties, body, expiry)
+        self.messages = deque()
+        self.consumers: list["_Consumer"] = []
+        self.next_consumer = 0
+
+
+class _Consumer:  # pylint: disable=too-few-public-methods
+    """
+    A consumer of a queue, on a channel.
+    """
+
+    def __init__(self, tag, channel, queue_name, callback, auto_ack):
+        self.tag = tag
+        self.channel = channel
+        self.queue_name = queue_name
+        self.callback = callback
+        self.auto_ack = auto_ack
+
+
+class MemoryBroker:
+    """
+    An in-process broker, routing messages between
+    the channels of its connections.
+
+    Every operation holds the broker's lock, so
+    connections may be used from different threads.
+    """
+
+    def __init__(self):
+        # exchange -> routing key -> bound queue names
+        self.exchanges: dict[str, dict[str, set]] = {}
+        self.queues: dict[str, _Queue] = {}
+        self._lock = threading.RLock()
+
+    def connect(self) -> "MemoryConnection":
+        """
+        Opens a connection to the broker.
+        """
+        return MemoryConnection(self)
+
+    def declare_rpc(self, rpc_prefix):
+        """
+        Declares the exchanges, call queue and binding
+        of an RPC, as its k8s yaml does in RabbitMQ.
+
+        Args:
+            rpc_prefix: str - the RPC's prefix.
+        """
+        with self._lock:
+            self.exchange_declare(f"{rpc_prefix}-call-exc")
+            self.exchange_declare(f"{rpc_prefix}-resp-exc")
+            self.queue_declare(f"{rpc_prefix}-call-q")
+            self.queue_bind(
+                f"{rpc_prefix}-call-q",
+                f"{rpc_prefix}-call-exc",
+                f"{rpc_prefix}-call-q",
+            )
+
+    def exchange_declare(self, exchange):
+        """
+        Declares a direct exchange, if it doesn't exist.
+        """
+        with self._lock:
+            self.exchanges.setdefault(exchange, {})
+
+    def queue_declare(self, name, exclusive_to=None) -> _Queue:
+        """
+        Declares a queue, if it doesn't exist.
+        """
+        with self._lock:
+            declared = self.queues.get(name)
+            if declared is None:
+                declared = self.queues[name] = _Queue(name, exclusive_to)
+            return declared
+
+    def queue_bind(self, name, exchange, routing_key):
+        """
+        Binds a queue to an exchange with a routing key.
+
+        Raises:
+            pika.exceptions.ChannelClosedByBroker - if the
+                exchange or queue doesn't exist.
+        """
+        with self._lock:
+            self._queue(name)
+            self._exchange(exchange).setdefault(routing_key, set()).add(name)
+
+    def publish(  # pylint: disable=too-many-arguments
+        self,
+        exchange,
+        routing_key,
+        properties,
+        body,
+    ) -> bool:
+        """
+        Routes a message to every matching queue,
+        returning whether it was routed to any.
+
+        Raises:
+            pika.exceptions.ChannelClosedByBroker - if the
+                exchange doesn't exist.
+        """
+        expiry = None
+        if properties.expiration is not None:
+            expiry = time.monotonic() + int(properties.expiration) / 1000
+
+        with self._lock:
+            if exchange == "":
+                names = {routing_key} if routing_key in self.queues else set()
+            else:
+                names = self._exchange(exchange).get(routing_key, set())
+
+            for name in names:
+                routed = self.queues[name]
+                routed.messages.append(
+                    (exchange, routing_key, properties, body, expiry)
+                )
+                self._dispatch(routed)
+
+            return bool(names)
+
+    def _exchange(self, exchange) -> dict:
+        """
+        Gets the bindings of an exchange.
+        """
+        bindings = self.exchanges.get(exchange)
+        if bindings is None:
+            raise pika.exceptions.ChannelClosedByBroker(
+                404,
+                f"NOT_FOUND - no exchange '{exchange}'",
+            )
+        return bindings
+
+    def _queue(self, name) -> _Queue:
+        """
+        Gets a queue.
+        """
+        found = self.queues.get(name)
+        if found is None:
+            raise pika.exceptions.ChannelClosedByBroker(
+                404,
+                f"NOT_FOUND - no queue '{name}'",
+            )
+        return found
+
+    def _dispatch(self, dispatched: _Queue):
+        """
+        Delivers a queue's messages round-robin to
+        its consumers with prefetch to spare, dropping
+        expired messages.
+        """
+        while dispatched.messages and dispatched.consumers:
+            consumers = dispatched.consumers
+            for i in range(len(consumers)):
+                consumer = consumers[
+                    (dispatched.next_consumer + i) % len(consumers)
+                ]
+                if consumer.auto_ack or consumer.channel.has_prefetch():
+                    dispatched.next_consumer = (
+                        dispatched.next_consumer + i + 1
+                    ) % len(consumers)
+                    break
+            else:
+                return
+
+            message = dispatched.messages.popleft()
+            expiry = message[4]
+            if expiry is not None and expiry <= time.monotonic():
+                continue
+
+            consumer.channel.deliver(consumer, *message[:4])
+
+    def _redispatch(self):
+        """
+        Delivers the messages of every queue that
+        can now be consumed.
+        """
+        for dispatched in self.queues.values():
+            if dispatched.messages and dispatched.consumers:
+                self._dispatch(dispatched)
+
+    def _remove_channel(self, channel):
+        """
+        Cancels a closed channel's consumers and requeues
+        its unacknowledged messages.
+        """
+        with self._lock:
+            for dispatched in self.queues.values():
+                dispatched.consumers = [
+                    consumer for consumer in dispatched.consumers
+                    if consumer.channel is not channel
+                ]
+
+            for _, (queue_name, message) in sorted(channel.unacked.items()):
+                requeued = self.queues.get(queue_name)
+                if requeued is not None:
+                    requeued.messages.appendleft(message)
+            channel.unacked.clear()
+
+            for name, declared in list(self.queues.items()):
+                if declared.exclusive_to is channel.connection:
+                    del self.queues[name]
+                    for bindings in self.exchanges.values():
+                        for names in bindings.values():
+                            names.discard(name)
+
+            self._redispatch()
+
+
+class MemoryConnection:
+    """
+    A connection to a `MemoryBroker`, equivalent
+    to a `pika.BlockingConnection`.
+    """
+
+    def __init__(self, broker: MemoryBroker):
+        self.broker = broker
+        self.channels: list["MemoryChannel"] = []
+        self.is_open = True
+
+        # callbacks to run on the connection's thread
+        self._events = SimpleQueue()
+
+        # (due time, id, callback), soonest first
+        self._timers = []
+        self._timer_ids = itertools.count()
+        self._cancelled_timers = set()
+
+    @property
+    def is_closed(self) -> bool:
+        """
+        Whether the connection is closed.
+        """
+        return not self.is_open
+
+    def channel(self) -> "MemoryChannel":
+        """
+        Opens a channel on the connection.
+        """
+        opened = MemoryChannel(self, len(self.channels) + 1)
+        self.channels.append(opened)
+        return opened
+
+    def close(self):
+        """
+        Closes the connection and its channels.
+        """
+        for channel in self.channels:
+            channel.close()
+        self.is_open = False
+
+    def add_callback_threadsafe(self, callback):
+        """
+        Schedules a callback to run on the
+        connection's thread.
+        """
+        self._events.put(callback)
+
+    def call_later(self, delay, callback):
+        """
+        Schedules a callback to run on the connection's
+        thread after `delay` seconds, returning an ID
+        to cancel it with `remove_timeout`.
+        """
+        timer_id = next(self._timer_ids)
+        heapq.heappush(
+            self._timers,
+            (time.monotonic() + delay, timer_id, callback),
+        )
+        return timer_id
+
+    def remove_timeout(self, timer_id):
+        """
+        Cancels a callback scheduled by `call_later`.
+        """
+        self._cancelled_timers.add(timer_id)
+
+    def process_data_events(self, time_limit=0):
+        """
+        Runs delivery callbacks and scheduled callbacks,
+        waiting up to `time_limit` seconds (or forever,
+        if None) for there to be any.
+        """
+        deadline = None if time_limit is None else time.monotonic() + time_limit
+
+        while True:
+            ran = self._run_timers()
+
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if self._timers:
+                until_timer = self._timers[0][0] - time.monotonic()
+                timeout = (
+                    until_timer if timeout is None
+                    else min(timeout, until_timer)
+                )
+
+            try:
+                if ran or (timeout is not None and timeout <= 0):
+                    callback = self._events.get_nowait()
+                else:
+                    callback = self._events.get(timeout=timeout)
+            except Empty:
+                if ran or (
+                    deadline is not None and time.monotonic() >= deadline
+                ):
+                    return
+                continue
+
+            callback()
+            while True:
+                try:
+                    callback = self._events.get_nowait()
+                except Empty:
+                    return
+                callback()
+
+    def _run_timers(self) -> bool:
+        """
+        Runs every due scheduled callback, returning
+        whether any were run.
+        """
+        ran = False
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, timer_id, callback = heapq.heappop(self._timers)
+            if timer_id in self._cancelled_timers:
+                self._cancelled_timers.discard(timer_id)
+                continue
+
+            callback()
+            ran = True
+
+        return ran
+
+
+class MemoryChannel:  # pylint: disable=too-many-instance-attributes
+    """
+    A channel of a `MemoryConnection`, equivalent
+    to a `pika.adapters.blocking_connection.BlockingChannel`.
+    """
+
+    def __init__(self, connection: MemoryConnection, channel_number):
+        self.connection = connection
+        self.broker = connection.broker
+        self.channel_number = channel_number
+        self.is_open = True
+
+        self.prefetch_count = 0
+        self.confirming = False
+        self.transactional = False
+
+        # callbacks of unroutable mandatory publishes
+        self._on_return: list = []
+
+        # delivery tag -> (queue name, message) of unacked deliveries
+        self.unacked: dict[int, tuple] = {}
+        self._delivery_tags = itertools.count(1)
+
+        # publishes and acks awaiting commit, when transactional
+        self._tx: list = []
+
+        self._consuming = False
+        self._reply_to = None
+
+    @property
+    def is_closed(self) -> bool:
+        """
+        Whether the channel is closed.
+        """
+        return not self.is_open
+
+    def close(self):
+        """
+        Closes the channel, requeueing its
+        unacknowledged messages.
+        """
+        if self.is_open:
+            self.is_open = False
+            self.broker._remove_channel(self)  # pylint: disable=protected-access
+
+    def exchange_declare(self, exchange, exchange_type="direct", **_kwargs):
+        """
+        Declares a direct exchange.
+        """
+        if exchange_type != "direct":
+            raise ValueError("Only direct exchanges are supported.")
+        self.broker.exchange_declare(exchange)
+
+    def queue_declare(self, queue="", exclusive=False, **_kwargs):
+        """
+        Declares a queue, named by the broker if
+        `queue` is empty.
+        """
+        name = queue or f"amq.gen-{uuid.uuid4()}"
+        self.broker.queue_declare(
+            name,
+            self.connection if exclusive else None,
+        )
+        return pika.frame.Method(
+            self.channel_number,
+            pika.spec.Queue.DeclareOk(name, 0, 0),
+        )
+
+    def queue_bind(self, queue, exchange, routing_key=None, **_kwargs):
+        """
+        Binds a queue to an exchange, on the queue's
+        name if no routing key is given.
+        """
+        self.broker.queue_bind(
+            queue,
+            exchange,
+            queue if routing_key is None else routing_key,
+        )
+
+    def queue_purge(self, queue):
+        """
+        Removes every message from a queue.
+        """
+        with self.broker._lock:  # pylint: disable=protected-access
+            self.broker._queue(queue).messages.clear()  # pylint: disable=protected-access
+
+    def basic_qos(self, prefetch_count=0, **_kwargs):
+        """
+        Limits the unacknowledged messages delivered
+        to the channel, 0 for no limit.
+        """
+        with self.broker._lock:  # pylint: disable=protected-access
+            self.prefetch_count = prefetch_count
+            self.broker._redispatch()  # pylint: disable=protected-access
+
+    def confirm_delivery(self):
+        """
+        Enables publisher confirms, so unroutable
+        mandatory publishes raise.
+        """
+        self.confirming = True
+
+    def add_on_return_callback(self, callback):
+        """
+        Adds a callback run with each mandatory publish
+        that couldn't be routed, when not confirming,
+        as `callback(channel, method, properties, body)`.
+        """
+        self._on_return.append(callback)
+
+    def tx_select(self):
+        """
+        Starts a transaction, holding publishes and
+        acknowledgements until `tx_commit`.
+        """
+        self.transactional = True
+
+    def tx_commit(self):
+        """
+        Applies every publish and acknowledgement
+        since the last commit.
+        """
+        ops, self._tx = self._tx, []
+        for op in ops:
+            op()
+
+    def basic_consume(
+        self,
+        queue,
+        on_message_callback,
+        auto_ack=False,
+        **_kwargs,
+    ):
+        """
+        Consumes a queue, returning the consumer tag.
+        Consuming the direct reply-to pseudo-queue
+        receives responses to calls published on this
+        channel with it as their reply-to.
+        """
+        if queue == DIRECT_REPLY_TO:
+            if not auto_ack:
+                raise pika.exceptions.ChannelClosedByBroker(
+                    406,
+                    "PRECONDITION_FAILED - reply consumer must use auto-ack",
+                )
+            self._reply_to = f"{DIRECT_REPLY_TO}.{uuid.uuid4()}"
+            queue = self._reply_to
+            self.broker.queue_declare(queue, self.connection)
+
+        tag = f"ctag-{uuid.uuid4()}"
+        with self.broker._lock:  # pylint: disable=protected-access
+            consumed = self.broker._queue(queue)  # pylint: disable=protected-access
+            consumed.consumers.append(
+                _Consumer(tag, self, queue, on_message_callback, auto_ack)
+            )
+            self.broker._dispatch(consumed)  # pylint: disable=protected-access
+
+        return tag
+
+    def basic_publish(  # pylint: disable=too-many-arguments
+        self,
+        exchange,
+        routing_key,
+        body,
+        properties=None,
+        mandatory=False,
+    ):
+        """
+        Publishes a message.
+
+        Raises:
+            pika.exceptions.UnroutableError - if confirming
+                and a mandatory message couldn't be routed.
+            pika.exceptions.ChannelClosedByBroker - if the
+                exchange doesn't exist.
+        """
+        if isinstance(body, str):
+            body = body.encode()
+
+        properties = properties or pika.BasicProperties()
+        if properties.reply_to == DIRECT_REPLY_TO:
+            if self._reply_to is None:
+                raise pika.exceptions.ChannelClosedByBroker(
+                    406,
+                    "PRECONDITION_FAILED - fast reply consumer does not exist",
+                )
+            properties.reply_to = self._reply_to
+
+        def publish():
+            routed = self.broker.publish(
+                exchange,
+                routing_key,
+                properties,
+                body,
+            )
+            if not mandatory or routed:
+                return
+            if self.confirming:
+                raise pika.exceptions.UnroutableError([])
+
+            method = pika.spec.Basic.Return(
+                312,
+                "NO_ROUTE",
+                exchange,
+                routing_key,
+            )
+            for callback in self._on_return:
+                self.connection.add_callback_threadsafe(
+                    partial(callback, self, method, properties, body)
+                )
+
+        if self.transactional:
+            self._tx.append(publish)
+        else:
+            publish()
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        """
+        Acknowledges a delivery, or every delivery
+        up to it if `multiple`.
+        """
+        def ack():
+            with self.broker._lock:  # pylint: disable=protected-access
+                tags = [delivery_tag]
+                if multiple:
+                    tags = [tag for tag in self.unacked if tag <= delivery_tag]
+                for tag in tags:
+                    self.unacked.pop(tag, None)
+                self.broker._redispatch()  # pylint: disable=protected-access
+
+        if self.transactional:
+            self._tx.append(ack)
+        else:
+            ack()
+
+    def basic_nack(self, delivery_tag=0, multiple=False, requeue=True):
+        """
+        Rejects a delivery, or every delivery up to
+        it if `multiple`, requeueing it if `requeue`.
+        """
+        with self.broker._lock:  # pylint: disable=protected-access
+            tags = [delivery_tag]
+            if multiple:
+                tags = [tag for tag in self.unacked if tag <= delivery_tag]
+            for tag in sorted(tags, reverse=True):
+                rejected = self.unacked.pop(tag, None)
+                if rejected is not None and requeue:
+                    queue_name, message = rejected
+                    requeued = self.broker.queues.get(queue_name)
+                    if requeued is not None:
+                        requeued.messages.appendleft(message)
+            self.broker._redispatch()  # pylint: disable=protected-access
+
+    def start_consuming(self):
+        """
+        Processes data events until `stop_consuming`
+        is called.
+        """
+        self._consuming = True
+        while self._consuming and self.is_open:
+            self.connection.process_data_events(time_limit=None)
+
+    def stop_consuming(self):
+        """
+        Stops `start_consuming`, once the current
+        callback returns.
+        """
+        self._consuming = False
+
+    def has_prefetch(self) -> bool:
+        """
+        Whether the channel may be delivered
+        another message.
+        """
+        return not self.prefetch_count or len(self.unacked) < self.prefetch_count
+
+    def deliver(self, consumer, exchange, routing_key, properties, body):
+        """
+        Queues a message for delivery to one of the
+        channel's consumers, called with the broker's
+        lock held.
+        """
+        delivery_tag = next(self._delivery_tags)
+        if not consumer.auto_ack:
+            self.unacked[delivery_tag] = (
+                consumer.queue_name,
+                (exchange, routing_key, properties, body, None),
+            )
+
+        method = pika.spec.Basic.Deliver(
+            consumer_tag=consumer.tag,
+            delivery_tag=delivery_tag,
+            redelivered=False,
+            exchange=exchange,
+            routing_key=routing_key,
+        )
+        self.connection.add_callback_threadsafe(
+            lambda: consumer.callback(self, method, properties, body)
+        )
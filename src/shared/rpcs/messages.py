@@ -0,0 +1,235 @@
+"""
+Forming and parsing the envelopes of RPC messages, and the
+message types and headers of the protocol described in the
+`shared.rpcs` module docstring.
+
+Provides:
+    response -- form a response.
+    batch -- form a batch of requests or responses.
+    unbatch -- split a batch back into its requests or responses.
+    request -- form a request.
+    request_unauth -- form an unauthenticated request.
+    request_moderation -- form a moderator's request.
+"""
+
+import json
+import time
+
+from shared.rpcs.codec import JSON, Codec
+
+BATCH = "batch"
+DIRECT_REPLY_TO = "amq.rabbitmq.reply-to"
+DEADLINE_HEADER = "x-deadline"
+PUBLISHED_HEADER = "x-published"
+
+
+def response(status: int, data: dict, *, codec: Codec | None = JSON):
+    """
+    Forms a response, as a JSON string by default.
+
+    Args:
+        status: int - the status code.
+        data: dict - the JSON object for the
+                     data field of the response
+                     as a dict.
+        codec: Codec | None - the codec to encode the response
+                              with, or None to return the dict
+                              (default JSON).
+
+    Returns:
+        str | bytes | dict - formatted response.
+    """
+    return _encode(
+        codec,
+        {
+            "status": status,
+            "data": data,
+        }
+    )
+
+
+def batch(items: list) -> str:
+    """
+    Forms a JSON string batch of requests or responses.
+
+    Args:
+        items: list - the requests or responses to batch,
+                      as str or bytes.
+
+    Returns:
+        str - formatted JSON batch.
+    """
+    return json.dumps(
+        [
+            item.decode() if isinstance(item, bytes) else item
+            for item in items
+        ]
+    )
+
+
+def unbatch(body) -> list:
+    """
+    Splits a JSON batch formed by `batch` back into
+    its requests or responses.
+
+    Args:
+        body: str | bytes - the batch body.
+
+    Returns:
+        list - the batched requests or responses as str.
+
+    Raises:
+        ValueError - if the body isn't a valid batch.
+    """
+    items = json.loads(body)
+
+    if not isinstance(items, list) or not all(
+        isinstance(item, str) for item in items
+    ):
+        raise ValueError("Batch must be a JSON list of strings.")
+
+    return items
+
+
+def request(
+    auth_user: str,
+    version: str,
+    from_svc: str,
+    data: dict,
+    *,
+    codec: Codec | None = JSON,
+):
+    """
+    Forms a request, as a JSON string by default.
+
+    Args:
+        auth_user: str - the authenticated user making
+                         the request.
+        version: str - the API version number (e.g. 1.0.0).
+        from_svc: str - the name of the service the request
+                    is coming from.
+        data: dict - the JSON object for the data field of
+                     the request as a dict.
+        codec: Codec | None - the codec to encode the request
+                              with, or None to return the dict
+                              (default JSON).
+
+    Returns:
+        str | bytes | dict - formatted request.
+    """
+    return _encode(
+        codec,
+        {
+            "authUser": auth_user,
+            "version": version,
+            "from": from_svc,
+            "data": data,
+        }
+    )
+
+
+def request_unauth(
+    sid: str,
+    version: str,
+    from_svc: str,
+    data: dict,
+    *,
+    codec: Codec | None = JSON,
+):
+    """
+    Forms a request (unauthenticated), as a JSON string by default.
+
+    Args:
+        sid: str - the session ID making the request.
+        version: str - the API version number (e.g. 1.0.0).
+        from_svc: str - the name of the service the request
+                    is coming from.
+        data: dict - the JSON object for the data field of
+                     the request as a dict.
+        codec: Codec | None - the codec to encode the request
+                              with, or None to return the dict
+                              (default JSON).
+
+    Returns:
+        str | bytes | dict - formatted request.
+    """
+    return _encode(
+        codec,
+        {
+            "sid": sid,
+            "version": version,
+            "from": from_svc,
+            "data": data,
+        }
+    )
+
+
+def request_moderation(
+    auth_mod: str,
+    version: str,
+    from_svc: str,
+    data: dict,
+    *,
+    codec: Codec | None = JSON,
+):
+    """
+    Forms a request (authenticated moderator), as a JSON string
+    by default.
+
+    Args:
+        auth_mod: str - the authenticated moderator making the request.
+        version: str - the API version number (e.g. 1.0.0).
+        from_svc: str - the name of the service the request
+                    is coming from.
+        data: dict - the JSON object for the data field of
+                     the request as a dict.
+        codec: Codec | None - the codec to encode the request
+                              with, or None to return the dict
+                              (default JSON).
+
+    Returns:
+        str | bytes | dict - formatted request.
+    """
+    return _encode(
+        codec,
+        {
+            "authMod": auth_mod,
+            "version": version,
+            "from": from_svc,
+            "data": data,
+        }
+    )
+
+
+def _is_direct_reply(reply_to) -> bool:
+    """
+    Checks whether a call's reply-to is a direct
+    reply-to, which must be responded to through
+    the default exchange.
+    """
+    return reply_to is not None and reply_to.startswith(DIRECT_REPLY_TO)
+
+
+def _expired(deadline) -> bool:
+    """
+    Checks whether a call's deadline, as Unix time,
+    has passed. Calls without a deadline never expire.
+    """
+    if deadline is None:
+        return False
+
+    try:
+        return time.time() >= float(deadline)
+    except (TypeError, ValueError):
+        return False
+
+
+def _encode(codec, envelope):
+    """
+    Encodes an envelope with the codec, or
+    returns it as is if the codec is None.
+    """
+    if codec is None:
+        return envelope
+
+    return codec.encode(envelope)
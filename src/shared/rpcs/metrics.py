@@ -0,0 +1,331 @@
+"""
+Metrics of RPC clients and servers, exported
+in the Prometheus text format.
+
+Every `RPCClient` and `RPCServer` records its metrics
+in the process-wide `REGISTRY`, labelled by RPC prefix.
+They can be served for scraping with `start_http_server`.
+
+Provides:
+    Counter -- a monotonically increasing count.
+    Gauge -- a value that can go up and down.
+    Histogram -- a distribution of observed values.
+    Registry -- a set of metrics to export.
+    REGISTRY -- the process-wide registry.
+    start_http_server -- serve the registry at /metrics.
+"""
+
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Metric:  # pylint: disable=too-few-public-methods
+    """
+    Base class of metrics, holding a value for each
+    combination of label values.
+
+    Sub-classes must set `kind` and implement `_samples`.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, description: str, labels=()):
+        """
+        Args:
+            name: str - the metric's name.
+            description: str - the metric's help text.
+            labels: tuple[str] - the names of the metric's labels.
+        """
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+
+        # label values -> value
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels) -> tuple:
+        """
+        Gets the label values of a sample, in order.
+        """
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def render(self) -> str:
+        """
+        Renders the metric in the Prometheus text format.
+        """
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+        with self._lock:
+            values = [
+                (key, self._copy(value))
+                for key, value in self._values.items()
+            ]
+
+        for key, value in values:
+            for suffix, extra, sample in self._samples(value):
+                lines.append(
+                    f"{self.name}{suffix}"
+                    f"{_render_labels(self.labels, key, extra)} {sample}"
+                )
+
+        return "\n".join(lines) + "\n"
+
+    def _copy(self, value):
+        """
+        Copies a value, if it's updated in place.
+        """
+        return value
+
+    def _samples(self, value):
+        """
+        Gets the (name suffix, extra labels, value)
+        of each sample for a value.
+        """
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """
+    A count that only goes up.
+    """
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        """
+        Increments the count for the labels.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self, value):
+        return [("", (), value)]
+
+
+class Gauge(Metric):
+    """
+    A value that can go up and down.
+    """
+
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        """
+        Increments the value for the labels.
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        """
+        Decrements the value for the labels.
+        """
+        self.inc(-amount, **labels)
+
+    def _samples(self, value):
+        return [("", (), value)]
+
+
+class Histogram(Metric):
+    """
+    A distribution of observed values, counted
+    into cumulative buckets.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels=(),
+        buckets=DEFAULT_BUCKETS,
+    ):
+        """
+        Args:
+            name: str - the metric's name.
+            description: str - the metric's help text.
+            labels: tuple[str] - the names of the metric's labels.
+            buckets: tuple[float] - the upper bounds of the buckets,
+                                    ascending.
+        """
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        """
+        Records an observed value for the labels.
+        """
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(
+                key,
+                ([0] * (len(self.buckets) + 1), 0.0),
+            )
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self, value):
+        counts, total = value
+        samples = []
+
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            samples.append(("_bucket", (("le", le),), cumulative))
+
+        samples.append(("_sum", (), total))
+        samples.append(("_count", (), cumulative))
+        return samples
+
+    def _copy(self, value):
+        counts, total = value
+        return list(counts), total
+
+
+class Registry:
+    """
+    A set of metrics, rendered together.
+    """
+
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        Adds a metric to the registry, returning it.
+        """
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        Renders every metric in the Prometheus text format.
+        """
+        return "".join(metric.render() for metric in self.metrics)
+
+
+REGISTRY = Registry()
+
+CALLS = REGISTRY.register(Counter(
+    "rpc_calls_total",
+    "RPC calls sent by clients and received by servers.",
+    ("prefix", "side"),
+))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "rpc_in_flight",
+    "RPC calls sent and awaiting a response, or received and unanswered.",
+    ("prefix", "side"),
+))
+CALL_SECONDS = REGISTRY.register(Histogram(
+    "rpc_call_seconds",
+    "Time from a client sending a call to receiving its response.",
+    ("prefix",),
+))
+QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "rpc_queue_wait_seconds",
+    "Time from a call being published to a server receiving it.",
+    ("prefix",),
+))
+PROCESS_SECONDS = REGISTRY.register(Histogram(
+    "rpc_process_seconds",
+    "Time a server spends processing a call.",
+    ("prefix",),
+))
+RESPONSES = REGISTRY.register(Counter(
+    "rpc_responses_total",
+    "RPC responses sent by servers, by status code.",
+    ("prefix", "status"),
+))
+ERRORS = REGISTRY.register(Counter(
+    "rpc_errors_total",
+    "RPC calls that raised, timed out, or expired.",
+    ("prefix", "side", "kind"),
+))
+
+
+def start_http_server(
+    port=9100,
+    *,
+    host="0.0.0.0",
+    registry=REGISTRY,
+) -> ThreadingHTTPServer:
+    """
+    Serves the registry's metrics at /metrics
+    from a daemon thread.
+
+    Args:
+        port: int - the port to listen on (default 9100).
+        host: str - the address to listen on (default all).
+        registry: Registry - the metrics to serve (default REGISTRY).
+
+    Returns:
+        ThreadingHTTPServer - the server, which can be shut down.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        """
+        Responds to GET /metrics with the registry.
+        """
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            """
+            Serves the metrics.
+            """
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _render_labels(names, values, extra=()) -> str:
+    """
+    Renders label names and values as {name="value",...}.
+    """
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+
+    return "{" + ",".join(
+        f'{name}="{_escape(value)}"' for name, value in pairs
+    ) + "}"
+
+
+def _escape(value) -> str:
+    """
+    Escapes a label value.
+    """
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\n", "\\n")
+        .replace('"', '\\"')
+    )
@@ -26,3 +26,25 @@ class PingRPCClient(rpcs.RPCClient):
         )
 
         return self._call(body=req)
+
+
+class AsyncPingRPCClient(rpcs.AsyncRPCClient):
+    """
+    Sub-class of async RPC client which just
+    sends "Ping!".
+    """
+
+    async def call(self, service, *args, **kwargs):
+        """
+        Send "Ping!" to server.
+        """
+        req = rpcs.request(
+            "",
+            "1.0.0",
+            service,
+            data={
+                "message": "Ping!"
+            }
+        )
+
+        return await self._call(body=req)
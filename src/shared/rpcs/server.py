@@ -0,0 +1,974 @@
+"""
+Base class for RPC servers, see the `shared.rpcs`
+module docstring.
+
+Provides:
+    RPCServer -- base class of RPC servers.
+    CallInfo -- what a server needs to know of a call to process it.
+"""
+
+import hashlib
+import json
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import NamedTuple
+
+import pika
+
+from shared.rpcs import metrics, tracing
+from shared.rpcs.cache import ResponseCache
+from shared.rpcs.codec import JSON, get_codec
+from shared.rpcs.compression import compress, decompress
+from shared.rpcs.messages import (
+    BATCH,
+    DEADLINE_HEADER,
+    PUBLISHED_HEADER,
+    _expired,
+    _is_direct_reply,
+    batch,
+    response,
+    unbatch,
+)
+from shared.rpcs.stream import (
+    CREDIT_HEADER,
+    SEQ_HEADER,
+    STREAM,
+    STREAM_CHUNK,
+    STREAM_CREDIT,
+    STREAM_END,
+    OpenStreams,
+    Stream,
+)
+from shared.rpcs.transport import RabbitMQTransport, Transport
+
+
+class CallInfo(NamedTuple):
+    """
+    What a server needs to know of a call, besides
+    its body, to process it.
+    """
+
+    content_type: str | None = None
+    content_encoding: str | None = None
+    is_batch: bool = False
+    deadline: float | None = None
+    trace_context: tracing.SpanContext | None = None
+
+    @classmethod
+    def from_properties(cls, props):
+        """
+        Gets the info of a call from its
+        `pika.BasicProperties`.
+        """
+        headers = props.headers or {}
+        return cls(
+            content_type=props.content_type,
+            content_encoding=props.content_encoding,
+            is_batch=props.type == BATCH,
+            deadline=headers.get(DEADLINE_HEADER),
+            trace_context=tracing.extract(headers),
+        )
+
+
+class RPCServer(ABC):
+    """
+    Abstract base class for an RPC serer.
+    Connects to RabbitMQ and creates a consumer on
+    it's RPC call queue.
+
+    A sub-class must implement the abstract
+    method `process` which should process a request
+    and return the response.
+
+    With `use_processes`, processing times, response statuses
+    and errors are recorded in the worker processes, so aren't
+    in the metrics of the server's process.
+
+    To start an RPC server, you can do (for example):
+        rpc_server = PingRPCServer(
+            os.environ["RABBITMQ_USERNAME"],
+            os.environ["RABBITMQ_PASSWORD"],
+            "ping-rpc",
+        )
+
+        rpc_server.channel.start_consuming()
+
+    By default calls are processed one at a time on the
+    connection's thread. Passing `workers` processes calls
+    concurrently in a pool of that many threads (or processes,
+    with `use_processes`), with at most `workers` unacknowledged
+    calls delivered at once. Calls are only acknowledged once
+    their response has been published.
+
+    When using processes, the server is copied into each worker
+    once, as it starts, without its connection, and only each
+    call's body and `CallInfo` are sent to it, so per-process
+    resources (e.g. a Scylla session) should be set up by
+    `initializer`, which is run in the worker after.
+
+    If `decode_requests` is set, `process` is given the request
+    already decoded by the codec of its content type, and may
+    return the response as a dict (e.g. from
+    `response(..., codec=None)`) to have it encoded with the
+    same codec.
+
+    If `compression` is set to a content encoding, responses of
+    at least `compression_threshold` bytes are compressed with it.
+    Compressed requests are always decompressed.
+
+    Passing a `cache` (see `shared.rpcs.cache`) answers requests
+    with the same `cache_key` from the cache for `cache_ttl`
+    seconds, so should only be used for idempotent RPCs.
+    Requests are keyed on their normalized body by default,
+    sub-classes may override `cache_key` to key on part of
+    it, or to not cache some requests. When using processes,
+    each worker looks up its own copy of the cache (see
+    `shared.rpcs.cache` for what each cache shares).
+
+    If `confirm_replies` is set, responses are published in
+    transactions along with the acknowledgement of their calls,
+    so a call is only acknowledged once the broker has accepted
+    its response, and otherwise is redelivered. Responses are
+    committed in batches of up to `reply_batch_size`, or after
+    `reply_batch_interval` seconds, bounding how many are
+    outstanding at once.
+
+    Streaming calls are processed by `process_stream`, which
+    yields the chunks of the response, and is only advanced as
+    far as the client has granted credit for. Chunks are
+    produced in the pool when it uses threads. Streams the
+    client stops granting credit to are ended with a 408 chunk
+    once idle for `stream_timeout` seconds. Servers overriding
+    `process_stream` declare their own queue to be granted
+    credit on, so need permission to configure and read
+    `{rpc_prefix}-stream-q-.*`, and clients to write to the
+    default exchange.
+    """
+
+    decode_requests = False
+    compression = None
+    compression_threshold = 4096
+    cache_ttl = None
+    confirm_replies = False
+    reply_batch_size = 32
+    reply_batch_interval = 0.01
+    stream_timeout = 60
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        rabbitmq_user,
+        rabbitmq_pass,
+        rpc_prefix,
+        *,
+        workers=0,
+        use_processes=False,
+        initializer=None,
+        cache: ResponseCache | None = None,
+        transport: Transport | None = None,
+    ):
+        """
+        Connects to RabbitMQ with provided credentialsa and
+        creates a consumer determined by `rpc_prefix` using
+        the convention described in the module docstring.
+
+        Passing a `transport` (see `shared.rpcs.transport`)
+        connects through it instead, ignoring the credentials.
+        """
+        self.rpc_prefix = rpc_prefix
+        self.cache = cache
+        if transport is None:
+            transport = RabbitMQTransport(rabbitmq_user, rabbitmq_pass)
+        self.connection, self.channel = transport.connect()
+
+        self.executor = None
+        if use_processes and workers:
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(self, initializer),
+            )
+        elif workers:
+            self.executor = ThreadPoolExecutor(
+                max_workers=workers,
+                initializer=initializer,
+            )
+
+        self._replies = _ReplyBatch()
+
+        # streams are granted credit on the server's own queue,
+        # as the call queue may be consumed by other replicas
+        self.streams = OpenStreams()
+        if type(self).process_stream is not RPCServer.process_stream:
+            self.streams.queue = self.channel.queue_declare(
+                queue=f"{rpc_prefix}-stream-q-{uuid.uuid4()}",
+                exclusive=True,
+            ).method.queue
+            self.channel.basic_consume(
+                queue=self.streams.queue,
+                on_message_callback=self.on_credit,
+                auto_ack=True,
+            )
+
+        if self.confirm_replies:
+            self.channel.tx_select()
+            self.channel.basic_qos(
+                prefetch_count=workers + self.reply_batch_size
+            )
+        elif workers:
+            self.channel.basic_qos(prefetch_count=workers)
+
+        self.channel.basic_consume(
+            queue=f"{rpc_prefix}-call-q",
+            on_message_callback=self.on_call,
+            auto_ack=not self.manual_ack,
+        )
+
+    def __getstate__(self):
+        """
+        Drops the connection and pool when pickled
+        into a worker process as it starts, as they
+        can't be shared.
+        """
+        state = self.__dict__.copy()
+        for attr in ("connection", "channel", "executor"):
+            state[attr] = None
+        state["_replies"] = _ReplyBatch()
+        state["streams"] = OpenStreams()
+        return state
+
+    @property
+    def manual_ack(self) -> bool:
+        """
+        Whether calls are only acknowledged once responded
+        to, if processed by the pool or responses are
+        confirmed.
+        """
+        return self.executor is not None or self.confirm_replies
+
+    def on_call(self, ch, method, props, body):
+        """
+        Generic implementation of an RPC call receiver,
+        called whenever a message is received in the
+        call queue.
+
+        Calls past their deadline are dropped, both on
+        receipt and (with a pool) once a worker is free.
+        """
+        self._record_received(props)
+
+        call = CallInfo.from_properties(props)
+
+        if _expired(call.deadline):
+            logging.warning("[from %s, id %s] dropped expired call",
+                            props.reply_to, props.correlation_id)
+            metrics.ERRORS.inc(prefix=self.rpc_prefix, side="server",
+                               kind="expired")
+            self._reply(ch, method, props)
+            return
+
+        if props.type in (STREAM, STREAM_CREDIT):
+            self._on_stream(ch, method, props, body)
+            return
+
+        if self.executor is None:
+            try:
+                result = self._handle(body, call)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                # answered rather than stopping the consumer
+                print(e)
+                result = (
+                    _error(500, "Internal Server Error", call.content_type),
+                    None,
+                )
+            self._reply(ch, method, props, *(result or ()))
+            return
+
+        if isinstance(self.executor, ProcessPoolExecutor):
+            # the worker has its own copy of the server
+            future = self.executor.submit(_handle_in_worker, body, call)
+        else:
+            future = self.executor.submit(self._handle, body, call)
+
+        # pika isn't thread safe, so the response must be
+        # published from the connection's thread
+        future.add_done_callback(
+            lambda f: self.connection.add_callback_threadsafe(
+                partial(self._on_processed, ch, method, props, f)
+            )
+        )
+
+    def on_credit(self, _ch, _method, props, _body):
+        """
+        Adds the credit granted through the server's
+        stream queue to its stream, or closes the
+        stream if no credit is granted.
+        """
+        try:
+            credit = int((props.headers or {}).get(CREDIT_HEADER, 0))
+        except (TypeError, ValueError):
+            credit = 0
+
+        self._add_credit(props.correlation_id, credit)
+
+    def _record_received(self, props):
+        """
+        Records the metrics of a received call,
+        including its wait in the queue.
+        """
+        metrics.CALLS.inc(prefix=self.rpc_prefix, side="server")
+        metrics.IN_FLIGHT.inc(prefix=self.rpc_prefix, side="server")
+
+        published = (props.headers or {}).get(PUBLISHED_HEADER)
+        try:
+            published = float(published)
+        except (TypeError, ValueError):
+            return
+
+        now = time.time()
+        metrics.QUEUE_WAIT_SECONDS.observe(
+            max(0.0, now - published),
+            prefix=self.rpc_prefix,
+        )
+        tracing.start_span(
+            "queue wait",
+            parent=tracing.extract(props.headers),
+            start=min(published, now),
+        ).end(now)
+
+    def _on_stream(self, ch, method, props, body):
+        """
+        Opens a stream, or adds to the credit of a
+        stream, acknowledging the message.
+        """
+        try:
+            credit = int((props.headers or {}).get(CREDIT_HEADER, 1))
+        except (TypeError, ValueError):
+            credit = 1
+
+        self._reply(ch, method, props)
+
+        if props.type == STREAM:
+            self.streams[props.correlation_id] = (
+                self._open_stream(props, body)
+            )
+            self._schedule_sweep()
+
+        self._add_credit(props.correlation_id, credit)
+
+    def _add_credit(self, corr_id, credit):
+        """
+        Adds credit to a stream, sending the chunks it
+        now has credit for, or closes it if no credit
+        is granted. Credit granted while producing
+        chunks is used once they're sent.
+        """
+        stream = self.streams.get(corr_id)
+        if stream is None or credit <= 0:
+            self._close_stream(corr_id)
+            return
+
+        stream.credit += credit
+        if not stream.busy:
+            self._step_stream(stream)
+
+    def _step_stream(self, stream):
+        """
+        Produces and sends as many chunks of a stream
+        as it has credit for.
+        """
+        credit, stream.credit = stream.credit, 0
+        stream.busy = True
+
+        # generators can't be sent to other processes
+        if not isinstance(self.executor, ThreadPoolExecutor):
+            self._send_chunks(stream, self._stream_step(stream, credit))
+            return
+
+        future = self.executor.submit(self._stream_step, stream, credit)
+        future.add_done_callback(
+            lambda f: self.connection.add_callback_threadsafe(
+                partial(self._send_chunks, stream, f.result())
+            )
+        )
+
+    def _open_stream(self, props, body):
+        """
+        Decompresses and decodes a streaming call,
+        returning its stream, which responds with a
+        single error chunk if the call is bad.
+        """
+        try:
+            codec = get_codec(props.content_type)
+        except ValueError:
+            return Stream(
+                iter([response(400, {"reason": "Unsupported content type."})]),
+                JSON,
+                props,
+            )
+
+        try:
+            body = decompress(body, props.content_encoding)
+        except ValueError:
+            return Stream(
+                iter([response(400, {"reason": "Bad content encoding."},
+                               codec=None)]),
+                codec,
+                props,
+            )
+
+        if self.decode_requests:
+            try:
+                body = codec.decode(body)
+            except ValueError:
+                return Stream(
+                    iter([response(400, {"reason": f"Bad {codec.name}."},
+                                   codec=None)]),
+                    codec,
+                    props,
+                )
+
+        try:
+            chunks = iter(self.process_stream(body))
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            print(e)
+            chunks = iter([response(500, {"reason": "Internal Server Error"},
+                                    codec=None)])
+
+        return Stream(chunks, codec, props)
+
+    def _stream_step(self, stream, credit):
+        """
+        Produces up to `credit` chunks of a stream,
+        returning the (possibly) compressed chunks with
+        their content encodings, and whether the stream
+        has ended. A chunk raising, or failing to encode,
+        ends the stream with a 500.
+        """
+        chunks = []
+        done = False
+
+        for _ in range(credit):
+            try:
+                chunk = next(stream.chunks)
+            except StopIteration:
+                done = True
+                break
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                print(e)
+                chunk = response(
+                    500,
+                    {"reason": "Internal Server Error"},
+                    codec=None,
+                )
+                done = True
+
+            if isinstance(chunk, dict):
+                try:
+                    chunk = stream.codec.encode(chunk)
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    print(e)
+                    chunk = stream.codec.encode(response(
+                        500,
+                        {"reason": "Internal Server Error"},
+                        codec=None,
+                    ))
+                    done = True
+
+            chunks.append(
+                compress(chunk, self.compression, self.compression_threshold)
+            )
+
+            if done:
+                break
+
+        return chunks, done
+
+    def _send_chunks(self, stream, result):
+        """
+        Publishes the chunks produced by a step of
+        a stream, ending it if it's done, then takes
+        another step if it was granted more credit
+        meanwhile.
+        """
+        chunks, done = result
+        stream.busy = False
+        stream.last_active = time.monotonic()
+
+        if self.streams.get(stream.props.correlation_id) is not stream:
+            # cancelled while producing the chunks
+            stream.close()
+            return
+
+        self._publish_chunks(self.channel, stream, chunks, done)
+
+        if self.confirm_replies:
+            # the chunks aren't sent with any reply to commit them
+            self.channel.tx_commit()
+
+        if not done and stream.credit > 0:
+            self._step_stream(stream)
+
+    def _publish_chunks(self, ch, stream, chunks, done):
+        """
+        Publishes (possibly) compressed chunks of a
+        stream with their content encodings, then
+        ends it if it's done.
+        """
+        for chunk, content_encoding in chunks:
+            self._respond(
+                ch, stream.props, chunk, content_encoding,
+                type_=STREAM_CHUNK,
+                headers={SEQ_HEADER: stream.seq},
+                reply_to=self.streams.queue,
+            )
+            stream.seq += 1
+
+        if done:
+            self._respond(
+                ch, stream.props, b"",
+                type_=STREAM_END,
+                headers={SEQ_HEADER: stream.seq},
+                reply_to=self.streams.queue,
+            )
+            self.streams.pop(stream.props.correlation_id, None)
+
+    def _close_stream(self, corr_id):
+        """
+        Closes a stream, unless it's producing chunks,
+        in which case it's closed once they're produced.
+        """
+        stream = self.streams.pop(corr_id, None)
+        if stream is not None and not stream.busy:
+            stream.close()
+
+    def _schedule_sweep(self):
+        """
+        Schedules `_sweep_streams` for when the next
+        open stream could become idle, if not already
+        scheduled.
+        """
+        if self.streams.sweep_timer is not None or not self.streams:
+            return
+
+        self.streams.sweep_timer = self.connection.call_later(
+            self.streams.idle_in(self.stream_timeout),
+            self._sweep_streams,
+        )
+
+    def _sweep_streams(self):
+        """
+        Ends every stream idle for longer than
+        `stream_timeout` with a 408 chunk, so its
+        client isn't left waiting for chunks.
+        """
+        self.streams.sweep_timer = None
+
+        idle = self.streams.pop_idle(self.stream_timeout)
+        for stream in idle:
+            logging.warning("[id %s] closed idle stream",
+                            stream.props.correlation_id)
+            stream.close()
+
+            timed_out = response(
+                408,
+                {"reason": "Stream timed out."},
+                codec=None,
+            )
+            self._publish_chunks(
+                self.channel,
+                stream,
+                [
+                    compress(
+                        stream.codec.encode(timed_out),
+                        self.compression,
+                        self.compression_threshold,
+                    )
+                ],
+                done=True,
+            )
+
+        if idle and self.confirm_replies:
+            # the chunks aren't sent with any reply to commit them
+            self.channel.tx_commit()
+
+        self._schedule_sweep()
+
+    def _handle(self, body, call: CallInfo):
+        """
+        Decompresses and processes the body, returning
+        the (possibly) compressed response and its
+        content encoding, or None if the call is past
+        its deadline.
+
+        Processing is traced as a child of the call's
+        trace context, as context isn't carried into
+        worker threads.
+        """
+        if _expired(call.deadline):
+            return None
+
+        try:
+            body = decompress(body, call.content_encoding)
+        except ValueError:
+            resp = _error(400, "Bad content encoding.", call.content_type)
+        else:
+            process = self._process_batch if call.is_batch else self._process
+            with tracing.span(
+                "process",
+                parent=call.trace_context,
+                side="server",
+                batch=call.is_batch,
+            ):
+                resp = process(body, call.content_type)
+
+        return compress(resp, self.compression, self.compression_threshold)
+
+    def _process(self, body, content_type=None):
+        """
+        Processes the body, responding with a 500
+        if processing, or encoding the response,
+        raises.
+        """
+        try:
+            codec = get_codec(content_type)
+        except ValueError:
+            return _error(400, "Unsupported content type.")
+
+        key = None
+        try:
+            if self.decode_requests:
+                try:
+                    body = codec.decode(body)
+                except ValueError:
+                    self._record_status(400)
+                    return _error(400, f"Bad {codec.name}.", content_type)
+
+            if self.cache is not None:
+                key = self._cache_key(body, codec)
+                if key is not None:
+                    cached = self.cache.get(key)
+                    if cached is not None:
+                        return cached
+
+            start = time.perf_counter()
+            try:
+                resp = self.process(body)
+            finally:
+                metrics.PROCESS_SECONDS.observe(
+                    time.perf_counter() - start,
+                    prefix=self.rpc_prefix,
+                )
+
+            status = None
+            if isinstance(resp, dict):
+                # e.g. a value the codec can't encode raises
+                status = resp.get("status")
+                resp = codec.encode(resp)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            print(e)
+            metrics.ERRORS.inc(prefix=self.rpc_prefix, side="server",
+                               kind="error")
+            self._record_status(500)
+            return _error(500, "Internal Server Error", content_type)
+
+        self._record_status(status)
+
+        if key is not None:
+            self.cache.set(key, resp, self.cache_ttl)
+
+        return resp
+
+    def _record_status(self, status):
+        """
+        Counts a response by its status code, which
+        is only known for responses returned as dicts.
+        """
+        metrics.RESPONSES.inc(
+            prefix=self.rpc_prefix,
+            status="unknown" if status is None else status,
+        )
+
+    def _cache_key(self, body, codec):
+        """
+        Gets the full cache key of a request, scoped
+        to this RPC and the codec of its response, or
+        None if it shouldn't be cached.
+        """
+        if not self.decode_requests:
+            try:
+                body = codec.decode(body)
+            except ValueError:
+                return None
+
+        key = self.cache_key(body)
+        if key is None:
+            return None
+
+        return f"{self.rpc_prefix}:{codec.content_type}:{key}"
+
+    def _process_batch(self, body, content_type=None):
+        """
+        Processes a batch body, responding with a batch
+        of 500s if processing the batch raises, or a
+        single 400 if it isn't a batch, as its length
+        isn't known (see `RPCClient.call_many`).
+        """
+        try:
+            bodies = [item.encode() for item in unbatch(body)]
+        except ValueError:
+            return _error(400, "Bad batch.", content_type)
+
+        try:
+            resps = self.process_batch(bodies)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            print(e)
+            resps = [
+                response(
+                    500,
+                    {"reason": "Internal Server Error"}
+                )
+            ] * len(bodies)
+
+        return batch(resps)
+
+    def _on_processed(self, ch, method, props, future):
+        """
+        Publishes the response of a call processed by
+        the pool, then acknowledges the call.
+        """
+        try:
+            result = future.result()
+            if result is None:
+                # expired while waiting for a worker
+                logging.warning("[from %s, id %s] dropped expired call",
+                                props.reply_to, props.correlation_id)
+                self._reply(ch, method, props)
+                return
+
+            resp, content_encoding = result
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            # e.g. a worker process died
+            print(e)
+            resp = _error(500, "Internal Server Error", props.content_type)
+            content_encoding = None
+
+        self._reply(ch, method, props, resp, content_encoding)
+
+    def _reply(  # pylint: disable=too-many-arguments
+        self,
+        ch,
+        method,
+        props,
+        resp=None,
+        content_encoding=None,
+    ):
+        """
+        Publishes the response to a call (if any) and
+        acknowledges the call if needed, or queues both
+        for the next commit when confirming replies.
+        """
+        metrics.IN_FLIGHT.dec(prefix=self.rpc_prefix, side="server")
+
+        if not self.confirm_replies:
+            if resp is not None:
+                self._respond(ch, props, resp, content_encoding)
+            if self.manual_ack:
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+            return
+
+        self._replies.replies.append(
+            (ch, method, props, resp, content_encoding)
+        )
+
+        if len(self._replies.replies) >= self.reply_batch_size:
+            self.flush_replies()
+        elif self._replies.timer is None:
+            self._replies.timer = self.connection.call_later(
+                self.reply_batch_interval,
+                self._on_flush_timer,
+            )
+
+    def _on_flush_timer(self):
+        """
+        Commits the responses queued since the
+        timer was started.
+        """
+        self._replies.timer = None
+        self.flush_replies()
+
+    def flush_replies(self):
+        """
+        Publishes every queued response and acknowledges
+        their calls in a single transaction.
+        """
+        if self._replies.timer is not None:
+            self.connection.remove_timeout(self._replies.timer)
+            self._replies.timer = None
+
+        replies = self._replies.take()
+        if not replies:
+            return
+
+        for ch, method, props, resp, content_encoding in replies:
+            if resp is not None:
+                self._respond(ch, props, resp, content_encoding)
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+
+        self.channel.tx_commit()
+
+    def _respond(  # pylint: disable=too-many-arguments
+        self,
+        ch,
+        props,
+        resp,
+        content_encoding=None,
+        *,
+        type_=None,
+        headers=None,
+        reply_to=None,
+    ):
+        """
+        Publishes the response to the caller's
+        response queue, with the message type of
+        the call unless `type_` is given, and
+        `reply_to` as its reply-to.
+        """
+        try:
+            content_type = get_codec(props.content_type).content_type
+        except ValueError:
+            content_type = JSON.content_type
+
+        exchange = f"{self.rpc_prefix}-resp-exc"
+        if _is_direct_reply(props.reply_to):
+            exchange = ""
+
+        with tracing.span("reply", parent=tracing.extract(props.headers)):
+            ch.basic_publish(
+                exchange=exchange,
+                routing_key=props.reply_to,
+                properties=pika.BasicProperties(
+                    correlation_id=props.correlation_id,
+                    content_type=content_type,
+                    content_encoding=content_encoding,
+                    type=props.type if type_ is None else type_,
+                    headers=headers,
+                    reply_to=reply_to,
+                ),
+                body=resp,
+            )
+        logging.info("[to %s, id %s] %s", props.reply_to,
+                     props.correlation_id, resp)
+
+    @abstractmethod
+    def process(self, body):
+        """
+        Should be implemented in sub-classes which
+        should take the body, process the request,
+        and then return the response.
+        """
+        raise NotImplementedError
+
+    def process_stream(self, body):  # pylint: disable=unused-argument
+        """
+        Should be overridden in sub-classes serving
+        streaming calls, as a generator which takes the
+        body and yields the chunks of the response.
+
+        By default responds with a single 501 chunk,
+        as the RPC doesn't serve streaming calls.
+        """
+        yield response(
+            501,
+            {"reason": "Streaming calls not supported."},
+            codec=None,
+        )
+
+    def cache_key(self, body):
+        """
+        Gets the key to cache the response to a request
+        under, given the decoded request.
+
+        By default a hash of the request normalized to
+        JSON with sorted keys, sub-classes may override
+        this to key on only part of the request (e.g. its
+        data), or return None to not cache the request.
+        """
+        normalized = json.dumps(
+            body,
+            sort_keys=True,
+            separators=(",", ":"),
+            default=str,
+        )
+        return hashlib.sha256(normalized.encode()).hexdigest()
+
+    def process_batch(self, bodies: list) -> list:
+        """
+        Processes a batch of request bodies, returning
+        an index-aligned list of responses.
+
+        By default processes each body with `process`,
+        sub-classes may override this to handle a batch
+        more efficiently (e.g. with a single query).
+        """
+        return [self._process(body) for body in bodies]
+
+
+class _ReplyBatch:  # pylint: disable=too-few-public-methods
+    """
+    Responses awaiting commit, when an `RPCServer`
+    confirms replies, with the timer to commit them by.
+    """
+
+    def __init__(self):
+        # (channel, method, properties, response, content encoding)
+        self.replies = []
+        self.timer = None
+
+    def take(self) -> list:
+        """
+        Empties the batch, returning its replies.
+        """
+        replies, self.replies = self.replies, []
+        return replies
+
+
+# the server processing calls in this worker process,
+# when the server uses processes
+_worker_server = None  # pylint: disable=invalid-name
+
+
+def _init_worker(server, initializer):
+    """
+    Installs a server in a new worker process,
+    then runs its `initializer`, if any.
+    """
+    global _worker_server  # pylint: disable=global-statement
+    _worker_server = server
+
+    if initializer is not None:
+        initializer()
+
+
+def _handle_in_worker(body, call):
+    """
+    Processes a call with the server installed
+    in this worker process.
+    """
+    return _worker_server._handle(body, call)  # pylint: disable=protected-access
+
+
+def _error(status, reason, content_type=None):
+    """
+    Forms an error response encoded with the codec of
+    the call's content type, or JSON if unsupported, as
+    `RPCServer._respond` labels the response.
+    """
+    try:
+        codec = get_codec(content_type)
+    except ValueError:
+        codec = JSON
+    return codec.encode(response(status, {"reason": reason}, codec=None))
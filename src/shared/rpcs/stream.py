@@ -0,0 +1,85 @@
+"""
+Streaming RPC calls, with credit-based flow control, see
+the `shared.rpcs` module docstring.
+
+Provides:
+    Stream -- state of a stream being sent by an `RPCServer`.
+    OpenStreams -- the streams an `RPCServer` is sending.
+"""
+
+import time
+
+STREAM = "stream"
+STREAM_CHUNK = "stream-chunk"
+STREAM_END = "stream-end"
+STREAM_CREDIT = "stream-credit"
+CREDIT_HEADER = "x-credit"
+SEQ_HEADER = "x-seq"
+
+
+class Stream:  # pylint: disable=too-few-public-methods
+    """
+    State of a stream being sent by an `RPCServer`.
+    """
+
+    def __init__(self, chunks, codec, props):
+        self.chunks = chunks
+        self.codec = codec
+
+        # of the call opening the stream, which chunks respond to
+        self.props = props
+        self.seq = 0
+
+        # chunks the client has granted credit for, not yet produced
+        self.credit = 0
+        self.busy = False
+        self.last_active = time.monotonic()
+
+    def close(self):
+        """
+        Closes the chunks' generator, if any.
+        """
+        close = getattr(self.chunks, "close", None)
+        if close is not None:
+            close()
+
+
+class OpenStreams(dict):
+    """
+    The streams an `RPCServer` is sending, by correlation
+    ID, with the queue it's granted credit for them on
+    and the timer it sweeps idle streams by.
+    """
+
+    def __init__(self, queue=None):
+        super().__init__()
+        self.queue = queue
+        self.sweep_timer = None
+
+    def idle_in(self, timeout) -> float:
+        """
+        Gets the seconds until a stream could have been
+        idle for `timeout` seconds. Streams producing
+        chunks are active until they're sent.
+        """
+        idle_since = [
+            stream.last_active
+            for stream in self.values()
+            if not stream.busy
+        ]
+        if not idle_since:
+            return timeout
+
+        return max(0, min(idle_since) + timeout - time.monotonic())
+
+    def pop_idle(self, timeout) -> list[Stream]:
+        """
+        Removes and returns every stream idle for
+        at least `timeout` seconds.
+        """
+        now = time.monotonic()
+        idle = [
+            corr_id for corr_id, stream in self.items()
+            if not stream.busy and now - stream.last_active >= timeout
+        ]
+        return [self.pop(corr_id) for corr_id in idle]
@@ -0,0 +1,288 @@
+"""
+Distributed tracing of RPC calls.
+
+Trace context is propagated between clients and servers
+in the W3C "traceparent" AMQP header. Clients record a
+span for each call and its publish, and servers record
+spans for the call's wait in the queue, its processing
+and its reply, as children of the client's call span.
+
+Spans are only recorded once an exporter is set with
+`set_exporter`, context is always propagated.
+
+Provides:
+    SpanContext -- the trace and span IDs of a span.
+    Span -- a timed operation within a trace.
+    span -- record a span around a block, as the current span.
+    start_span -- start a span without making it current.
+    current -- get the context of the current span.
+    use_context -- make a span context current for a block.
+    inject -- add a span context to AMQP headers.
+    extract -- get a span context from AMQP headers.
+    MemoryExporter -- keep spans in memory, e.g. for tests.
+    FileExporter -- append spans to a file as JSON lines.
+    set_exporter -- set the exporter spans are recorded with.
+"""
+
+import contextvars
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import NamedTuple
+
+TRACEPARENT_HEADER = "traceparent"
+
+
+class SpanContext(NamedTuple):
+    """
+    The trace and span IDs of a span, as hex.
+    """
+
+    trace_id: str
+    span_id: str
+
+
+class Span:
+    """
+    A timed operation within a trace.
+    """
+
+    def __init__(self, name, context, parent_id=None, start=None, **attributes):
+        """
+        Args:
+            name: str - the operation's name.
+            context: SpanContext - the span's IDs.
+            parent_id: str | None - the parent span's ID.
+            start: float | None - the Unix start time (default now).
+            attributes - extra attributes of the span.
+        """
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.start = time.time() if start is None else start
+        self.end_time = None
+        self.attributes = attributes
+
+    def end(self, end=None):
+        """
+        Ends the span, exporting it.
+
+        Args:
+            end: float | None - the Unix end time (default now).
+        """
+        if self.end_time is not None:
+            return
+
+        self.end_time = time.time() if end is None else end
+
+        exporter = _exporter
+        if exporter is not None:
+            exporter.export(self)
+
+    def to_dict(self) -> dict:
+        """
+        Gets the span as a JSON-serialisable dict.
+        """
+        return {
+            "name": self.name,
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "end": self.end_time,
+            "attributes": self.attributes,
+        }
+
+
+class MemoryExporter:
+    """
+    Keeps exported spans in memory.
+    """
+
+    def __init__(self):
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    def export(self, exported: Span):
+        """
+        Keeps a span.
+        """
+        with self._lock:
+            self.spans.append(exported)
+
+    def clear(self):
+        """
+        Drops every kept span.
+        """
+        with self._lock:
+            self.spans.clear()
+
+
+class FileExporter:  # pylint: disable=too-few-public-methods
+    """
+    Appends exported spans to a file, one JSON object per line.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, exported: Span):
+        """
+        Appends a span to the file.
+        """
+        line = json.dumps(exported.to_dict(), default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+
+_exporter = None  # pylint: disable=invalid-name
+_current: contextvars.ContextVar = contextvars.ContextVar(
+    "rpc_span_context",
+    default=None,
+)
+
+
+def set_exporter(exporter):
+    """
+    Sets the exporter spans are recorded with,
+    None to stop recording spans.
+
+    Args:
+        exporter - an object with an `export(span)` method,
+                   e.g. MemoryExporter or FileExporter.
+    """
+    global _exporter  # pylint: disable=global-statement
+    _exporter = exporter
+
+
+def current() -> SpanContext | None:
+    """
+    Gets the context of the current span, if any.
+    """
+    return _current.get()
+
+
+def start_span(name, *, parent=None, start=None, **attributes) -> Span:
+    """
+    Starts a span, which must be ended with `Span.end`,
+    without making it current.
+
+    Args:
+        name: str - the operation's name.
+        parent: SpanContext | None - the parent span's context,
+                                     None to start a new trace.
+        start: float | None - the Unix start time (default now).
+        attributes - extra attributes of the span.
+
+    Returns:
+        Span - the started span.
+    """
+    trace_id = parent.trace_id if parent is not None else _new_id(128)
+    return Span(
+        name,
+        SpanContext(trace_id, _new_id(64)),
+        parent.span_id if parent is not None else None,
+        start,
+        **attributes,
+    )
+
+
+@contextmanager
+def span(name, *, parent=None, **attributes):
+    """
+    Records a span around a block, as the current span,
+    recording any exception raised as its error.
+
+    Args:
+        name: str - the operation's name.
+        parent: SpanContext | None - the parent span's context
+                                     (default the current span).
+        attributes - extra attributes of the span.
+
+    Yields:
+        Span - the span.
+    """
+    if parent is None:
+        parent = _current.get()
+
+    recorded = start_span(name, parent=parent, **attributes)
+    token = _current.set(recorded.context)
+    try:
+        yield recorded
+    except BaseException as e:
+        recorded.attributes["error"] = repr(e)
+        raise
+    finally:
+        _current.reset(token)
+        recorded.end()
+
+
+@contextmanager
+def use_context(context):
+    """
+    Makes a span context current for a block, e.g.
+    one extracted from headers or passed to a worker.
+    """
+    token = _current.set(context)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def inject(headers: dict, context=None) -> dict:
+    """
+    Adds a span context to AMQP headers.
+
+    Args:
+        headers: dict - the headers to add to.
+        context: SpanContext | None - the context to add
+                                      (default the current span).
+
+    Returns:
+        dict - the headers.
+    """
+    if context is None:
+        context = _current.get()
+
+    if context is not None:
+        headers[TRACEPARENT_HEADER] = (
+            f"00-{context.trace_id}-{context.span_id}-01"
+        )
+
+    return headers
+
+
+def extract(headers) -> SpanContext | None:
+    """
+    Gets the span context from AMQP headers.
+
+    Args:
+        headers: dict | None - the message's headers.
+
+    Returns:
+        SpanContext | None - the context, None if there is no
+                             valid context in the headers.
+    """
+    traceparent = (headers or {}).get(TRACEPARENT_HEADER)
+    if isinstance(traceparent, bytes):
+        traceparent = traceparent.decode(errors="replace")
+    if not isinstance(traceparent, str):
+        return None
+
+    parts = traceparent.split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+
+    return SpanContext(parts[1], parts[2])
+
+
+def _new_id(bits) -> str:
+    """
+    Generates a random, non-zero ID of the given size as hex.
+    """
+    return f"{random.getrandbits(bits) or 1:0{bits // 4}x}"
@@ -0,0 +1,113 @@
+"""
+Transports opening the connections RPC clients and servers
+communicate over.
+
+A transport's connections and channels must implement the
+subset of pika's `BlockingConnection` and `BlockingChannel`
+used by `shared.rpcs`, and route messages by the exchange,
+queue and reply-to naming convention in its module docstring.
+
+Provides:
+    Transport -- base class of transports.
+    RabbitMQTransport -- connections to RabbitMQ (the default).
+    MemoryTransport -- connections to an in-process broker.
+"""
+
+from abc import ABC, abstractmethod
+
+import shared
+from shared.rpcs.memory import MemoryBroker
+
+
+class Transport(ABC):  # pylint: disable=too-few-public-methods
+    """
+    Opens connections for RPC clients and servers.
+
+    A sub-class must implement the abstract method
+    `connect`.
+    """
+
+    @abstractmethod
+    def connect(self) -> tuple:
+        """
+        Opens a channel for a client or server.
+
+        Returns:
+            tuple - the connection and a channel opened on it.
+        """
+
+
+class RabbitMQTransport(Transport):  # pylint: disable=too-few-public-methods
+    """
+    Connects to RabbitMQ, through `shared.setup_rabbitmq`.
+    """
+
+    def __init__(
+        self,
+        rabbitmq_user,
+        rabbitmq_pass,
+        *,
+        host=shared.RABBITMQ_HOST,
+        pooled=False,
+    ):
+        """
+        Args:
+            rabbitmq_user: str - username for RabbitMQ connections.
+            rabbitmq_pass: str - password for RabbitMQ connections.
+            host: str - host of the RabbitMQ service.
+            pooled: bool - open channels on connections from the
+                           process-wide pool (default False).
+        """
+        self.rabbitmq_user = rabbitmq_user
+        self.rabbitmq_pass = rabbitmq_pass
+        self.host = host
+        self.pooled = pooled
+
+    def connect(self) -> tuple:
+        return shared.setup_rabbitmq(
+            self.rabbitmq_user,
+            self.rabbitmq_pass,
+            host=self.host,
+            pooled=self.pooled,
+        )
+
+
+class MemoryTransport(Transport):
+    """
+    Connects to an in-process broker (see `shared.rpcs.memory`),
+    so clients and servers in one process can call each other
+    without RabbitMQ, e.g. in tests and benchmarks.
+
+    Each RPC must be declared on the transport, as its k8s
+    yaml declares it in RabbitMQ, before its server starts
+    consuming.
+
+    For example:
+        transport = MemoryTransport()
+        transport.declare_rpc("ping-rpc")
+
+        server = PingRPCServer(None, None, "ping-rpc", transport=transport)
+        client = PingRPCClient(None, None, "ping-rpc", transport=transport)
+    """
+
+    def __init__(self, broker: MemoryBroker | None = None):
+        """
+        Args:
+            broker: MemoryBroker | None - the broker to connect to
+                                          (default a new broker).
+        """
+        self.broker = broker if broker is not None else MemoryBroker()
+
+    def declare_rpc(self, rpc_prefix):
+        """
+        Declares the exchanges, call queue and
+        binding of an RPC on the broker.
+
+        Args:
+            rpc_prefix: str - the RPC's prefix.
+        """
+        self.broker.declare_rpc(rpc_prefix)
+
+    def connect(self) -> tuple:
+        connection = self.broker.connect()
+        return connection, connection.channel()
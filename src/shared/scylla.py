@@ -0,0 +1,327 @@
+"""
+Data access helpers for ScyllaDB sessions,
+as created by `shared.setup_scylla`.
+
+Provides:
+    prepare -- get a cached prepared statement for a query.
+    write_concurrent -- write many rows with a bounded number in flight.
+    write_batched -- write many rows in unlogged batches per partition.
+    iter_rows -- iterate over the rows of a query page by page.
+    WriteBehind -- write rows in the background, in batches.
+"""
+
+import functools
+import logging
+import queue
+import threading
+import time
+import weakref
+from collections import defaultdict
+
+import cassandra.cluster as cc
+import cassandra.concurrent as ccon
+import cassandra.query as cq
+
+# session -> query -> prepared statement
+_statements = weakref.WeakKeyDictionary()
+_statements_lock = threading.Lock()
+
+
+def prepare(session: cc.Session, query: str) -> cq.PreparedStatement:
+    """
+    Gets the prepared statement for a query, preparing
+    it on first use and caching it for the session.
+
+    Args:
+        session: cassandra.cluster.Session -- the session to prepare on.
+        query: str -- the CQL query, with ? placeholders.
+
+    Returns:
+        cassandra.query.PreparedStatement -- the prepared statement.
+    """
+    with _statements_lock:
+        statements = _statements.setdefault(session, {})
+        statement = statements.get(query)
+
+    if statement is None:
+        # preparing twice in a race is harmless
+        statement = session.prepare(query)
+        with _statements_lock:
+            statements[query] = statement
+
+    return statement
+
+
+def write_concurrent(
+    session: cc.Session,
+    query: str,
+    rows,
+    *,
+    concurrency=100,
+    raise_on_first_error=True,
+) -> list:
+    """
+    Writes many rows with one prepared query, keeping at
+    most `concurrency` writes in flight at once.
+
+    Args:
+        session: cassandra.cluster.Session -- the session to write with.
+        query: str -- the CQL query, with ? placeholders.
+        rows: Iterable -- the parameters of each write.
+        concurrency: int -- the most writes in flight (default 100).
+        raise_on_first_error: bool -- raise the first failed write's
+                                      error, rather than returning it
+                                      (default True).
+
+    Returns:
+        list[tuple[bool, ResultSet | Exception]] -- the success and
+            result of each write, in order.
+    """
+    return ccon.execute_concurrent_with_args(
+        session,
+        prepare(session, query),
+        rows,
+        concurrency=concurrency,
+        raise_on_first_error=raise_on_first_error,
+    )
+
+
+def write_batched(  # pylint: disable=too-many-arguments
+    session: cc.Session,
+    query: str,
+    rows,
+    *,
+    max_batch_size=50,
+    concurrency=20,
+    raise_on_first_error=True,
+) -> list:
+    """
+    Writes many rows with one prepared query, grouped into
+    unlogged batches of rows of the same partition, so each
+    batch is sent straight to a replica of its partition.
+
+    Args:
+        session: cassandra.cluster.Session -- the session to write with.
+        query: str -- the CQL query, with ? placeholders.
+        rows: Iterable -- the parameters of each write.
+        max_batch_size: int -- the most rows in a batch (default 50).
+        concurrency: int -- the most batches in flight (default 20).
+        raise_on_first_error: bool -- raise the first failed batch's
+                                      error, rather than returning it
+                                      (default True).
+
+    Returns:
+        list[tuple[bool, ResultSet | Exception]] -- the success and
+            result of each batch.
+    """
+    statement = prepare(session, query)
+
+    # routing key -> bound statements for the partition
+    partitions = defaultdict(list)
+    for row in rows:
+        bound = statement.bind(row)
+        partitions[bound.routing_key].append(bound)
+
+    batches = []
+    for bounds in partitions.values():
+        for i in range(0, len(bounds), max_batch_size):
+            batch = cq.BatchStatement(batch_type=cq.BatchType.UNLOGGED)
+            for bound in bounds[i:i + max_batch_size]:
+                batch.add(bound)
+            batches.append((batch, None))
+
+    return ccon.execute_concurrent(
+        session,
+        batches,
+        concurrency=concurrency,
+        raise_on_first_error=raise_on_first_error,
+    )
+
+
+def iter_rows(
+    session: cc.Session,
+    query: str,
+    params=None,
+    *,
+    fetch_size=1000,
+):
+    """
+    Iterates over the rows of a prepared query, fetching
+    `fetch_size` rows at a time. The next page is fetched
+    while the current one is being iterated over.
+
+    Args:
+        session: cassandra.cluster.Session -- the session to read with.
+        query: str -- the CQL query, with ? placeholders.
+        params: Sequence | None -- the parameters of the query.
+        fetch_size: int -- the rows to fetch per page (default 1000).
+
+    Yields:
+        the rows, as formed by the session's row factory.
+    """
+    bound = prepare(session, query).bind(params or ())
+    bound.fetch_size = fetch_size
+
+    future = session.execute_async(bound)
+    while True:
+        page = future.result().current_rows
+        has_more_pages = future.has_more_pages
+
+        if has_more_pages:
+            future.start_fetching_next_page()
+
+        yield from page
+
+        if not has_more_pages:
+            return
+
+
+class WriteBehind:
+    """
+    Queues rows to write with one prepared query, and writes
+    them from a background thread once `batch_size` rows are
+    queued or `interval` seconds after the first was queued,
+    so callers don't wait on the write.
+
+    At most `max_pending` rows are queued, after which `put`
+    blocks until there is space. Writes are only attempted
+    once, failures are logged. Suited to audit and log-style
+    tables, where losing the queued rows on a crash is
+    acceptable.
+
+    For example:
+        pings = WriteBehind(
+            session,
+            "INSERT INTO pings (id, message) VALUES (?, ?);",
+        )
+
+        pings.put((uuid.uuid4(), "Ping!"))
+        ...
+        pings.close()
+    """
+
+    _CLOSE = object()
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        session: cc.Session,
+        query: str,
+        *,
+        batch_size=100,
+        interval=1.0,
+        max_pending=10000,
+        concurrency=100,
+    ):
+        """
+        Starts the background writer.
+
+        Args:
+            session: cassandra.cluster.Session -- the session to write with.
+            query: str -- the CQL query, with ? placeholders.
+            batch_size: int -- the rows to queue before writing
+                               (default 100).
+            interval: float -- the most seconds a row waits before
+                               being written (default 1.0).
+            max_pending: int -- the most rows to queue (default 10000).
+            concurrency: int -- the most writes in flight (default 100).
+        """
+        self.batch_size = batch_size
+        self.interval = interval
+
+        # writes a batch of rows, returning each write's result
+        self._write_rows = functools.partial(
+            write_concurrent,
+            session,
+            query,
+            concurrency=concurrency,
+            raise_on_first_error=False,
+        )
+
+        self.written = 0
+        self.failed = 0
+
+        self._rows = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def put(self, row, timeout=None):
+        """
+        Queues a row to be written, blocking while
+        the queue is full.
+
+        Args:
+            row: Sequence -- the parameters of the write.
+            timeout: float | None -- the most seconds to block,
+                                     None to block until there is
+                                     space (default None).
+
+        Raises:
+            queue.Full -- if there was no space within `timeout`.
+            RuntimeError -- if the writer is closed.
+        """
+        if not self._thread.is_alive():
+            raise RuntimeError("Write-behind writer is closed.")
+
+        self._rows.put(row, timeout=timeout)
+
+    def close(self, timeout=None):
+        """
+        Writes every queued row, then stops
+        the background writer.
+
+        Args:
+            timeout: float | None -- the most seconds to wait for
+                                     the queued rows to be written.
+        """
+        if self._thread.is_alive():
+            self._rows.put(self._CLOSE)
+            self._thread.join(timeout)
+
+    def _run(self):
+        """
+        Collects queued rows into batches and writes
+        them until closed.
+        """
+        closed = False
+        while not closed:
+            rows = []
+
+            row = self._rows.get()
+            deadline = time.monotonic() + self.interval
+
+            while True:
+                if row is self._CLOSE:
+                    closed = True
+                    break
+
+                rows.append(row)
+                if len(rows) >= self.batch_size:
+                    break
+
+                try:
+                    row = self._rows.get(
+                        timeout=max(0, deadline - time.monotonic())
+                    )
+                except queue.Empty:
+                    break
+
+            if rows:
+                self._write(rows)
+
+    def _write(self, rows):
+        """
+        Writes a batch of rows, logging any failures.
+        """
+        try:
+            results = self._write_rows(rows)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.error("Write-behind of %d rows failed: %s", len(rows), e)
+            self.failed += len(rows)
+            return
+
+        for success, result in results:
+            if success:
+                self.written += 1
+            else:
+                self.failed += 1
+                logging.error("Write-behind failed: %s", result)
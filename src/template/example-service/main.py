@@ -2,15 +2,14 @@
 Example service.
 """
 
-import json
 import os
 import logging
-
-import valkey
+import uuid
 
 import shared
 from shared import rpcs
 from shared.models import template as models
+from shared.scylla import WriteBehind
 
 
 class PingRPCServer(rpcs.RPCServer):
@@ -20,52 +19,79 @@ class PingRPCServer(rpcs.RPCServer):
     what.
     """
 
+    decode_requests = True
+
+    def __init__(self, *args, pings: WriteBehind, **kwargs):
+        """
+        Creates the server, writing received
+        pings through `pings`.
+        """
+        super().__init__(*args, **kwargs)
+        self.pings = pings
+
     def process(self, body):
         """
         Respond with "Pong!", unless message
         isn't "Ping!".
         """
-        logging.info("[RECEIVED] %s", body.decode())
-
-        # check json parses
-        try:
-            req = json.loads(body)
-        except json.JSONDecodeError:
-            return rpcs.response(
-                400,
-                {"reason": "Bad JSON."},
-            )
+        logging.info("[RECEIVED] %s", body)
 
         # parse message
         try:
             # version checking
-            if req["version"] != "1.0.0":
+            if body["version"] != "1.0.0":
                 return rpcs.response(
                     400,
-                    {"reason": "Bad version."}
+                    {"reason": "Bad version."},
+                    codec=None,
                 )
 
-            message = req["data"]["message"]
-            models.Pings.create(
-                message=message,
-            )
+            message = body["data"]["message"]
+            self.pings.put((uuid.uuid4(), message))
 
             if message == "Ping!":
                 return rpcs.response(
                     200,
-                    {"message": "Pong!"}
+                    {"message": "Pong!"},
+                    codec=None,
                 )
 
             return rpcs.response(
                 400,
-                {"message": "That's not a ping!"}
+                {"message": "That's not a ping!"},
+                codec=None,
             )
 
         # if any keys don't exist then request is malformed
         except KeyError:
             return rpcs.response(
                 400,
-                {"reason": "Malformed request."}
+                {"reason": "Malformed request."},
+                codec=None,
+            )
+
+    def process_stream(self, body):
+        """
+        Respond with "Pong!" once for each
+        of the requested count.
+        """
+        logging.info("[RECEIVED STREAM] %s", body)
+
+        try:
+            count = int(body["data"]["count"])
+        except (KeyError, TypeError, ValueError):
+            yield rpcs.response(
+                400,
+                {"reason": "Malformed request."},
+                codec=None,
+            )
+            return
+
+        for _ in range(count):
+            yield rpcs.response(
+                200,
+                {"message": "Pong!"},
+                codec=None,
             )
 
 
@@ -74,30 +100,38 @@ def main():
     Example main.
     """
     # Set up database session
-    _ = shared.setup_scylla(
+    session = shared.setup_scylla(
         keyspace=os.environ["SCYLLADB_KEYSPACE"],
         user=os.environ["SCYLLADB_USERNAME"],
         password=os.environ["SCYLLADB_PASSWORD"],
     )
 
-    r = valkey.Valkey(
-        host="valkey-example",
-        port="6379",
-        db=0,
-        username=os.environ["VALKEY_USERNAME"],
-        password=os.environ["VALKEY_PASSWORD"],
+    r = shared.setup_valkey(
+        os.environ["VALKEY_USERNAME"],
+        os.environ["VALKEY_PASSWORD"],
     )
     r.set("test", "success")
     print(f"response: {r.get('test')}")
 
+    pings = WriteBehind(
+        session,
+        f"INSERT INTO {models.Pings.column_family_name(include_keyspace=False)}"
+        " (id, message) VALUES (?, ?);",
+    )
+
     rpc_server = PingRPCServer(
         os.environ["RABBITMQ_USERNAME"],
         os.environ["RABBITMQ_PASSWORD"],
         "ping-rpc",
+        workers=4,
+        pings=pings,
     )
 
     logging.info("Consuming...")
-    rpc_server.channel.start_consuming()
+    try:
+        rpc_server.channel.start_consuming()
+    finally:
+        pings.close()
 
 
 if __name__ == "__main__":
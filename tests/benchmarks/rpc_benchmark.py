@@ -0,0 +1,291 @@
+"""
+Load-generation and latency benchmark of `shared.rpcs`.
+
+Runs an echo RPC server, then drives it from client threads at
+each combination of concurrency and message size, reporting the
+throughput and p50/p99/p99.9 latency of each run.
+
+Runs against an in-process broker (see `shared.rpcs.transport`), so
+needs no cluster, or against RabbitMQ, e.g. a local container:
+    docker run -d --rm -p 5672:5672 rabbitmq:4
+
+Usage (with shared installed, e.g. `uv pip install -e src/shared`):
+    python tests/benchmarks/rpc_benchmark.py
+    python tests/benchmarks/rpc_benchmark.py --transport rabbitmq \\
+        --host localhost --user guest --password guest \\
+        --concurrency 1,16,64 --sizes 64,4096,65536 --workers 8
+"""
+
+import argparse
+import json
+import math
+import threading
+import time
+import uuid
+
+from shared import rpcs
+from shared.rpcs.transport import MemoryTransport, RabbitMQTransport
+
+
+class EchoRPCServer(rpcs.RPCServer):
+    """
+    Responds to every call with its payload.
+    """
+
+    decode_requests = True
+
+    def process(self, body):
+        return rpcs.response(
+            200,
+            {"payload": body["data"]["payload"]},
+            codec=None,
+        )
+
+
+class EchoRPCClient(rpcs.RPCClient):
+    """
+    Calls the echo RPC.
+    """
+
+    def call(self, payload, *args, **kwargs):  # pylint: disable=arguments-differ
+        """
+        Calls the echo RPC with a payload.
+        """
+        return self._call(
+            rpcs.request("", "1.0.0", "benchmark", {"payload": payload})
+        )
+
+
+def memory_transport(rpc_prefix) -> MemoryTransport:
+    """
+    Gets a transport to a new in-process broker
+    with the RPC declared.
+    """
+    transport = MemoryTransport()
+    transport.declare_rpc(rpc_prefix)
+    return transport
+
+
+def rabbitmq_transport(rpc_prefix, user, password, host) -> RabbitMQTransport:
+    """
+    Gets a transport to RabbitMQ, declaring the RPC's
+    (auto-deleted) exchanges and call queue, as its
+    k8s yaml would.
+    """
+    transport = RabbitMQTransport(user, password, host=host)
+
+    connection, channel = transport.connect()
+    for exchange in (f"{rpc_prefix}-call-exc", f"{rpc_prefix}-resp-exc"):
+        channel.exchange_declare(exchange, "direct", auto_delete=True)
+    channel.queue_declare(f"{rpc_prefix}-call-q", auto_delete=True)
+    channel.queue_bind(
+        f"{rpc_prefix}-call-q",
+        f"{rpc_prefix}-call-exc",
+        f"{rpc_prefix}-call-q",
+    )
+    connection.close()
+
+    return transport
+
+
+def start_server(transport, rpc_prefix, workers) -> EchoRPCServer:
+    """
+    Starts the echo server consuming in a daemon thread.
+    """
+    server = EchoRPCServer(
+        None,
+        None,
+        rpc_prefix,
+        workers=workers,
+        transport=transport,
+    )
+    threading.Thread(target=server.channel.start_consuming, daemon=True).start()
+    return server
+
+
+def stop_server(server: EchoRPCServer):
+    """
+    Stops the echo server consuming.
+    """
+    server.connection.add_callback_threadsafe(server.channel.stop_consuming)
+    if server.executor is not None:
+        server.executor.shutdown()
+
+
+def percentile(latencies, q) -> float:
+    """
+    Gets the nearest-rank percentile `q` (0-1)
+    of sorted latencies.
+    """
+    if not latencies:
+        return math.nan
+    return latencies[max(0, math.ceil(q * len(latencies)) - 1)]
+
+
+def run(  # pylint: disable=too-many-arguments,too-many-locals
+    transport,
+    rpc_prefix,
+    *,
+    concurrency,
+    size,
+    requests,
+    warmup,
+) -> dict:
+    """
+    Sends `requests` calls with a `size` byte payload from
+    `concurrency` client threads, each with its own client
+    and sending one call at a time, after `warmup` calls
+    per client which aren't measured.
+
+    Returns:
+        dict - the run's parameters, throughput, latency
+               percentiles (in ms) and error count.
+    """
+    payload = "x" * size
+    clients = [
+        EchoRPCClient(None, None, rpc_prefix, transport=transport)
+        for _ in range(concurrency)
+    ]
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(concurrency + 1)
+
+    def load(client, count):
+        try:
+            for _ in range(warmup):
+                client.call(payload)
+        except Exception:  # pylint: disable=broad-exception-caught
+            # don't leave the other threads waiting to start
+            barrier.abort()
+            raise
+
+        barrier.wait()
+        measured = []
+        failed = 0
+        for _ in range(count):
+            start = time.perf_counter()
+            try:
+                resp = json.loads(client.call(payload))
+                if resp["status"] != 200:
+                    failed += 1
+            except Exception:  # pylint: disable=broad-exception-caught
+                failed += 1
+            measured.append(time.perf_counter() - start)
+
+        with lock:
+            latencies.extend(measured)
+            errors.append(failed)
+
+    per_client, extra = divmod(requests, concurrency)
+    threads = [
+        threading.Thread(
+            target=load,
+            args=(client, per_client + (i < extra)),
+        )
+        for i, client in enumerate(clients)
+    ]
+    for thread in threads:
+        thread.start()
+
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    for client in clients:
+        client.connection.close()
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "size": size,
+        "requests": len(latencies),
+        "throughput": len(latencies) / elapsed,
+        "p50": percentile(latencies, 0.5) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "p999": percentile(latencies, 0.999) * 1000,
+        "errors": sum(errors),
+    }
+
+
+def _ints(value) -> list[int]:
+    """
+    Parses a comma separated list of ints.
+    """
+    return [int(item) for item in value.split(",")]
+
+
+def main():
+    """
+    Runs the benchmark for every combination of the
+    given concurrencies and sizes, printing a table
+    (or JSON lines) of the results.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--transport", choices=("memory", "rabbitmq"),
+                        default="memory")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--user", default="guest")
+    parser.add_argument("--password", default="guest")
+    parser.add_argument("--concurrency", type=_ints, default=[1, 8, 32],
+                        help="comma separated client thread counts")
+    parser.add_argument("--sizes", type=_ints, default=[64, 4096, 65536],
+                        help="comma separated payload sizes in bytes")
+    parser.add_argument("--requests", type=int, default=5000,
+                        help="measured calls per run")
+    parser.add_argument("--warmup", type=int, default=20,
+                        help="unmeasured calls per client before each run")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="server worker threads, 0 for none")
+    parser.add_argument("--json", action="store_true",
+                        help="print results as JSON lines")
+    args = parser.parse_args()
+
+    rpc_prefix = f"benchmark-rpc-{uuid.uuid4().hex[:8]}"
+    if args.transport == "memory":
+        transport = memory_transport(rpc_prefix)
+    else:
+        transport = rabbitmq_transport(
+            rpc_prefix,
+            args.user,
+            args.password,
+            args.host,
+        )
+
+    server = start_server(transport, rpc_prefix, args.workers)
+
+    if not args.json:
+        print(f"{'transport':>9} {'conc':>5} {'size':>7} {'requests':>8} "
+              f"{'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'p999 ms':>8} "
+              f"{'errors':>6}")
+
+    try:
+        for concurrency in args.concurrency:
+            for size in args.sizes:
+                result = run(
+                    transport,
+                    rpc_prefix,
+                    concurrency=concurrency,
+                    size=size,
+                    requests=args.requests,
+                    warmup=args.warmup,
+                )
+                result["transport"] = args.transport
+
+                if args.json:
+                    print(json.dumps(result))
+                else:
+                    print(f"{args.transport:>9} {concurrency:>5} {size:>7} "
+                          f"{result['requests']:>8} "
+                          f"{result['throughput']:>9.0f} "
+                          f"{result['p50']:>8.3f} {result['p99']:>8.3f} "
+                          f"{result['p999']:>8.3f} {result['errors']:>6}")
+    finally:
+        stop_server(server)
+
+
+if __name__ == "__main__":
+    main()
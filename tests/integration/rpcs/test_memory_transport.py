@@ -0,0 +1,584 @@
+"""
+Tests for running RPCs over the in-memory transport.
+"""
+
+import json
+import threading
+import time
+import uuid
+from unittest import TestCase, mock
+
+import pika
+
+from shared import rpcs
+from shared.rpcs.cache import MemoryCache
+from shared.rpcs.codec import MSGPACK
+from shared.rpcs.test_rpc import TestRPCClient
+from shared.rpcs.transport import MemoryTransport
+
+
+class EchoRPCServer(rpcs.RPCServer):
+    """
+    Responds to every call with its message,
+    after the call's delay.
+    """
+
+    decode_requests = True
+
+    def process(self, body):
+        time.sleep(body["data"].get("delay", 0))
+        return rpcs.response(
+            200,
+            {"message": body["data"]["message"]},
+            codec=None,
+        )
+
+
+class ConfirmRPCClient(TestRPCClient):
+    """
+    Test client whose unroutable calls fail.
+    """
+
+    confirm_calls = True
+
+
+class ConfirmEchoRPCServer(EchoRPCServer):
+    """
+    Echo server committing its responses along
+    with their calls' acknowledgements.
+    """
+
+    confirm_replies = True
+    reply_batch_size = 8
+
+
+class UniqueRPCServer(rpcs.RPCServer):
+    """
+    Responds to every call with a new unique ID,
+    so cached responses can be told apart.
+    """
+
+    decode_requests = True
+
+    def process(self, body):
+        return rpcs.response(200, {"id": uuid.uuid4().hex}, codec=None)
+
+
+class UnencodableRPCServer(rpcs.RPCServer):
+    """
+    Responds to every call with a response no
+    codec can encode.
+    """
+
+    decode_requests = True
+
+    def process(self, body):
+        return {"status": 200, "data": {"id": uuid.uuid4()}}
+
+
+class CountRPCServer(rpcs.RPCServer):
+    """
+    Streams the numbers up to the call's count, after
+    the call's delay before each.
+    """
+
+    decode_requests = True
+    stream_timeout = 0.2
+
+    def process(self, body):
+        return rpcs.response(400, {"reason": "Only streams."}, codec=None)
+
+    def process_stream(self, body):
+        for i in range(body["data"]["count"]):
+            time.sleep(body["data"].get("delay", 0))
+            yield rpcs.response(200, {"n": i}, codec=None)
+
+
+class MemoryTransportTest(TestCase):
+    """
+    Tests for running RPCs over the in-memory transport.
+    """
+
+    def setUp(self):
+        self.transport = MemoryTransport()
+        self.transport.declare_rpc("echo-rpc")
+
+        self.server = EchoRPCServer(
+            None,
+            None,
+            "echo-rpc",
+            workers=4,
+            transport=self.transport,
+        )
+        self.thread = threading.Thread(
+            target=self.server.channel.start_consuming,
+        )
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.connection.add_callback_threadsafe(
+            self.server.channel.stop_consuming,
+        )
+        self.thread.join()
+        self.server.executor.shutdown()
+
+    def test_call(self):
+        """
+        Tests a call is responded to through
+        the response queue.
+        """
+        client = TestRPCClient(None, None, "echo-rpc",
+                               transport=self.transport)
+
+        req = rpcs.request("", "1.0.0", "testing", {"message": "Ping!"})
+        resp = json.loads(client.call(req))
+
+        self.assertEqual(resp["status"], 200)
+        self.assertEqual(resp["data"]["message"], "Ping!")
+
+    def test_concurrent_direct_reply_calls(self):
+        """
+        Tests many concurrent calls through direct
+        reply-to each get their own response.
+        """
+
+        class DirectReplyRPCClient(TestRPCClient):
+            """
+            Test client using direct reply-to.
+            """
+
+            direct_reply = True
+
+        client = DirectReplyRPCClient(None, None, "echo-rpc",
+                                      transport=self.transport)
+
+        futures = [
+            client._call_nowait(  # pylint: disable=protected-access
+                rpcs.request("", "1.0.0", "testing", {"message": str(i)})
+            )
+            for i in range(100)
+        ]
+
+        for i, future in enumerate(futures):
+            resp = json.loads(client._wait(future))  # pylint: disable=protected-access
+            self.assertEqual(resp["data"]["message"], str(i))
+
+    def test_overlapping_calls(self):
+        """
+        Tests a call isn't held up by a slower call
+        in flight through the same client.
+        """
+        client = TestRPCClient(None, None, "echo-rpc",
+                               transport=self.transport)
+
+        slow = threading.Thread(
+            target=client.call,
+            args=(rpcs.request("", "1.0.0", "testing",
+                               {"message": "slow", "delay": 1}),),
+        )
+        slow.start()
+        time.sleep(0.1)
+
+        try:
+            start = time.monotonic()
+            resp = json.loads(client.call(
+                rpcs.request("", "1.0.0", "testing", {"message": "fast"})
+            ))
+            elapsed = time.monotonic() - start
+        finally:
+            slow.join()
+
+        self.assertEqual(resp["data"]["message"], "fast")
+        self.assertLess(elapsed, 0.5)
+
+    def test_timeout(self):
+        """
+        Tests a call to an RPC without a server
+        times out.
+        """
+        self.transport.declare_rpc("unserved-rpc")
+        client = TestRPCClient(None, None, "unserved-rpc",
+                               transport=self.transport)
+
+        req = rpcs.request("", "1.0.0", "testing", {"message": "Ping!"})
+        with self.assertRaises(TimeoutError):
+            client._call(req, timeout=0.1)  # pylint: disable=protected-access
+
+    def test_call_many(self):
+        """
+        Tests a batch is responded to index-aligned,
+        and a batch the server rejects raises with its
+        reason.
+        """
+        client = TestRPCClient(None, None, "echo-rpc",
+                               transport=self.transport)
+
+        resps = client.call_many([
+            rpcs.request("", "1.0.0", "testing", {"message": str(i)})
+            for i in range(3)
+        ])
+        self.assertEqual(
+            [json.loads(resp)["data"]["message"] for resp in resps],
+            ["0", "1", "2"],
+        )
+
+        with mock.patch("shared.rpcs.client.batch", return_value="{}"):
+            with self.assertRaisesRegex(ValueError, "400 Bad batch."):
+                client.call_many(["{}"])
+
+    def test_reopen(self):
+        """
+        Tests a client whose connection closed reopens
+        it for its next call, failing the call awaiting
+        a response on the old one.
+        """
+        client = TestRPCClient(None, None, "echo-rpc",
+                               transport=self.transport)
+        req = rpcs.request("", "1.0.0", "testing", {"message": "Ping!"})
+
+        lost = client._call_nowait(req)  # pylint: disable=protected-access
+        client.connection.close()
+
+        resp = json.loads(client.call(req))
+        self.assertEqual(resp["data"]["message"], "Ping!")
+        self.assertIsInstance(lost.exception(timeout=0), ConnectionError)
+
+    def test_confirm_calls(self):
+        """
+        Tests a client confirming calls is responded to,
+        and its calls the broker can't route fail rather
+        than time out.
+        """
+        client = ConfirmRPCClient(None, None, "echo-rpc",
+                                  transport=self.transport)
+
+        req = rpcs.request("", "1.0.0", "testing", {"message": "Ping!"})
+        resp = json.loads(client.call(req))
+        self.assertEqual(resp["data"]["message"], "Ping!")
+
+        # exchanges without a call queue bound
+        self.transport.broker.exchange_declare("unbound-rpc-call-exc")
+        self.transport.broker.exchange_declare("unbound-rpc-resp-exc")
+        client = ConfirmRPCClient(None, None, "unbound-rpc",
+                                  transport=self.transport)
+
+        start = time.monotonic()
+        with self.assertRaises(pika.exceptions.UnroutableError):
+            client._call(req, timeout=5)  # pylint: disable=protected-access
+        with self.assertRaises(pika.exceptions.UnroutableError):
+            next(client.call_stream(req, timeout=5))
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual((client.pending, client.streams), ({}, {}))
+
+    def test_confirm_replies(self):
+        """
+        Tests a server confirming replies responds to
+        every call once, acknowledging every call.
+        """
+        self.transport.declare_rpc("confirm-rpc")
+        server = ConfirmEchoRPCServer(
+            None,
+            None,
+            "confirm-rpc",
+            workers=4,
+            transport=self.transport,
+        )
+        thread = threading.Thread(target=server.channel.start_consuming)
+        thread.start()
+
+        try:
+            client = TestRPCClient(None, None, "confirm-rpc",
+                                   transport=self.transport)
+
+            futures = [
+                client._call_nowait(  # pylint: disable=protected-access
+                    rpcs.request("", "1.0.0", "testing", {"message": str(i)})
+                )
+                for i in range(50)
+            ]
+            for i, future in enumerate(futures):
+                resp = json.loads(client._wait(future))  # pylint: disable=protected-access
+                self.assertEqual(resp["data"]["message"], str(i))
+
+            # acknowledgements are committed after their responses
+            deadline = time.monotonic() + 1
+            while server.channel.unacked and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(server.channel.unacked, {})
+        finally:
+            server.connection.add_callback_threadsafe(
+                server.channel.stop_consuming,
+            )
+            thread.join()
+            server.executor.shutdown()
+
+    def test_process_worker_cache(self):
+        """
+        Tests a server using processes answers a
+        repeated call from its worker's cache.
+        """
+        self.transport.declare_rpc("unique-rpc")
+        server = UniqueRPCServer(
+            None,
+            None,
+            "unique-rpc",
+            workers=1,
+            use_processes=True,
+            cache=MemoryCache(),
+            transport=self.transport,
+        )
+        thread = threading.Thread(target=server.channel.start_consuming)
+        thread.start()
+
+        try:
+            client = TestRPCClient(None, None, "unique-rpc",
+                                   transport=self.transport)
+
+            req = rpcs.request("", "1.0.0", "testing", {"message": "Ping!"})
+            first = json.loads(client.call(req))
+            second = json.loads(client.call(req))
+        finally:
+            server.connection.add_callback_threadsafe(
+                server.channel.stop_consuming,
+            )
+            thread.join()
+            server.executor.shutdown()
+
+        self.assertEqual(first["status"], 200)
+        self.assertEqual(first, second)
+
+    def test_client_cache(self):
+        """
+        Tests a client decoding responses caches them
+        undecoded, and answers a repeated call from
+        its cache.
+        """
+
+        class CachingRPCClient(TestRPCClient):
+            """
+            Test client decoding responses.
+            """
+
+            decode_responses = True
+
+        self.transport.declare_rpc("unique-rpc")
+        server = UniqueRPCServer(
+            None,
+            None,
+            "unique-rpc",
+            transport=self.transport,
+        )
+        thread = threading.Thread(target=server.channel.start_consuming)
+        thread.start()
+
+        try:
+            cache = MemoryCache()
+            client = CachingRPCClient(None, None, "unique-rpc",
+                                      cache=cache,
+                                      transport=self.transport)
+
+            req = rpcs.request("", "1.0.0", "testing", {"message": "Ping!"})
+            first = client.call(req)
+            second = client.call(req)
+        finally:
+            server.connection.add_callback_threadsafe(
+                server.channel.stop_consuming,
+            )
+            thread.join()
+
+        self.assertEqual(first["status"], 200)
+        self.assertEqual(first, second)
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1})
+
+        (_, cached), = cache._entries.values()  # pylint: disable=protected-access
+        self.assertIsInstance(cached, (str, bytes))
+
+    def test_unencodable_response(self):
+        """
+        Tests a response failing to encode is answered
+        with a 500 in the call's codec, and the server
+        keeps consuming.
+        """
+        self.transport.declare_rpc("unencodable-rpc")
+        server = UnencodableRPCServer(
+            None,
+            None,
+            "unencodable-rpc",
+            transport=self.transport,
+        )
+        thread = threading.Thread(target=server.channel.start_consuming)
+        thread.start()
+
+        try:
+            client = TestRPCClient(None, None, "unencodable-rpc",
+                                   transport=self.transport)
+            msgpack_client = TestRPCClient(None, None, "unencodable-rpc",
+                                           codec=MSGPACK,
+                                           transport=self.transport)
+
+            req = rpcs.request("", "1.0.0", "testing", {"message": "Ping!"},
+                               codec=None)
+            first = json.loads(client.call(req))
+            second = MSGPACK.decode(msgpack_client.call(req))
+        finally:
+            server.connection.add_callback_threadsafe(
+                server.channel.stop_consuming,
+            )
+            thread.join()
+
+        self.assertEqual(first["status"], 500)
+        self.assertEqual(second["status"], 500)
+        self.assertEqual(second["data"]["reason"], "Internal Server Error")
+
+
+class MemoryStreamTest(TestCase):
+    """
+    Tests for streaming RPCs over the in-memory transport.
+    """
+
+    def setUp(self):
+        self.transport = MemoryTransport()
+        self.transport.declare_rpc("count-rpc")
+
+        self.server = CountRPCServer(
+            None,
+            None,
+            "count-rpc",
+            workers=2,
+            transport=self.transport,
+        )
+        self.thread = threading.Thread(
+            target=self.server.channel.start_consuming,
+        )
+        self.thread.start()
+
+        self.client = TestRPCClient(None, None, "count-rpc",
+                                    transport=self.transport)
+        self.client.decode_responses = True
+
+    def tearDown(self):
+        self.server.connection.add_callback_threadsafe(
+            self.server.channel.stop_consuming,
+        )
+        self.thread.join()
+        self.server.executor.shutdown()
+
+    def test_stream(self):
+        """
+        Tests every chunk of a stream longer than
+        its credit is received, in order.
+        """
+        req = rpcs.request("", "1.0.0", "testing", {"count": 20})
+        chunks = list(self.client.call_stream(req, credit=4))
+
+        self.assertEqual([chunk["data"]["n"] for chunk in chunks],
+                         list(range(20)))
+
+    def test_credit_while_producing(self):
+        """
+        Tests credit granted while the server is producing
+        chunks isn't lost, so the stream doesn't stall.
+        """
+        req = rpcs.request("", "1.0.0", "testing",
+                           {"count": 10, "delay": 0.02})
+        chunks = list(self.client.call_stream(req, credit=2, timeout=2))
+
+        self.assertEqual([chunk["data"]["n"] for chunk in chunks],
+                         list(range(10)))
+
+    def test_replicas(self):
+        """
+        Tests streams from an RPC with several replicas
+        are granted credit by the replica sending them.
+        """
+        replica = CountRPCServer(
+            None,
+            None,
+            "count-rpc",
+            workers=2,
+            transport=self.transport,
+        )
+        thread = threading.Thread(target=replica.channel.start_consuming)
+        thread.start()
+
+        try:
+            req = rpcs.request("", "1.0.0", "testing", {"count": 10})
+            for _ in range(4):
+                chunks = list(self.client.call_stream(req, credit=2,
+                                                      timeout=2))
+                self.assertEqual([chunk["data"]["n"] for chunk in chunks],
+                                 list(range(10)))
+        finally:
+            replica.connection.add_callback_threadsafe(
+                replica.channel.stop_consuming,
+            )
+            thread.join()
+            replica.executor.shutdown()
+
+    def test_idle_stream(self):
+        """
+        Tests a stream the client stops consuming is
+        ended with a 408 chunk once idle, rather than
+        leaving the client waiting.
+        """
+        req = rpcs.request("", "1.0.0", "testing", {"count": 20})
+        stream = self.client.call_stream(req, credit=2, timeout=5)
+
+        self.assertEqual(next(stream)["data"]["n"], 0)
+        time.sleep(0.5)
+        chunks = list(stream)
+
+        self.assertLess(len(chunks), 19)
+        self.assertEqual(chunks[-1]["status"], 408)
+
+    def test_unconsumed_stream(self):
+        """
+        Tests a stream dropped without being iterated
+        over is cancelled and no longer tracked.
+        """
+        req = rpcs.request("", "1.0.0", "testing", {"count": 20})
+        stream = self.client.call_stream(req, credit=2, timeout=5)
+        self.assertEqual(len(self.client.streams), 1)
+
+        del stream
+
+        self.assertEqual(self.client.streams, {})
+        time.sleep(0.1)
+        self.assertEqual(len(self.server.streams), 0)
+
+    def test_chunk_timeout(self):
+        """
+        Tests waiting longer than the timeout for
+        a chunk raises a TimeoutError.
+        """
+        req = rpcs.request("", "1.0.0", "testing", {"count": 2, "delay": 1})
+        stream = self.client.call_stream(req, timeout=0.2)
+
+        with self.assertRaises(TimeoutError):
+            next(stream)
+
+    def test_unsupported_stream(self):
+        """
+        Tests a streaming call to an RPC not serving
+        them is responded to with a 501 chunk.
+        """
+        self.transport.declare_rpc("echo-rpc")
+        server = EchoRPCServer(None, None, "echo-rpc",
+                               transport=self.transport)
+        thread = threading.Thread(target=server.channel.start_consuming)
+        thread.start()
+
+        try:
+            client = TestRPCClient(None, None, "echo-rpc",
+                                   transport=self.transport)
+            client.decode_responses = True
+
+            req = rpcs.request("", "1.0.0", "testing", {"message": "Ping!"})
+            chunks = list(client.call_stream(req, timeout=2))
+        finally:
+            server.connection.add_callback_threadsafe(
+                server.channel.stop_consuming,
+            )
+            thread.join()
+
+        self.assertEqual([chunk["status"] for chunk in chunks], [501])
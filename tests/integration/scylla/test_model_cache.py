@@ -0,0 +1,273 @@
+"""
+Integration tests for the Valkey cache of cqlengine models.
+"""
+
+import datetime
+import decimal
+import os
+import uuid
+
+from cassandra.cqlengine import columns
+from cassandra.cqlengine.models import Model
+import valkey
+
+import lib
+from lib import AutocleanTestCase
+import shared
+from shared.model_cache import ModelCache
+
+
+class CachedRows(Model):  # pylint: disable=too-few-public-methods
+    """
+    Table with a column of each type the cache converts.
+    """
+    __table_name__ = "cached_rows"
+
+    id = columns.UUID(primary_key=True, default=uuid.uuid4)
+    event = columns.TimeUUID()
+    created = columns.DateTime()
+    amount = columns.Decimal()
+    data = columns.Blob()
+    tags = columns.Set(columns.Text())
+    scores = columns.List(columns.Integer())
+    counts = columns.Map(columns.Text(), columns.Integer())
+    message = columns.Text()
+
+
+class DictValkey:
+    """
+    Valkey client storing keys in a dict, ignoring
+    their expiry, whose pipelines run immediately.
+    """
+
+    def __init__(self):
+        self.data = {}
+
+    def mget(self, keys) -> list:
+        """
+        Gets the value of each key, None if unset.
+        """
+        return [self.data.get(key) for key in keys]
+
+    def set(self, key, value, ex=None):  # pylint: disable=unused-argument
+        """
+        Sets a key, to bytes as Valkey returns them.
+        """
+        self.data[key] = value.encode() if isinstance(value, str) else value
+
+    def delete(self, *keys):
+        """
+        Unsets keys.
+        """
+        for key in keys:
+            self.data.pop(key, None)
+
+    def pipeline(self, transaction=True):  # pylint: disable=unused-argument
+        """
+        Gets this client, as its commands run immediately.
+        """
+        return self
+
+    def execute(self) -> list:
+        """
+        Ends a pipeline, whose commands already ran.
+        """
+        return []
+
+
+class UnavailableValkey:  # pylint: disable=too-few-public-methods
+    """
+    Valkey client whose every command fails.
+    """
+
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise valkey.exceptions.ConnectionError("Valkey is unavailable.")
+
+        return fail
+
+
+class ModelCacheTest(AutocleanTestCase):
+    """
+    Integration tests for `shared.model_cache.ModelCache`,
+    caching rows of a table in this worker's keyspace.
+    """
+
+    @classmethod
+    def setUpClass(cls):  # pylint: disable=invalid-name
+        """
+        Creates the keyspace and table cached, and
+        sets the cqlengine session.
+        """
+        keyspace = f"{lib.namespace()}_model_cache"
+        lib.scylla_session().execute(
+            f"""
+            CREATE KEYSPACE IF NOT EXISTS {keyspace}
+                WITH REPLICATION = {{
+                    'class': 'SimpleStrategy',
+                    'replication_factor': 1
+                }};
+            """
+        )
+        lib.scylla_session().execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {keyspace}.cached_rows (
+                id uuid PRIMARY KEY,
+                event timeuuid,
+                created timestamp,
+                amount decimal,
+                data blob,
+                tags set<text>,
+                scores list<int>,
+                counts map<text, int>,
+                message text
+            );
+            """
+        )
+
+        # sets the cqlengine session, as services do
+        cls.session = shared.setup_scylla(
+            keyspace,
+            user=os.environ["SCYLLADB_USERNAME"],
+            password=os.environ["SCYLLADB_PASSWORD"],
+        )
+        lib.track_writes(cls.session)
+
+    @classmethod
+    def tearDownClass(cls):  # pylint: disable=invalid-name
+        """
+        Shuts down the cqlengine session's cluster.
+        """
+        cls.session.cluster.shutdown()
+
+    def values(self) -> dict:
+        """
+        Gets the column values of a new row.
+        """
+        return {
+            "id": uuid.uuid4(),
+            "event": uuid.uuid1(),
+            # timestamps are stored to the millisecond
+            "created": datetime.datetime(2024, 1, 2, 3, 4, 5, 6000),
+            "amount": decimal.Decimal("12.34"),
+            "data": b"\x00\xffdata",
+            "tags": {"a", "b"},
+            "scores": [3, 1, 2],
+            "counts": {"a": 1, "b": 2},
+            "message": "Ping!",
+        }
+
+    def assertRow(self, row, values):  # pylint: disable=invalid-name
+        """
+        Asserts a row has the given column values.
+        """
+        self.assertIsNotNone(row)
+        self.assertEqual(
+            {name: getattr(row, name) for name in values},
+            values,
+        )
+
+    def test_create_and_get(self):
+        """
+        Tests a created row is cached, and read
+        back from the cache with every column's type.
+        """
+        cache = ModelCache(DictValkey(), CachedRows)
+        values = self.values()
+        cache.create(**values)
+
+        # only the cached row remains
+        CachedRows.objects(id=values["id"]).delete()
+
+        self.assertRow(cache.get(id=values["id"]), values)
+
+    def test_read_through(self):
+        """
+        Tests a row that isn't cached is read from
+        Scylla and cached.
+        """
+        client = DictValkey()
+        cache = ModelCache(client, CachedRows)
+        values = self.values()
+        CachedRows.create(**values)
+
+        self.assertRow(cache.get(id=values["id"]), values)
+        self.assertIn(cache.key(id=values["id"]), client.data)
+
+        # then read from the cache
+        CachedRows.objects(id=values["id"]).delete()
+        self.assertRow(cache.get(id=values["id"]), values)
+
+    def test_missing(self):
+        """
+        Tests rows that don't exist are cached as
+        missing, unless `negative_ttl` is 0.
+        """
+        client = DictValkey()
+        key = uuid.uuid4()
+
+        self.assertIsNone(ModelCache(client, CachedRows, negative_ttl=0).get(id=key))
+        self.assertEqual(client.data, {})
+
+        cache = ModelCache(client, CachedRows)
+        self.assertIsNone(cache.get(id=key))
+        self.assertEqual(client.data, {cache.key(id=key): b"null"})
+
+        # cached as missing, even once created
+        CachedRows.create(**{**self.values(), "id": key})
+        self.assertIsNone(cache.get(id=key))
+
+        cache.invalidate(id=key)
+        self.assertIsNotNone(cache.get(id=key))
+
+    def test_get_many(self):
+        """
+        Tests rows are got in the order of their keys,
+        whether cached, read from Scylla or missing.
+        """
+        cache = ModelCache(DictValkey(), CachedRows)
+        cached, stored = self.values(), self.values()
+        cache.create(**cached)
+        CachedRows.create(**stored)
+
+        rows = cache.get_many(
+            [{"id": stored["id"]}, {"id": uuid.uuid4()}, {"id": cached["id"]}]
+        )
+
+        self.assertEqual(len(rows), 3)
+        self.assertRow(rows[0], stored)
+        self.assertIsNone(rows[1])
+        self.assertRow(rows[2], cached)
+        self.assertEqual(cache.get_many([]), [])
+
+    def test_save_and_delete(self):
+        """
+        Tests saving a row updates its cached copy,
+        and deleting it removes it.
+        """
+        client = DictValkey()
+        cache = ModelCache(client, CachedRows)
+        values = self.values()
+        row = cache.create(**values)
+
+        row.message = "Pong!"
+        cache.save(row)
+        self.assertRow(cache.get(id=values["id"]), {**values, "message": "Pong!"})
+
+        cache.delete(row)
+        self.assertNotIn(cache.key(id=values["id"]), client.data)
+        self.assertIsNone(cache.get(id=values["id"]))
+
+    def test_unavailable(self):
+        """
+        Tests rows are read from and written to
+        Scylla while Valkey is unavailable.
+        """
+        cache = ModelCache(UnavailableValkey(), CachedRows)
+        values = self.values()
+
+        cache.create(**values)
+        self.assertRow(cache.get(id=values["id"]), values)
+
+        cache.delete(CachedRows.objects(id=values["id"]).first())
+        self.assertIsNone(cache.get(id=values["id"]))
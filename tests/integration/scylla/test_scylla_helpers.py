@@ -0,0 +1,151 @@
+"""
+Integration tests for the ScyllaDB data access helpers.
+"""
+
+import time
+
+import lib
+from lib import AutocleanTestCase
+from shared.scylla import WriteBehind, iter_rows, write_batched
+
+
+class ScyllaHelpersTest(AutocleanTestCase):
+    """
+    Integration tests for `shared.scylla`, writing to
+    a table in this worker's keyspace.
+    """
+
+    @classmethod
+    def setUpClass(cls):  # pylint: disable=invalid-name
+        """
+        Creates the keyspace and table written to.
+        """
+        session = lib.scylla_session()
+        cls.table = f"{lib.namespace()}_scylla_helpers.rows"
+
+        session.execute(
+            f"""
+            CREATE KEYSPACE IF NOT EXISTS {lib.namespace()}_scylla_helpers
+                WITH REPLICATION = {{
+                    'class': 'SimpleStrategy',
+                    'replication_factor': 1
+                }};
+            """
+        )
+        session.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {cls.table} (
+                part int,
+                id int,
+                value text,
+                PRIMARY KEY (part, id)
+            );
+            """
+        )
+
+        cls.insert = f"INSERT INTO {cls.table} (part, id, value) VALUES (?, ?, ?);"
+
+    def rows(self, part) -> list:
+        """
+        Gets the (id, value) of each row of a partition.
+        """
+        return [
+            (row.id, row.value)
+            for row in lib.scylla_session().execute(
+                f"SELECT id, value FROM {self.table} WHERE part = %s;",
+                (part,),
+            )
+        ]
+
+    def test_write_batched(self):
+        """
+        Tests rows are written in batches of at most
+        `max_batch_size` rows of the same partition.
+        """
+        session = lib.scylla_session()
+        rows = [(part, i, f"value {i}") for i in range(60) for part in range(3)]
+
+        results = write_batched(session, self.insert, rows, max_batch_size=50)
+
+        # 60 rows of each of 3 partitions, in batches of 50 and 10
+        self.assertEqual(len(results), 6)
+        self.assertTrue(all(success for success, _ in results))
+        for part in range(3):
+            self.assertEqual(
+                self.rows(part),
+                [(i, f"value {i}") for i in range(60)],
+            )
+
+    def test_iter_rows(self):
+        """
+        Tests every row is iterated over, in order,
+        across pages.
+        """
+        session = lib.scylla_session()
+        write_batched(
+            session,
+            self.insert,
+            [(0, i, f"value {i}") for i in range(25)],
+        )
+
+        rows = iter_rows(
+            session,
+            f"SELECT id, value FROM {self.table} WHERE part = ?;",
+            (0,),
+            fetch_size=10,
+        )
+
+        self.assertEqual(
+            [(row.id, row.value) for row in rows],
+            [(i, f"value {i}") for i in range(25)],
+        )
+
+    def test_write_behind(self):
+        """
+        Tests every queued row is written by `close`.
+        """
+        pings = WriteBehind(lib.scylla_session(), self.insert, batch_size=10)
+        for i in range(25):
+            pings.put((0, i, f"value {i}"))
+        pings.close(timeout=10)
+
+        self.assertEqual((pings.written, pings.failed), (25, 0))
+        self.assertEqual(self.rows(0), [(i, f"value {i}") for i in range(25)])
+
+    def test_write_behind_interval(self):
+        """
+        Tests a row is written `interval` seconds after
+        being queued, without filling a batch.
+        """
+        pings = WriteBehind(
+            lib.scylla_session(),
+            self.insert,
+            batch_size=100,
+            interval=0.1,
+        )
+        try:
+            pings.put((0, 0, "value"))
+
+            deadline = time.monotonic() + 10
+            while not pings.written and time.monotonic() < deadline:
+                time.sleep(0.05)
+
+            self.assertEqual(pings.written, 1)
+            self.assertEqual(self.rows(0), [(0, "value")])
+        finally:
+            pings.close(timeout=10)
+
+    def test_write_behind_failure(self):
+        """
+        Tests failed writes are counted without
+        stopping the writer, and that a closed
+        writer refuses rows.
+        """
+        pings = WriteBehind(lib.scylla_session(), self.insert)
+        pings.put((0, 0))  # missing a value
+        pings.put((0, 1, "value"))
+        pings.close(timeout=10)
+
+        self.assertEqual((pings.written, pings.failed), (1, 1))
+        self.assertEqual(self.rows(0), [(1, "value")])
+        self.assertRaises(RuntimeError, pings.put, (0, 2, "value"))
@@ -2,12 +2,14 @@
 Integration tests for the ping RPC.
 """
 
+import asyncio
 import os
 import json
 
 from lib import AutocleanTestCase
 from shared import rpcs
-from shared.rpcs.ping_rpc import PingRPCClient
+from shared.rpcs import codec, tracing
+from shared.rpcs.ping_rpc import AsyncPingRPCClient, PingRPCClient
 from shared.rpcs.test_rpc import TestRPCClient
 
 
@@ -122,3 +124,240 @@ class PingRPCTest(AutocleanTestCase):
         self.assertEqual(resp["status"], 400)
         self.assertRaises(KeyError, lambda x: x["data"]["message"], resp)
         self.assertEqual(resp["data"]["reason"], "Bad version.")
+
+    def test_concurrent_pings(self):
+        """
+        Tests many in-flight calls on a single
+        client each receive their own response.
+        """
+        client = TestRPCClient(
+            os.environ["RABBITMQ_USERNAME"],
+            os.environ["RABBITMQ_PASSWORD"],
+            "ping-rpc",
+        )
+
+        messages = ["Ping!" if i % 2 == 0 else str(i) for i in range(20)]
+        futures = [
+            client._call_nowait(  # pylint: disable=protected-access
+                rpcs.request("", "1.0.0", "testing", {"message": message})
+            )
+            for message in messages
+        ]
+
+        for message, future in zip(messages, futures):
+            resp = json.loads(
+                client._wait(future)  # pylint: disable=protected-access
+            )
+
+            if message == "Ping!":
+                self.assertEqual(resp["status"], 200)
+                self.assertEqual(resp["data"]["message"], "Pong!")
+            else:
+                self.assertEqual(resp["status"], 400)
+                self.assertEqual(resp["data"]["message"],
+                                 "That's not a ping!")
+
+        self.assertEqual(client.pending, {})
+
+    def test_async_pings(self):
+        """
+        Tests many concurrent calls through
+        the async client.
+        """
+        async def send_pings():
+            client = await AsyncPingRPCClient(
+                os.environ["RABBITMQ_USERNAME"],
+                os.environ["RABBITMQ_PASSWORD"],
+                "ping-rpc",
+            ).connect()
+
+            try:
+                return await asyncio.gather(
+                    *(client.call("testing") for _ in range(20))
+                )
+            finally:
+                await client.close()
+
+        for resp_raw in asyncio.run(send_pings()):
+            resp = json.loads(resp_raw)
+
+            self.assertEqual(resp["status"], 200)
+            self.assertEqual(resp["data"]["message"], "Pong!")
+
+    def test_batch_pings(self):
+        """
+        Tests a batch call gets an index-aligned
+        list of responses.
+        """
+        client = TestRPCClient(
+            os.environ["RABBITMQ_USERNAME"],
+            os.environ["RABBITMQ_PASSWORD"],
+            "ping-rpc",
+        )
+
+        reqs = [
+            rpcs.request("", "1.0.0", "testing", {"message": "Ping!"}),
+            "asdfjkl;",
+            rpcs.request("", "1.2.3", "testing", {"message": "Ping!"}),
+        ]
+
+        resps = [json.loads(resp) for resp in client.call_many(reqs)]
+
+        self.assertEqual(len(resps), 3)
+        self.assertEqual(resps[0]["status"], 200)
+        self.assertEqual(resps[0]["data"]["message"], "Pong!")
+        self.assertEqual(resps[1]["status"], 400)
+        self.assertEqual(resps[1]["data"]["reason"], "Bad JSON.")
+        self.assertEqual(resps[2]["status"], 400)
+        self.assertEqual(resps[2]["data"]["reason"], "Bad version.")
+
+    def test_msgpack_ping(self):
+        """
+        Tests a MessagePack request gets a
+        MessagePack response.
+        """
+        client = TestRPCClient(
+            os.environ["RABBITMQ_USERNAME"],
+            os.environ["RABBITMQ_PASSWORD"],
+            "ping-rpc",
+            codec=codec.MSGPACK,
+        )
+
+        req = rpcs.request(
+            "",
+            "1.0.0",
+            "testing",
+            {"message": "Ping!"},
+            codec=None,
+        )
+
+        resp = codec.MSGPACK.decode(client.call(req))
+
+        self.assertEqual(resp["status"], 200)
+        self.assertEqual(resp["data"]["message"], "Pong!")
+
+    def test_single_flight_pings(self):
+        """
+        Tests identical in-flight calls share
+        one call and its response.
+        """
+        client = TestRPCClient(
+            os.environ["RABBITMQ_USERNAME"],
+            os.environ["RABBITMQ_PASSWORD"],
+            "ping-rpc",
+        )
+        client.single_flight = True
+
+        req = rpcs.request("", "1.0.0", "testing", {"message": "Ping!"})
+        futures = [
+            client._call_nowait(req)  # pylint: disable=protected-access
+            for _ in range(10)
+        ]
+
+        self.assertEqual(len(client.pending), 1)
+
+        for future in futures:
+            resp = json.loads(
+                client._wait(future)  # pylint: disable=protected-access
+            )
+
+            self.assertEqual(resp["status"], 200)
+            self.assertEqual(resp["data"]["message"], "Pong!")
+
+        self.assertEqual(client.in_flight, {})
+
+    def test_timeout(self):
+        """
+        Tests a call that can't be answered in
+        time raises a TimeoutError.
+        """
+        client = TestRPCClient(
+            os.environ["RABBITMQ_USERNAME"],
+            os.environ["RABBITMQ_PASSWORD"],
+            "ping-rpc",
+        )
+
+        req = rpcs.request("", "1.0.0", "testing", {"message": "Ping!"})
+
+        with self.assertRaises(TimeoutError):
+            client._call(req, timeout=0.001)  # pylint: disable=protected-access
+
+        self.assertEqual(client.pending, {})
+        self.assertEqual(client.deadlines, {})
+
+    def test_direct_reply_ping(self):
+        """
+        Tests a ping responded to through
+        direct reply-to.
+        """
+        class DirectReplyRPCClient(TestRPCClient):
+            """
+            Test client using direct reply-to.
+            """
+
+            direct_reply = True
+
+        client = DirectReplyRPCClient(
+            os.environ["RABBITMQ_USERNAME"],
+            os.environ["RABBITMQ_PASSWORD"],
+            "ping-rpc",
+        )
+
+        req = rpcs.request("", "1.0.0", "testing", {"message": "Ping!"})
+        resp = json.loads(client.call(req))
+
+        self.assertEqual(client.callback_queue, rpcs.DIRECT_REPLY_TO)
+        self.assertEqual(resp["status"], 200)
+        self.assertEqual(resp["data"]["message"], "Pong!")
+
+    def test_stream_pings(self):
+        """
+        Tests a streaming call yields every
+        chunk, in order.
+        """
+        client = TestRPCClient(
+            os.environ["RABBITMQ_USERNAME"],
+            os.environ["RABBITMQ_PASSWORD"],
+            "ping-rpc",
+        )
+
+        req = rpcs.request("", "1.0.0", "testing", {"count": 50})
+        resps = [json.loads(resp) for resp in client.call_stream(req, credit=8)]
+
+        self.assertEqual(len(resps), 50)
+        for resp in resps:
+            self.assertEqual(resp["status"], 200)
+            self.assertEqual(resp["data"]["message"], "Pong!")
+
+        self.assertEqual(client.streams, {})
+
+    def test_traced_ping(self):
+        """
+        Tests a call records its call and publish
+        spans in the current trace.
+        """
+        client = TestRPCClient(
+            os.environ["RABBITMQ_USERNAME"],
+            os.environ["RABBITMQ_PASSWORD"],
+            "ping-rpc",
+        )
+
+        exporter = tracing.MemoryExporter()
+        tracing.set_exporter(exporter)
+        try:
+            req = rpcs.request("", "1.0.0", "testing", {"message": "Ping!"})
+            with tracing.span("test") as root:
+                resp = json.loads(client.call(req))
+        finally:
+            tracing.set_exporter(None)
+
+        self.assertEqual(resp["status"], 200)
+
+        spans = {span.name: span for span in exporter.spans}
+        call, publish = spans["ping-rpc call"], spans["publish"]
+
+        self.assertEqual(call.parent_id, root.context.span_id)
+        self.assertEqual(publish.parent_id, call.context.span_id)
+        for span in (call, publish):
+            self.assertEqual(span.context.trace_id, root.context.trace_id)
+            self.assertLessEqual(span.start, span.end_time)
@@ -1,10 +1,20 @@
 """
 Internal testing library that provides useful specific
 testing classes.
+
+Tests may be run in parallel by `main.py`, each worker
+process having its own namespace (see `namespace`) to
+name the keyspaces and queues its tests create.
+
+Writes through this process' Scylla sessions are tracked
+(see `track_writes`), so only the tables a test wrote to
+are cleaned after it.
 """
 
 import json
 import os
+import re
+import threading
 from unittest import TestCase
 
 import cassandra as cs
@@ -13,105 +23,416 @@ import cassandra.cluster as cc
 import pika
 import requests
 
+# seconds to wait for a table to be truncated
+TRUNCATE_TIMEOUT = 60
 
-class AutocleanTestCase(TestCase):
+# a keyspace or table name, optionally quoted
+_NAME = r'(?:"[^"]+"|\w+)'
+
+# the table written to by each statement of a query
+_WRITE = re.compile(
+    r"(?:^|;|\bBATCH)\s*"
+    r"(?:INSERT\s+INTO|UPDATE|DELETE\b[^;]*?\bFROM|TRUNCATE(?:\s+TABLE)?)"
+    rf"\s+({_NAME})(?:\s*\.\s*({_NAME}))?",
+    re.IGNORECASE,
+)
+
+_scylla_session = None  # pylint: disable=invalid-name
+_rabbitmq_connection = None  # pylint: disable=invalid-name
+_connections_lock = threading.Lock()
+
+
+class DirtyTables:
     """
-    Test case that automatically cleans:
-    - ScyllaDB
-    - RabbitMQ
-    - Valkey
+    Tracks the tables written to through sessions,
+    from the queries they send.
     """
 
-    def _tear_down_scylla(self):
+    def __init__(self):
+        # (keyspace, table), table None if unknown
+        self.tables: set[tuple] = set()
+        self._lock = threading.Lock()
+
+    def track(self, session: cc.Session):
         """
-        Truncates all non-system tables.
+        Tracks the writes of a session.
         """
-        cluster = cc.Cluster(
-            contact_points=["dev-db-client.scylla.svc"],
-            auth_provider=ca.PlainTextAuthProvider(
-                username=os.environ["SCYLLADB_USERNAME"],
-                password=os.environ["SCYLLADB_PASSWORD"],
-            ),
-            load_balancing_policy=cs.policies.TokenAwarePolicy(
-                cs.policies.DCAwareRoundRobinPolicy(),
-            ),
-            protocol_version=4,
-        )
-        session = cluster.connect()
-
-        # get all keyspace names
-        keyspaces_rows = session.execute(
-            "SELECT keyspace_name FROM system_schema.keyspaces;"
-        )
+        session.add_request_init_listener(self._on_request)
 
-        # filter out system keyspace
-        keyspaces = [
-            row.keyspace_name
-            for row in keyspaces_rows
-            if not row.keyspace_name.startswith("system")
-        ]
-
-        # truncate all tables in all keyspaces
-        for keyspace in keyspaces:
-            # get tables in keyspace
-            tables_query = session.prepare(
-                """
-                SELECT table_name
-                FROM system_schema.tables
-                WHERE keyspace_name = ?;
-                """
-            )
-            tables = session.execute(tables_query, [keyspace])
+    def pop(self) -> set[tuple]:
+        """
+        Gets and forgets the tables written to.
 
-            # truncate all tables in keyspace
-            for table in tables:
-                # print(f"Truncating {keyspace}.{str(table.table_name)}...")
-                session.execute(f"TRUNCATE {keyspace}.{table.table_name};")
+        Returns:
+            set[tuple[str, str | None]] -- the keyspace and table of
+                each table written to, with no table if any table of
+                the keyspace may have been.
+        """
+        with self._lock:
+            tables, self.tables = self.tables, set()
+        return tables
 
-    def _tear_down_rabbitmq(self):
+    def _on_request(self, response_future):
         """
-        Purges all non-exclusive queues.
+        Records the tables a request writes to.
         """
-        # tear down rabbitmq
-        # get queues from rabbitmq http api
-        user = os.environ["RABBITMQ_USERNAME"]
-        password = os.environ["RABBITMQ_PASSWORD"]
-
-        result = requests.get(
-            "http://rabbitmq-nodes.rabbitmq.svc:15672/api/queues",
-            auth=(user, password),
-            timeout=10,
+        written = _written_tables(
+            response_future.query,
+            response_future.session.keyspace,
         )
+        if written:
+            with self._lock:
+                self.tables.update(written)
 
-        # get non-exclusive queue names
-        queues = filter(
-            lambda x: not x["exclusive"],
-            list(json.loads(result.content.decode())),
-        )
 
-        queue_names = [q["name"] for q in queues]
+_dirty = DirtyTables()
+
+
+def worker() -> int:
+    """
+    Gets the index of this test worker process,
+    0 when running serially.
+    """
+    return int(os.environ.get("TEST_WORKER", "0"))
+
+
+def namespace() -> str:
+    """
+    Gets the namespace of this test worker, to prefix
+    the names of keyspaces (with "_") and queues
+    (with "-") its tests create.
+    """
+    return f"test_w{worker()}"
 
-        # create channel
-        credentials = pika.PlainCredentials(
-            user,
-            password,
-        )
 
-        connection = pika.BlockingConnection(
+def scylla_session() -> cc.Session:
+    """
+    Gets this process' ScyllaDB session,
+    connecting on first use.
+    """
+    global _scylla_session  # pylint: disable=global-statement
+
+    with _connections_lock:
+        if _scylla_session is None:
+            cluster = cc.Cluster(
+                contact_points=["dev-db-client.scylla.svc"],
+                auth_provider=ca.PlainTextAuthProvider(
+                    username=os.environ["SCYLLADB_USERNAME"],
+                    password=os.environ["SCYLLADB_PASSWORD"],
+                ),
+                load_balancing_policy=cs.policies.TokenAwarePolicy(
+                    cs.policies.DCAwareRoundRobinPolicy(),
+                ),
+                protocol_version=4,
+            )
+            _scylla_session = cluster.connect()
+            _dirty.track(_scylla_session)
+
+        return _scylla_session
+
+
+def track_writes(session: cc.Session):
+    """
+    Tracks the tables written to through a session
+    (e.g. one from `shared.setup_scylla`), so they
+    are cleaned after the test. This process' own
+    session is always tracked.
+    """
+    _dirty.track(session)
+
+
+def rabbitmq_channel():
+    """
+    Gets a channel on this process' RabbitMQ connection,
+    connecting on first use or if the connection closed.
+    """
+    global _rabbitmq_connection  # pylint: disable=global-statement
+
+    with _connections_lock:
+        if _rabbitmq_connection is not None and _rabbitmq_connection.is_open:
+            try:
+                return _rabbitmq_connection.channel()
+            except pika.exceptions.AMQPError:
+                # e.g. closed by the broker while idle
+                pass
+
+        _rabbitmq_connection = pika.BlockingConnection(
             pika.ConnectionParameters(
                 "rabbitmq.rabbitmq.svc.cluster.local",
-                credentials=credentials,
+                credentials=pika.PlainCredentials(
+                    os.environ["RABBITMQ_USERNAME"],
+                    os.environ["RABBITMQ_PASSWORD"],
+                ),
+            )
+        )
+
+        return _rabbitmq_connection.channel()
+
+
+def truncate_keyspaces(prefix=""):
+    """
+    Truncates every non-empty table of every non-system
+    keyspace starting with `prefix`, concurrently.
+
+    Args:
+        prefix: str -- prefix of the keyspaces to truncate
+                       (default all).
+    """
+    session = scylla_session()
+
+    # get all non-system tables
+    tables = [
+        (row.keyspace_name, row.table_name)
+        for row in session.execute(
+            "SELECT keyspace_name, table_name FROM system_schema.tables;"
+        )
+        if not row.keyspace_name.startswith("system")
+        and row.keyspace_name.startswith(prefix)
+    ]
+
+    # truncate flushes and snapshots the table,
+    # so is much slower than checking it's empty
+    checks = [
+        session.execute_async(f"SELECT * FROM {keyspace}.{table} LIMIT 1;")
+        for keyspace, table in tables
+    ]
+    truncates = [
+        session.execute_async(
+            f"TRUNCATE {keyspace}.{table};",
+            timeout=TRUNCATE_TIMEOUT,
+        )
+        for (keyspace, table), check in zip(tables, checks)
+        if check.result().current_rows
+    ]
+    for truncate in truncates:
+        truncate.result()
+
+
+def clean_tables(tables, delete_limit=0):
+    """
+    Removes every row of the given tables concurrently,
+    by deleting each partition of tables with at most
+    `delete_limit` partitions, or truncating them.
+
+    Args:
+        tables: Iterable[tuple[str, str | None]] -- the keyspace and
+            table of each table, with no table for every table of the
+            keyspace.
+        delete_limit: int -- the most partitions of a table to delete
+                             rather than truncating it (default 0).
+    """
+    session = scylla_session()
+    keyspaces = session.cluster.metadata.keyspaces
+
+    # expand keyspaces into their tables
+    expanded = set()
+    for keyspace, table in tables:
+        if table is not None:
+            expanded.add((keyspace, table))
+        elif keyspace in keyspaces:
+            expanded.update(
+                (keyspace, name) for name in keyspaces[keyspace].tables
+            )
+
+    cleans = []
+    for keyspace, table in sorted(expanded):
+        metadata = keyspaces.get(keyspace)
+        metadata = metadata.tables.get(table) if metadata else None
+        if metadata is None:
+            # dropped during the test
+            continue
+
+        if delete_limit:
+            deletes = _delete_partitions(session, metadata, delete_limit)
+            if deletes is not None:
+                cleans.extend(deletes)
+                continue
+
+        cleans.append(
+            session.execute_async(
+                f'TRUNCATE "{keyspace}"."{table}";',
+                timeout=TRUNCATE_TIMEOUT,
             )
         )
 
-        channel = connection.channel()
+    for clean in cleans:
+        clean.result()
+
+
+def _delete_partitions(session, table, limit) -> list | None:
+    """
+    Deletes each partition of a table concurrently,
+    returning the futures of the deletes, or None if
+    it has more than `limit` partitions.
+    """
+    keys = [f'"{column.name}"' for column in table.partition_key]
+    name = f'"{table.keyspace_name}"."{table.name}"'
+
+    partitions = list(session.execute(
+        f"SELECT DISTINCT {', '.join(keys)} FROM {name} LIMIT {limit + 1};"
+    ))
+    if len(partitions) > limit:
+        return None
+
+    delete = session.prepare(
+        f"DELETE FROM {name} WHERE "
+        + " AND ".join(f"{key} = ?" for key in keys)
+        + ";"
+    )
+    return [
+        session.execute_async(delete, tuple(partition))
+        for partition in partitions
+    ]
+
+
+def _written_tables(query, keyspace) -> set[tuple]:
+    """
+    Gets the tables written to by a query, as
+    (keyspace, table) with no table if unknown.
+    """
+    if query is None:
+        return set()
+
+    query_string = getattr(query, "query_string", None)
+    if query_string is None:
+        prepared = getattr(query, "prepared_statement", None)
+        query_string = getattr(prepared, "query_string", None)
+    if query_string is None and isinstance(query, str):
+        query_string = query
+
+    if query_string is None:
+        # e.g. a batch of prepared statements
+        keyspace = getattr(query, "keyspace", None) or keyspace
+        return {(keyspace, None)} if keyspace else set()
+
+    written = set()
+    for match in _WRITE.finditer(query_string):
+        first, second = (_unquote(name) for name in match.groups())
+        if second is not None:
+            written.add((first, second))
+        elif keyspace:
+            written.add((keyspace, first))
+
+    return written
+
+
+def _unquote(name) -> str | None:
+    """
+    Gets a CQL name as stored: quoted names are case
+    sensitive, unquoted names are lowercased.
+    """
+    if name is None:
+        return None
+    if name.startswith('"'):
+        return name[1:-1]
+    return name.lower()
+
+
+def purge_queues(prefix=""):
+    """
+    Purges every non-exclusive queue starting with `prefix`.
+
+    Args:
+        prefix: str -- prefix of the queues to purge (default all).
+    """
+    user = os.environ["RABBITMQ_USERNAME"]
+    password = os.environ["RABBITMQ_PASSWORD"]
+
+    # get queues from rabbitmq http api
+    result = requests.get(
+        "http://rabbitmq-nodes.rabbitmq.svc:15672/api/queues",
+        auth=(user, password),
+        timeout=10,
+    )
 
-        # purge queues
+    # get non-exclusive queue names, including those listed as
+    # empty, as the API's message counts are sampled so lag
+    queue_names = [
+        q["name"]
+        for q in json.loads(result.content.decode())
+        if not q["exclusive"]
+        and q["name"].startswith(prefix)
+    ]
+
+    channel = rabbitmq_channel()
+    try:
         for name in queue_names:
             try:
                 channel.queue_purge(name)
             except pika.exceptions.ChannelClosedByBroker:
-                pass
+                # e.g. deleted since listed, which closes the channel
+                channel = rabbitmq_channel()
+    finally:
+        if channel.is_open:
+            channel.close()
+
+
+def clean_all():
+    """
+    Truncates all non-system tables and purges all
+    non-exclusive queues, e.g. before and after a run.
+    """
+    truncate_keyspaces()
+    purge_queues()
+    _dirty.pop()
+
+
+class AutocleanTestCase(TestCase):
+    """
+    Test case that automatically cleans:
+    - ScyllaDB
+    - RabbitMQ
+    - Valkey
+
+    Tests run in parallel (by `main.py`) clean the tables they
+    wrote to (see `track_writes`) and the queues of their worker's
+    namespace after each test, so should name anything they
+    create with `keyspace` and `queue`. Test cases that need
+    the deployed services' own data cleaned after each test
+    should set `serial`, so they run alone after the parallel
+    tests and clean everything.
+
+    Setting `delete_limit` deletes the partitions of written
+    tables with at most that many partitions rather than
+    truncating them, as truncating flushes and snapshots
+    the table.
+    """
+
+    serial = False
+    delete_limit = 0
+
+    def keyspace(self, name) -> str:
+        """
+        Gets the name of a keyspace in this worker's namespace.
+        """
+        return f"{namespace()}_{name}"
+
+    def queue(self, name) -> str:
+        """
+        Gets the name of a queue in this worker's namespace.
+        """
+        return f"{namespace().replace('_', '-')}-{name}"
+
+    def _tear_down_scylla(self):
+        """
+        Cleans the tables written to by the test, or
+        truncates all non-empty non-system tables if serial.
+        """
+        written = _dirty.pop()
+        if self.serial:
+            truncate_keyspaces()
+        else:
+            clean_tables(written, self.delete_limit)
+
+        # forget the cleaning's own writes
+        _dirty.pop()
+
+    def _tear_down_rabbitmq(self):
+        """
+        Purges this worker's queues, or all non-exclusive
+        queues if serial.
+        """
+        purge_queues("" if self.serial else f"{namespace().replace('_', '-')}-")
 
     def tearDown(self):
         self._tear_down_scylla()
@@ -2,20 +2,168 @@
 Runs all integration and end-to-end tests.
 """
 
+import argparse
+import io
+import multiprocessing
+import os
+import sys
+import time
+import traceback
 import unittest
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import lib
+
+
+def _test_cases(suite):
+    """
+    Groups the tests of a suite by test case class,
+    in discovery order.
+
+    Returns:
+        dict[type, list[str]] -- the IDs of each class' tests.
+    """
+    cases = {}
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            for case, ids in _test_cases(test).items():
+                cases.setdefault(case, []).extend(ids)
+        else:
+            cases.setdefault(type(test), []).append(test.id())
+    return cases
+
+
+def _init_worker(counter):
+    """
+    Gives a worker process the next worker index,
+    which namespaces its tests' keyspaces and queues.
+    """
+    with counter.get_lock():
+        counter.value += 1
+        os.environ["TEST_WORKER"] = str(counter.value)
+
+
+def _run_tests(test_ids) -> tuple:
+    """
+    Runs tests by ID, returning their output and
+    the counts of tests run, failures, errors and
+    skips.
+    """
+    stream = io.StringIO()
+    result = unittest.TextTestRunner(stream=stream, verbosity=2).run(
+        unittest.TestLoader().loadTestsFromNames(test_ids)
+    )
+    return (
+        stream.getvalue(),
+        result.testsRun,
+        len(result.failures) + len(result.unexpectedSuccesses),
+        len(result.errors),
+        len(result.skipped),
+    )
+
+
+def _parse_args():
+    """
+    Parses the command line arguments.
+    """
+    parser = argparse.ArgumentParser(description="Runs all tests.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.environ.get("TEST_WORKERS", os.cpu_count() or 1)),
+        help="processes to run test cases in (default one per CPU)",
+    )
+    return parser.parse_args()
+
+
+def _run_parallel(parallel, workers, report):
+    """
+    Runs groups of test IDs in up to `workers`
+    processes, reporting each group's result.
+    """
+    # spawned, so workers don't inherit this process' connections
+    context = multiprocessing.get_context("spawn")
+    counter = context.Value("i", 0)
+    with ProcessPoolExecutor(
+        max_workers=max(1, min(workers, len(parallel))),
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(counter,),
+    ) as executor:
+        futures = [executor.submit(_run_tests, ids) for ids in parallel]
+        for future in as_completed(futures):
+            report(future.result())
+
+
+def _run_all(parallel, serial, workers, report):
+    """
+    Runs the parallel test cases, then the serial
+    test cases, cleaning everything before each.
+    """
+    lib.clean_all()
+
+    if parallel:
+        _run_parallel(parallel, workers, report)
+
+        # serial tests expect to start from a clean state
+        lib.clean_all()
+
+    for ids in serial:
+        report(_run_tests(ids))
 
 
 def main():
     """
     Discovers integration tests from ./integration/**/test*.py and
-    e2e tests from ./e2e/**/test*.py, then runs them. Exiting 1 if
-    any test fails.
+    e2e tests from ./e2e/**/test*.py, then runs them, each test case
+    in one of `--workers` processes, then every serial test case
+    alone. Prints FAILED and exits with status 1 if any test fails,
+    or the run itself fails (e.g. cleaning up, or a worker dying).
     """
+    args = _parse_args()
+
     loader = unittest.TestLoader()
     integration_suite = loader.discover("integration/")
 
-    runner = unittest.TextTestRunner()
-    _ = runner.run(integration_suite)
+    cases = _test_cases(integration_suite)
+    parallel = [
+        ids for case, ids in cases.items()
+        if not getattr(case, "serial", False)
+    ]
+    serial = [
+        ids for case, ids in cases.items()
+        if getattr(case, "serial", False)
+    ]
+
+    start = time.perf_counter()
+    totals = [0, 0, 0, 0]
+
+    def report(result):
+        output, *counts = result
+        print(output, end="", flush=True)
+        for i, count in enumerate(counts):
+            totals[i] += count
+
+    run_error = None
+    try:
+        _run_all(parallel, serial, args.workers, report)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        # e.g. a worker process died (BrokenProcessPool)
+        # or cleaning a service failed
+        traceback.print_exc()
+        run_error = e
+
+    run, failures, errors, skipped = totals
+    print("-" * 70)
+    print(f"Ran {run} tests in {time.perf_counter() - start:.3f}s\n")
+
+    if failures or errors or run_error is not None:
+        print(f"FAILED (failures={failures}, errors={errors}, "
+              f"skipped={skipped})"
+              + ("" if run_error is None else f" - run failed: {run_error!r}"))
+        sys.exit(1)
+
+    print(f"OK (skipped={skipped})" if skipped else "OK")
 
 
 if __name__ == "__main__":